@@ -13,6 +13,7 @@ import uuid
 
 from quest.backend.interface.persistence import init_task, snapshot, update_task,complete_task
 from quest.backend.interface.nl import NLImplementation
+from task_stream import TaskStreamEngine, task_info
 import threading
 from flask import Response
 
@@ -29,6 +30,7 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['DATA_FOLDER'] = DATA_FOLDER
 app.config['PROJECTS_FOLDER'] = PROJECTS_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['NL_EVENTS_IDLE_TTL'] = int(os.environ.get('NL_EVENTS_IDLE_TTL', 600))  # SSE 事件日志在最后一个订阅断开多久后释放
 
 # 创建必要的目录
 for folder in [UPLOAD_FOLDER, DATA_FOLDER, PROJECTS_FOLDER]:
@@ -332,56 +334,29 @@ def nl_start():
     except Exception as e:
         return jsonify({'error': f'启动任务失败: {str(e)}'}), 500
 
-@app.route('/api/nl-events/<task_id>', methods=['GET'])
-def nl_events(task_id):
-    """获取任务进度的SSE流"""
-    def stream():
-        last = None
-        heartbeat_at = time.time()
-        while True:
-            snap = snapshot(task_id)
-            if not snap:
-                yield 'event: error\ndata: {"message":"task not found"}\n\n'
-                break
-
-            # 检查是否有结果数据
-            result_data = snap.get('result')
-            if result_data:
-                # 发送完成事件
-                final_result = {
-                    "type": "result",
-                    "data": result_data,
-                    "task_info": {
-                        "task_id": snap["task_id"],
-                        "started_at": snap["started_at"],
-                        "updated_at": snap["updated_at"],
-                        "description": snap["description"]
-                    }
-                }
-                yield "event: result\n"
-                yield f"data: {json.dumps(final_result, ensure_ascii=False)}\n\n"
-                break
+def _nl_result_event(snap):
+    result_data = snap.get('result')
+    if not result_data:
+        return None
+    return 'result', {"type": "result", "data": result_data, "task_info": task_info(snap)}
 
-            # 发送进度更新
-            payload = json.dumps(snap, ensure_ascii=False)
-            if payload != last:
-                last = payload
-                yield "event: progress\n"
-                yield f"data: {payload}\n\n"
 
-            # 心跳，避免代理断开
-            if time.time() - heartbeat_at > 10:
-                yield ": keep-alive\n\n"
-                heartbeat_at = time.time()
+# 与 app1 共用 task_stream 引擎（此处没有事件总线，按 0.3s 轮询快照）
+# 没有任务注册表来回收事件日志，最后一个订阅断开 NL_EVENTS_IDLE_TTL 秒后释放
+nl_task_events = TaskStreamEngine(snapshot, _nl_result_event, idle_ttl=app.config['NL_EVENTS_IDLE_TTL'])
 
-            time.sleep(0.3)
 
-    return Response(stream(), headers={
+@app.route('/api/nl-events/<task_id>', methods=['GET'])
+def nl_events(task_id):
+    """获取任务进度的SSE流（支持 Last-Event-ID 断点续传，?delta=1 时发送增量）"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    deltas = request.args.get('delta', '').lower() in ('1', 'true', 'yes')
+    return Response(nl_task_events.stream(task_id, last_event_id, deltas), headers={
         "Content-Type": "text/event-stream",
         "Cache-Control": "no-cache",
         "Connection": "keep-alive",
         "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Cache-Control"
+        "Access-Control-Allow-Headers": "Cache-Control, Last-Event-ID"
     })
 
 @app.route('/api/nl-stream', methods=['GET'])
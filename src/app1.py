@@ -12,21 +12,39 @@ import time
 import json
 from datetime import datetime
 from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage
 import pandas as pd
 import time
 import uuid
 import logging
-from quest.backend.interface.persistence import init_task, snapshot, update_task,complete_task
+import itertools
+import tempfile
 from quest.backend.interface.nl import NLImplementation
-import threading
+# init_task/update_task/complete_task/snapshot 由下方任务注册表和事件总线接管 persistence 后绑定
+from quest.backend.interface import persistence as _persistence
+from task_events import TaskEventBus
+from task_stream import TaskStreamEngine, ChunkedPayload, task_info
+from task_pool import TaskPool, TaskQueueFull
+from task_registry import TaskRegistry, TaskCancelled, estimate_size
+from task_store import SqliteTaskStore
+from result_cache import ResultCache, cache_key, normalize_query
+from single_flight import SingleFlight
+from table_pages import table_options, table_page, select_page, TABLE_OPTION_KEYS
+from table_encoding import negotiate, mimetype, split_json, json_with_table, iter_ndjson, iter_split_chunks, arrow_stream
 from flask import Response
 
 try:
-    from archive_utils import extract_zip_archive, ArchiveExtractionError
+    from archive_utils import extract_zip_archive, extract_tar_archive, archive_format, ArchiveExtractionError
 except Exception as _zip_e:
     extract_zip_archive = None
+    extract_tar_archive = None
+    archive_format = lambda filename: None
     ArchiveExtractionError = Exception
     app.logger.warning(f"[WARN] archive_utils import failed: {_zip_e}")
+from document_catalog import DocumentCatalog, document_id, store_stream
+from chunked_upload import ChunkedUploadStore, ChunkedUploadError
+from pdf_text import PdfTextStore
+from text_decode import TextDecodeCache
 
 app = Flask(__name__)
 app.debug = True
@@ -41,12 +59,148 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['DATA_FOLDER'] = DATA_FOLDER
 app.config['PROJECTS_FOLDER'] = PROJECTS_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['CATALOG_PATH'] = os.path.join(DATA_FOLDER, 'documents.sqlite3')
+app.config['UPLOAD_STAGING_FOLDER'] = os.path.join(DATA_FOLDER, 'upload_staging')  # 分片上传暂存目录
+app.config['CHUNKED_UPLOAD_MAX_SIZE'] = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))  # 分片上传单个文件大小上限（暂存文件按此预分配）
+app.config['ARCHIVE_MAX_EXTRACTED_SIZE'] = int(os.environ.get('ARCHIVE_MAX_EXTRACTED_SIZE', 2 * 1024 * 1024 * 1024))  # 单个压缩包解压出的文件总大小上限，超出部分不解压并计入 skipped(size cap)
+app.config['PDF_TEXT_FOLDER'] = os.path.join(DATA_FOLDER, 'pdf_text')  # PDF 文本层缓存（按内容哈希）
+app.config['NL_TASK_WORKERS'] = int(os.environ.get('NL_TASK_WORKERS', 4))  # 同时运行的 NL 后台任务数
+app.config['NL_TASK_QUEUE_DEPTH'] = int(os.environ.get('NL_TASK_QUEUE_DEPTH', 32))  # 排队上限，超出返回 429
+app.config['NL_TASK_TTL_SECONDS'] = int(os.environ.get('NL_TASK_TTL_SECONDS', 3600))  # 已完成任务无人读取多久后清除
+app.config['NL_TASK_MAX_COUNT'] = int(os.environ.get('NL_TASK_MAX_COUNT', 500))  # 最多保留的任务数
+app.config['NL_TASK_MAX_BYTES'] = int(os.environ.get('NL_TASK_MAX_BYTES', 512 * 1024 * 1024))  # 任务结果占用内存上限
+app.config['NL_TASK_CANCEL_GRACE_SECONDS'] = int(os.environ.get('NL_TASK_CANCEL_GRACE_SECONDS', 30))  # 最后一个 SSE 订阅断开多久后自动取消任务，0 为不自动取消
+app.config['NL_TASK_STORE_PATH'] = os.environ.get('NL_TASK_STORE_PATH', os.path.join(DATA_FOLDER, 'nl_tasks.sqlite3'))  # 任务状态持久化（多 worker 共享、重启后可查），置空则只保存在内存
+app.config['NL_CACHE_MAX_ENTRIES'] = int(os.environ.get('NL_CACHE_MAX_ENTRIES', 256))  # parse/plan 结果缓存条数
+app.config['NL_CACHE_TTL_SECONDS'] = int(os.environ.get('NL_CACHE_TTL_SECONDS', 24 * 3600))  # parse/plan 结果缓存有效期
+app.config['OPERATOR_CACHE_MAX_ENTRIES'] = int(os.environ.get('OPERATOR_CACHE_MAX_ENTRIES', 512))  # 算子结果缓存条数
+app.config['OPERATOR_CACHE_MAX_BYTES'] = int(os.environ.get('OPERATOR_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # 算子结果缓存占用内存上限
+app.config['OPERATOR_CACHE_TTL_SECONDS'] = int(os.environ.get('OPERATOR_CACHE_TTL_SECONDS', 24 * 3600))  # 算子结果缓存有效期
+app.config['TABLE_PAGE_CACHE_MAX_BYTES'] = int(os.environ.get('TABLE_PAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # 分页读取用的结果表缓存上限
+app.config['EXECUTE_RESULT_CHUNK_ROWS'] = int(os.environ.get('EXECUTE_RESULT_CHUNK_ROWS', 2000))  # execute 结果分块推送时每块的行数
 
 # 创建必要的目录
 for folder in [UPLOAD_FOLDER, DATA_FOLDER, PROJECTS_FOLDER]:
     if not os.path.exists(folder):
         os.makedirs(folder)
 
+# PDF 文本层：后台进程池抽取一次，按内容哈希缓存
+# 进程池用 fork 启动，必须在创建任何线程、打开任何 SQLite 连接（任务注册表、文档目录）之前启动
+pdf_texts = PdfTextStore(app.config['PDF_TEXT_FOLDER'])
+pdf_texts.start()
+
+# 任务注册表：接管 quest persistence 的任务状态，唯一 task_id，按 TTL/LRU/内存上限清除已完成任务
+task_registry = TaskRegistry(app.config['NL_TASK_TTL_SECONDS'], app.config['NL_TASK_MAX_COUNT'],
+                             app.config['NL_TASK_MAX_BYTES'])
+task_registry.install(_persistence)
+snapshot = task_registry.snapshot
+# 任务事件总线：init_task/update_task/complete_task（包括 quest 内部的调用）发布变更，SSE 流阻塞等待而不是轮询
+task_bus = TaskEventBus()
+task_registry.on_evict(task_bus.forget)
+# 其他 worker 进程写入的任务变化（进度、完成、取消）也通知本进程的 SSE 流
+task_registry.on_change(task_bus.publish)
+if app.config['NL_TASK_STORE_PATH']:
+    _interrupted = task_registry.attach_store(SqliteTaskStore(app.config['NL_TASK_STORE_PATH']))
+    if _interrupted:
+        app.logger.info(f"[nl-tasks] marked {len(_interrupted)} tasks of stopped processes as interrupted")
+_task_writers = task_bus.install(_persistence)
+init_task, update_task, complete_task = (_task_writers[name] for name in ('init_task', 'update_task', 'complete_task'))
+SSE_HEARTBEAT_SECONDS = 10  # 空闲时的心跳间隔，同时兜底重新读取一次快照（见 task_stream）
+# NL 后台任务（parse/plan/execute）在有界线程池中排队执行；排队位置变化时通知对应的 SSE 流
+task_pool = TaskPool(app.config['NL_TASK_WORKERS'], app.config['NL_TASK_QUEUE_DEPTH'], on_change=task_bus.publish)
+
+
+def task_snapshot(task_id):
+    """snapshot() 加上排队信息：queue_position（1 为下一个执行，0 为执行中）"""
+    snap = snapshot(task_id)
+    if snap:
+        position = task_pool.position(task_id)
+        if position is not None:
+            snap = dict(snap, queue_position=position)
+    return snap
+
+
+# parse/plan 结果缓存：相同（规范化后的）查询、相同索引集合、相同模型直接复用结果，不再调用 LLM
+nl_result_cache = ResultCache(app.config['NL_CACHE_MAX_ENTRIES'], app.config['NL_CACHE_TTL_SECONDS'])
+
+
+def _nl_cache_key(stage, payload, model, index):
+    """返回 (缓存键, 依赖的索引)；索引重建或删除时按索引名清除相关缓存
+
+    索引集合取自请求体的 index（前端当前选中的索引），不依赖进程内状态，多个 worker 进程得到相同的键；
+    请求未带 index 时无法确定索引集合，返回 (None, None)，不读写缓存
+    """
+    if not isinstance(index, list):
+        return None, None
+    indexes = frozenset(str(name) for name in index)
+    return cache_key(stage, payload, indexes, model), indexes
+
+
+# 相同参数的并发请求合并：NL 任务共享同一个 task_id（和 SSE 流），算子接口共享同一次计算的响应
+nl_flights = SingleFlight()
+operator_flights = SingleFlight()
+
+
+def _task_running(task_id):
+    return task_registry.status(task_id) == 'running'
+
+
+def _complete_from_cache(task_id, first_desc, result):
+    """缓存命中：直接创建并完成任务，不进入任务池"""
+    init_task(task_id, first_desc)
+    update_task(task_id, "Loaded from cache")
+    complete_task(task_id, result)
+    return jsonify({"task_id": task_id, "queue_position": 0, "cached": True})
+
+
+def _cancellable(task_id, job):
+    """包装后台任务：开始前已取消则不执行；执行中被取消时 update_task 抛出 TaskCancelled，在此结束"""
+    def run():
+        try:
+            task_registry.raise_if_cancelled(task_id)
+            job()
+        except TaskCancelled:
+            app.logger.info(f"[nl-tasks] task {task_id} cancelled")
+    return run
+
+
+def _cancel_task(task_id, reason='Cancelled'):
+    """取消任务：从队列中移除（若尚未开始），并标记为已取消；返回 (取消前状态, 是否仍在排队)"""
+    was_queued = task_pool.cancel(task_id)
+    if was_queued:
+        # 排队中被取消的任务不会执行到 finally 里的 release，在此释放合并请求的登记
+        nl_flights.release_handle(task_id)
+        operator_flights.release_handle(task_id)
+    previous = task_registry.cancel(task_id, reason)
+    if previous == 'running':
+        task_bus.publish(task_id)
+    return previous, was_queued
+
+
+def _abandon_task(task_id):
+    """SSE 订阅者全部断开且超过宽限期仍未重连"""
+    _cancel_task(task_id, 'Cancelled: no client is watching this task')
+
+
+def _queue_full_response(error):
+    resp = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    resp.headers['Retry-After'] = str(error.retry_after)
+    return resp, 429
+
+# 文档目录（SQLite）：/api/documents 从这里读取，启动时与磁盘对账一次
+document_catalog = DocumentCatalog(app.config['CATALOG_PATH'], UPLOAD_FOLDER)
+app.logger.info(f"[catalog] reconcile at startup: {document_catalog.reconcile()}")
+# 分片上传暂存区；单个分片仍受 MAX_CONTENT_LENGTH 限制，整个文件受 CHUNKED_UPLOAD_MAX_SIZE 限制
+chunked_uploads = ChunkedUploadStore(app.config['UPLOAD_STAGING_FOLDER'], app.config['MAX_CONTENT_LENGTH'],
+                                     max_total_size=app.config['CHUNKED_UPLOAD_MAX_SIZE'])
+# 文本文档的编码检测与解码结果缓存，按 (path, mtime, size) 校验；上传、列表、content 接口共用
+text_cache = TextDecodeCache()
+# 启动时补齐目录中尚未抽取文本层的 PDF
+_catalog_rows, _ = document_catalog.list_documents()
+pdf_texts.prune({r['content_hash'] for r in _catalog_rows if r['content_hash']})
+app.logger.info(f"[pdf_text] queued at startup: {pdf_texts.submit_many((document_catalog.abs_path(r['rel_path']), r['content_hash']) for r in _catalog_rows if r['type'] == 'application/pdf')}")
+del _catalog_rows
+
 
 
 from quest.backend.interface.operation import OperationImplementation
@@ -147,14 +301,107 @@ fun1=NLImplementation()
 #     except Exception as e:
 #         return jsonify({'error': f'failed to fetch analysis results: {e}'}), 500
 
+def _no_progress(message):
+    pass
+
+
+def _operator_payload_size(payload):
+    return estimate_size(payload.get('table')) + 256
+
+
+# 算子结果缓存：输入函数对象、参数（表名、列、prompt、mode 等）和模型都相同时，直接返回上次生成的函数对象名和表格
+# 缓存的是 DataFrame 本身（不复制），只读使用
+operator_result_cache = ResultCache(app.config['OPERATOR_CACHE_MAX_ENTRIES'], app.config['OPERATOR_CACHE_TTL_SECONDS'],
+                                    max_bytes=app.config['OPERATOR_CACHE_MAX_BYTES'], size_of=_operator_payload_size,
+                                    copy_values=False)
+# 结果表缓存：/api/table-page 按函数对象名翻页时不必重新读取整张表
+table_results = ResultCache(64, app.config['OPERATOR_CACHE_TTL_SECONDS'],
+                            max_bytes=app.config['TABLE_PAGE_CACHE_MAX_BYTES'], size_of=estimate_size,
+                            copy_values=False)
+
+
+def _remember_table(fo_name, tablename, df):
+    table_results.put(cache_key('table', fo_name, tablename), df, tags={tablename})
+
+
+def _table_format():
+    """结果表编码：?format=json|fastjson|ndjson|arrow，或按 Accept 头协商；默认 json（原有格式）"""
+    return negotiate(request.args.get('format'), request.headers.get('Accept'))
+
+
+def _encoded_table_response(df, fields, fmt, status=200):
+    """按 fmt 编码结果表；fields 为 None 时响应体就是表格本身（/api/nl、/api/sql 的原有格式）
+
+    json: to_dict + jsonify（原有路径）；fastjson: pandas 向量化编码的同一 split 结构；
+    ndjson: 首行为表头信息（含 fields），之后每行一条记录，分块流式发送；
+    arrow: Arrow IPC 流，fields 放在 X-Table-Meta 头中
+    """
+    if fmt == 'ndjson':
+        return Response(iter_ndjson(df, fields), status=status, mimetype=mimetype(fmt))
+    if fmt == 'arrow':
+        resp = Response(arrow_stream(df), status=status, mimetype=mimetype(fmt))
+        if fields:
+            resp.headers['X-Table-Meta'] = json.dumps(fields, default=str)
+        return resp
+    if fmt == 'fastjson':
+        body = split_json(df) if fields is None else json_with_table(fields, split_json(df))
+        return Response(body, status=status, mimetype=mimetype(fmt))
+    table = df.to_dict(orient="split")
+    return jsonify(table if fields is None else dict(fields, table=table)), status
+
+
+def _render_operator_payload(payload, options):
+    """把算子结果中的 DataFrame 按分页/列选项转换为 split 格式，并附上 page 信息"""
+    df = payload.get('table')
+    if not isinstance(df, pd.DataFrame):
+        return payload
+    table, page = table_page(df, options)
+    return dict(payload, table=table, page=page)
+ALL_INDEXES_TAG = '*'  # retrieve 用到全部索引，任一索引变化都要失效
+
+
+def _invalidate_index_caches(index_name):
+    """索引重建或删除后，依赖它的 parse/plan 缓存和算子结果缓存失效"""
+    nl_result_cache.discard_tag(index_name)
+    operator_result_cache.discard_tag(index_name)
+    operator_result_cache.discard_tag(ALL_INDEXES_TAG)
+    table_results.discard_tag(index_name)
+
+
+def _memoized_operator(name, runner):
+    """给算子计算加上结果缓存；只缓存成功（200）的结果，命中时响应带 cached: true"""
+    def run(body, progress=_no_progress):
+        parameters = body.get('parameters') or {}
+        key = cache_key(f'operator-{name}', body.get('function_name'), parameters, body.get('model'))
+        hit, cached = operator_result_cache.lookup(key)
+        if hit:
+            progress("Loaded from operator cache")
+            return dict(cached, cached=True), 200
+        payload, status = runner(body, progress)
+        if status == 200:
+            _remember_table(payload['function_name'], parameters.get('tablename', ''), payload['table'])
+            tags = {parameters.get('tablename', '')}
+            if name == 'retrieve':
+                tags.add(ALL_INDEXES_TAG)
+            operator_result_cache.put(key, payload, tags=tags)
+        return payload, status
+    return run
+
+
 @app.route('/api/extract', methods=['POST'])
 def extract_data():
     #time.sleep(10)
     print(request.json)
-    type,model,parameters,foname=request.json.get('type'),request.json.get('model'),request.json.get('parameters'),request.json.get('function_name')
+    return _operator_response('extract', _run_extract)
+
+
+def _run_extract(body, progress=_no_progress):
+    """/api/extract 的实际计算；返回 (响应 JSON, 状态码)。progress(message) 汇报进度（异步模式下写入任务日志）"""
+    type,model,parameters,foname=body.get('type'),body.get('model'),body.get('parameters'),body.get('function_name')
     prompt,mode,tablename,columnname,columns_prompt=parameters.get('prompt',''),parameters.get('mode',''),parameters.get('tablename',''),parameters.get('column_name',''),parameters.get('columns_prompt','')
     print(type,prompt,model,parameters)
     fo_name = ""
+    progress("Extracting...")
     if(mode == 'basic'):
         # OperationImplementation.extract_text now returns a dict: {'foname': new_name, 'time': used_time, 'token': used_token}
         # Keep backward compatibility if it still returns a plain string.
@@ -171,7 +418,8 @@ def extract_data():
         fo_name=fun.extract_text_semantic(foname,tablename,columns_prompt)
     # Safety: ensure we actually have a string fo_name
     if not isinstance(fo_name, str) or not fo_name:
-        return jsonify({'error': 'extract_text returned invalid function name'}), 500
+        return {'error': 'extract_text returned invalid function name'}, 500
+    progress("Loading result table...")
     df = fun.show_table_with_source(fo_name, tablename)
 
     # ============= Inline figure extraction integration =============
@@ -213,7 +461,7 @@ def extract_data():
 
     resp = {
         'function_name': fo_name,
-        'table': df.to_dict(orient="split")
+        'table': df  # 由 _render_operator_payload 按分页选项转换
     }
     # Include optional metrics if present (only for basic mode currently)
     if mode == 'basic':
@@ -221,26 +469,36 @@ def extract_data():
             resp['time'] = time_used
         if 'token_used' in locals() and token_used is not None:
             resp['token'] = token_used
-    return jsonify(resp)
+    return resp, 200
 
 @app.route('/api/filter', methods=['POST'])
 def filter():
-    type,model,parameters,foname=request.json.get('type'),request.json.get('model'),request.json.get('parameters'),request.json.get('function_name')
+    return _operator_response('filter', _run_filter)
+
+
+def _run_filter(body, progress=_no_progress):
+    type,model,parameters,foname=body.get('type'),body.get('model'),body.get('parameters'),body.get('function_name')
     tablename,condition,columnname,columns_prompt,mode,prompt=parameters.get('tablename',''),parameters.get('condition',''),parameters.get('column_name',''),parameters.get('columns_prompt',''),parameters.get('mode',''),parameters.get('prompt','')
     print(type,prompt,model,parameters)
+    progress("Filtering...")
     if(mode == 'basic'):
         fo_name=fun.filter_text(foname,tablename,columnname,condition,columns_prompt)
     elif(mode == 'semantic'):
         fo_name=fun.filter_text_semantic(foname,tablename,prompt)
+    progress("Loading result table...")
     df=fun.show_table_with_source(fo_name,tablename)
-    return jsonify({
+    return {
         'function_name':fo_name,
-        'table':df.to_dict(orient="split")})
+        'table':df}, 200
 
 @app.route('/api/retrieve', methods=['POST'])
 def retrieve():
     print("get json\n", request.json)
-    type,model,parameters,foname=request.json.get('type'),request.json.get('model'),request.json.get('parameters'),request.json.get('function_name');
+    return _operator_response('retrieve', _run_retrieve)
+
+
+def _run_retrieve(body, progress=_no_progress):
+    type,model,parameters,foname=body.get('type'),body.get('model'),body.get('parameters'),body.get('function_name');
     tablename,columnname,prompt =parameters.get('tablename',''),parameters.get('column_name',''),parameters.get('columns_prompt','')
     
     print(type,prompt,model,parameters)
@@ -248,11 +506,13 @@ def retrieve():
     print("indexer: ", indexer_name_list)
 
     foname = fun.add_indexer_list(foname, indexer_name_list, indexer_name_list)
+    progress("Retrieving...")
     fo_name=fun.retrieve_text(foname,tablename,columnname,prompt)
+    progress("Loading result table...")
     df=fun.show_table_with_source(fo_name,tablename)
-    return jsonify({
+    return {
         'function_name':fo_name,
-        'table':df.to_dict(orient="split")})
+        'table':df}, 200
 
 
 @app.route('/api/figure-extract', methods=['POST'])
@@ -294,6 +554,7 @@ def figure_extract():
             # 尝试构建索引 (类型名称按 test_figure.py 示例: FigureDoc)
             try:
                 fun.build_indexer_with_name_set(doc_dir, indexer_name, 'FigureDoc', name_set=None)
+                _invalidate_index_caches(indexer_name)
             except Exception as build_e:
                 return jsonify({'error': f'failed to build index: {build_e}'}), 500
             existing = gidx.get_indexer(indexer_name)
@@ -332,22 +593,40 @@ def nl_parse():
         desc = request_data.get("desc", {})
         model = request_data.get("model", "gpt-4o")
         
-        # 生成任务ID
-        task_id = str(int(time.time() * 1000))
-        
         # 初始化任务描述
         first_desc = f"{query[:50]}..."
-        init_task(task_id, first_desc)
-        
-        def parse():
-            analysis_result=fun1.parse_nl(task_id, query)
-            print("analysis_result:", analysis_result)
-            complete_task(task_id, analysis_result)
-        
-        threading.Thread(target=parse ,daemon=True).start()
 
-        return jsonify({"task_id": task_id})
-        
+        key, indexes = _nl_cache_key('parse', normalize_query(query), model, request_data.get("index"))
+        hit, cached = nl_result_cache.lookup(key) if key else (False, None)
+        if hit:
+            return _complete_from_cache(task_registry.new_task_id(), first_desc, cached)
+
+        def start():
+            # 生成任务ID
+            task_id = task_registry.new_task_id()
+
+            def parse():
+                try:
+                    analysis_result=fun1.parse_nl(task_id, query)
+                    print("analysis_result:", analysis_result)
+                    complete_task(task_id, analysis_result)
+                    if analysis_result and key:
+                        nl_result_cache.put(key, analysis_result, tags=indexes)
+                finally:
+                    nl_flights.release(key, task_id)
+
+            # 进入有界任务池排队，被接纳后才创建任务；队列已满返回 429
+            task_pool.submit(task_id, _cancellable(task_id, parse), prepare=lambda: init_task(task_id, first_desc))
+            return task_id
+
+        # 同一查询已有任务在运行时直接加入它，共享 task_id 与事件流（索引集合未知时不合并）
+        task_id, shared = nl_flights.attach(key, start, alive=_task_running) if key else (start(), False)
+        position = task_pool.position(task_id) or 0
+
+        return jsonify({"task_id": task_id, "queue_position": position, "shared": shared})
+        
+    except TaskQueueFull as qf:
+        return _queue_full_response(qf)
     except Exception as e:
         return jsonify({'error': f'启动任务失败: {str(e)}'}), 500
     
@@ -359,13 +638,18 @@ def nl_plan():
         request_data = request.json or {}
         print("Plan request data:", request_data)
         analysis_result = request_data.get("analysis_result", {})
+        model = request_data.get("model", "gpt-4o")
         
         # 生成任务ID
-        task_id = str(int(time.time() * 1000))
+        task_id = task_registry.new_task_id()
         
         # 初始化任务描述
         first_desc = "Generating execution plans..."
-        init_task(task_id, first_desc)
+
+        key, indexes = _nl_cache_key('plan', analysis_result, model, request_data.get("index"))
+        hit, cached = nl_result_cache.lookup(key) if key else (False, None)
+        if hit:
+            return _complete_from_cache(task_id, first_desc, cached)
         
         def plan():
             try:
@@ -375,16 +659,20 @@ def nl_plan():
                 print("Generated plan_list:", plan_list)
                 update_task(task_id, "Plan generation completed")
                 complete_task(task_id, plan_list)
+                if plan_list and key:
+                    nl_result_cache.put(key, plan_list, tags=indexes)
             except Exception as e:
                 print(f"Plan generation error: {e}")
                 import traceback
                 traceback.print_exc()
                 update_task(task_id, f"Plan generation failed: {str(e)}")
 
-        threading.Thread(target=plan, daemon=True).start()
+        position = task_pool.submit(task_id, _cancellable(task_id, plan), prepare=lambda: init_task(task_id, first_desc))
 
-        return jsonify({"task_id": task_id})
+        return jsonify({"task_id": task_id, "queue_position": position})
         
+    except TaskQueueFull as qf:
+        return _queue_full_response(qf)
     except Exception as e:
         print(f"nl-plan-start error: {e}")
         import traceback
@@ -402,15 +690,14 @@ def nl_execute():
         selected_plan = request_data.get("selected_plan", {})
 
         # 生成任务ID
-        task_id = str(int(time.time() * 1000))
+        task_id = task_registry.new_task_id()
         
         # 初始化任务描述
         plan_name = selected_plan.get('name', 'Unknown Plan') if isinstance(selected_plan, dict) else str(selected_plan)
         first_desc = f"Executing plan: {plan_name}"
-        init_task(task_id, first_desc)
         
         def execute():
-
+            # 每次 update_task（包括 solve_plan 内部各步骤之间的进度汇报）都是取消检查点
             update_task(task_id, "Starting execution...")
             print("Calling solve_plan with:", analysis_result, selected_plan)
             foname = fun1.solve_plan(task_id,analysis_result, selected_plan)
@@ -425,10 +712,12 @@ def nl_execute():
 
 
         
-        threading.Thread(target=execute, daemon=True).start()
+        position = task_pool.submit(task_id, _cancellable(task_id, execute), prepare=lambda: init_task(task_id, first_desc))
 
-        return jsonify({"task_id": task_id})
+        return jsonify({"task_id": task_id, "queue_position": position})
         
+    except TaskQueueFull as qf:
+        return _queue_full_response(qf)
     except Exception as e:
         print(f"nl-execute-start error: {e}")
         import traceback
@@ -437,167 +726,255 @@ def nl_execute():
 
 
 
-@app.route('/api/nl-parse-events/<task_id>', methods=['GET'])
-def nl_parse_events(task_id):
-    """获取任务进度的SSE流"""
-    def stream():
-        last = None
-        heartbeat_at = time.time()
-        while True:
-            snap = snapshot(task_id)
-            if not snap:
-                yield 'event: error\ndata: {"message":"task not found"}\n\n'
-                break
-
-            # 检查是否有结果数据
-            result_data = snap.get('result')
-            if result_data:
-                # 发送完成事件
-                final_result = {
-                    "type": "result",
-                    "result": result_data,
-                    "task_info": {
-                        "task_id": snap["task_id"],
-                        "started_at": snap["started_at"],
-                        "updated_at": snap["updated_at"],
-                        "description": snap["description"]
-                    }
-                }
-                yield "event: complete\n"
-                yield f"data: {json.dumps(final_result, ensure_ascii=False)}\n\n"
-                break
-
-            # 发送进度更新
-            payload = json.dumps(snap, ensure_ascii=False)
-            if payload != last:
-                last = payload
-                yield "event: progress\n"
-                yield f"data: {payload}\n\n"
-
-            # 心跳，避免代理断开
-            if time.time() - heartbeat_at > 10:
-                yield ": keep-alive\n\n"
-                heartbeat_at = time.time()
-
-            time.sleep(0.3)
-
-    return Response(stream(), headers={
+def _result_event(snap):
+    """parse/plan 任务：result 非空即完成"""
+    result_data = snap.get('result')
+    if not result_data:
+        return None
+    return 'complete', {"type": "result", "result": result_data, "task_info": task_info(snap)}
+
+
+def _table_result_event(snap):
+    """execute 任务：result 为 DataFrame 时完成，按 split 格式发送
+
+    默认与原来一样经 to_dict + json 编码；?format=fastjson 的流改用 pandas 向量化编码（NaN 为 null、日期为 ISO 8601）
+
+    ?chunked=1 的流先收到 result-start（列名、总行数），再收到若干 result-chunk（offset、index、data），
+    最后的 complete 事件只带 chunked/total_rows/task_info；各块在发送时才编码，不再生成整张表的 JSON
+    """
+    result_data = snap.get('result', "")
+    if not isinstance(result_data, pd.DataFrame):
+        return None
+    info = task_info(snap)
+    chunk_rows = app.config['EXECUTE_RESULT_CHUNK_ROWS']
+
+    def frames():
+        yield 'result-start', json.dumps({"type": "result-start", "columns": result_data.columns.tolist(),
+                                          "total_rows": len(result_data), "chunk_rows": chunk_rows,
+                                          "task_info": info}, ensure_ascii=False, default=str)
+        for chunk in iter_split_chunks(result_data, chunk_rows):
+            yield 'result-chunk', chunk
+
+    closing = json.dumps({"type": "result", "chunked": True, "total_rows": len(result_data), "task_info": info},
+                         ensure_ascii=False, default=str)
+    def full(fmt):
+        if fmt == 'fastjson':
+            return json_with_table({"type": "result", "task_info": info}, split_json(result_data), key='result')
+        return json.dumps({"type": "result", "result": result_data.to_dict(orient="split"), "task_info": info},
+                          ensure_ascii=False, default=str)
+
+    return 'complete', ChunkedPayload(frames, closing, full)
+
+
+# 三个 SSE 接口共用同一个流引擎：事件按任务编号，保留最近的事件用于 Last-Event-ID 断点续传
+# 最后一个订阅者断开并超过宽限期后自动取消任务
+# 订阅数按进程统计；客户端重连到其他 worker 时，通过任务存储里的 watchers 心跳判断是否仍有人在看
+_stream_options = dict(bus=task_bus, heartbeat=SSE_HEARTBEAT_SECONDS,
+                       on_abandoned=_abandon_task if app.config['NL_TASK_CANCEL_GRACE_SECONDS'] > 0 else None,
+                       abandon_grace=app.config['NL_TASK_CANCEL_GRACE_SECONDS'],
+                       watching=task_registry.mark_watched, watched_elsewhere=task_registry.watched_elsewhere)
+parse_events = TaskStreamEngine(task_snapshot, _result_event, **_stream_options)
+plan_events = TaskStreamEngine(task_snapshot, _result_event, **_stream_options)
+execute_events = TaskStreamEngine(task_snapshot, _table_result_event, **_stream_options)
+
+
+def _operator_result_event(snap):
+    """算子异步任务：result 为 {'payload', 'status'}，status 为 200 时完成，否则失败"""
+    result_data = snap.get('result')
+    if not result_data:
+        return None
+    if result_data.get('status') == 200:
+        return 'complete', {"type": "result", "result": result_data['payload'], "task_info": task_info(snap)}
+    return 'failed', {"type": "error", "status": result_data.get('status'), "error": result_data['payload'].get('error'),
+                      "task_info": task_info(snap)}
+
+
+operator_events = TaskStreamEngine(task_snapshot, _operator_result_event, **_stream_options)
+for _engine in (parse_events, plan_events, execute_events, operator_events):
+    task_registry.on_evict(_engine.forget)
+
+
+def _async_requested(body):
+    """?async=1 或请求体 "async": true 时以后台任务方式运行算子"""
+    flag = request.args.get('async', '')
+    return flag.lower() in ('1', 'true', 'yes') or (isinstance(body, dict) and body.get('async') is True)
+
+
+def _operator_response(name, runner):
+    """算子接口的公共入口
+
+    默认同步：参数完全相同的并发请求只计算一次，共享同一个响应。
+    异步模式：立即返回 202 和 task_id，进度与最终表格通过 /api/operator-events/<task_id> 推送，
+    WSGI worker 不再被 LLM 调用占住。
+    """
+    body = request.json or {}
+    try:
+        # offset/limit/columns/exclude_columns/omit_source 只影响返回的表格，不参与计算和缓存键
+        options = table_options(request.args, body)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    runner = _memoized_operator(name, runner)
+    if _async_requested(body):
+        return _start_operator_task(name, runner, body, options)
+    body = {k: v for k, v in body.items() if k not in TABLE_OPTION_KEYS}
+    (payload, status), shared = operator_flights.do(cache_key(name, body), lambda: runner(body))
+    if shared:
+        app.logger.info(f'[{name}] coalesced with an identical in-flight request')
+    fmt = _table_format()
+    if fmt != 'json' and isinstance(payload.get('table'), pd.DataFrame):
+        page, meta = select_page(payload['table'], options)
+        fields = {k: v for k, v in payload.items() if k != 'table'}
+        return _encoded_table_response(page, dict(fields, page=meta), fmt, status)
+    return jsonify(_render_operator_payload(payload, options)), status
+
+
+def _start_operator_task(name, runner, body, options):
+    params = {k: v for k, v in body.items() if k != 'async' and k not in TABLE_OPTION_KEYS}
+    # 任务完成时按发起者的分页/列选项渲染结果，所以选项也是合并键的一部分；
+    # 选项不同的相同计算仍由算子结果缓存（_memoized_operator）复用
+    key = cache_key(name, params, options)
+    try:
+        def start():
+            task_id = task_registry.new_task_id()
+
+            def run():
+                try:
+                    try:
+                        payload, status = runner(params, progress=lambda message: update_task(task_id, message))
+                    except Exception as e:
+                        app.logger.exception(f'[{name}] async task {task_id} failed')
+                        payload, status = {'error': str(e)}, 500
+                    complete_task(task_id, {'payload': _render_operator_payload(payload, options), 'status': status})
+                finally:
+                    operator_flights.release(key, task_id)
+
+            task_pool.submit(task_id, _cancellable(task_id, run), prepare=lambda: init_task(task_id, f"{name} queued"))
+            return task_id
+
+        # 参数和表格选项都相同的异步任务正在运行时直接共享它的 task_id
+        task_id, shared = operator_flights.attach(key, start, alive=_task_running)
+        return jsonify({
+            'task_id': task_id,
+            'queue_position': task_pool.position(task_id) or 0,
+            'shared': shared,
+            'events': f'/api/operator-events/{task_id}',
+        }), 202
+    except TaskQueueFull as qf:
+        return _queue_full_response(qf)
+
+
+def _sse_response(engine, task_id):
+    """EventSource 重连时自动带 Last-Event-ID 头；也可用 ?last_event_id= 指定
+
+    ?delta=1 时进度以增量事件（delta）发送，期间穿插完整快照（progress）作为检查点
+    ?chunked=1 时大结果表按行分块发送，?format=fastjson 时整表用向量化编码（见 _table_result_event）
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    deltas = request.args.get('delta', '').lower() in ('1', 'true', 'yes')
+    chunked = request.args.get('chunked', '').lower() in ('1', 'true', 'yes')
+    fmt = negotiate(request.args.get('format'))
+    return Response(engine.stream(task_id, last_event_id, deltas, chunked, fmt), headers={
         "Content-Type": "text/event-stream",
         "Cache-Control": "no-cache",
         "Connection": "keep-alive",
         "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Cache-Control"
+        "Access-Control-Allow-Headers": "Cache-Control, Last-Event-ID"
     })
 
 
+@app.route('/api/nl-parse-events/<task_id>', methods=['GET'])
+def nl_parse_events(task_id):
+    """获取任务进度的SSE流"""
+    return _sse_response(parse_events, task_id)
+
+
 @app.route('/api/nl-plan-events/<task_id>', methods=['GET'])
 def nl_plan_events(task_id):
     """获取任务进度的SSE流"""
-    def stream():
-        last = None
-        heartbeat_at = time.time()
-        while True:
-            snap = snapshot(task_id)
-            if not snap:
-                yield 'event: error\ndata: {"message":"task not found"}\n\n'
-                break
-
-            # 检查是否有结果数据
-            result_data = snap.get('result')
-            if result_data:
-                # 发送完成事件
-                final_result = {
-                    "type": "result",
-                    "result": result_data,
-                    "task_info": {
-                        "task_id": snap["task_id"],
-                        "started_at": snap["started_at"],
-                        "updated_at": snap["updated_at"],
-                        "description": snap["description"]
-                    }
-                }
-                yield "event: complete\n"
-                yield f"data: {json.dumps(final_result, ensure_ascii=False)}\n\n"
-                break
-
-            # 发送进度更新
-            payload = json.dumps(snap, ensure_ascii=False)
-            if payload != last:
-                last = payload
-                yield "event: progress\n"
-                yield f"data: {payload}\n\n"
-
-            # 心跳，避免代理断开
-            if time.time() - heartbeat_at > 10:
-                yield ": keep-alive\n\n"
-                heartbeat_at = time.time()
-
-            time.sleep(0.3)
-
-    return Response(stream(), headers={
-        "Content-Type": "text/event-stream",
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Cache-Control"
-    })
+    return _sse_response(plan_events, task_id)
 
 
 @app.route('/api/nl-execute-events/<task_id>', methods=['GET'])
 def nl_excute_events(task_id):
     """获取任务进度的SSE流"""
-    def stream():
-        last = None
-        heartbeat_at = time.time()
-        while True:
-            snap = snapshot(task_id)
-            if not snap:
-                yield 'event: error\ndata: {"message":"task not found"}\n\n'
-                break
-
-            # 检查是否有结果数据
-            result_data = snap.get('result',"")
-            if isinstance(result_data,pd.DataFrame):
-                # 发送完成事件
-                table=result_data.to_dict(orient="split")
-                final_result = {
-                    "type": "result",
-                    "result": table,
-                    "task_info": {
-                        "task_id": snap["task_id"],
-                        "started_at": snap["started_at"],
-                        "updated_at": snap["updated_at"],
-                        "description": snap["description"]
-                    }
-                }
-                
-                yield "event: complete\n"
-                yield f"data: {json.dumps(final_result, ensure_ascii=False)}\n\n"
-                break
-            
-            # 发送进度更新
-            payload = json.dumps(snap, ensure_ascii=False)
-            if payload != last:
-                last = payload
-                yield "event: progress\n"
-                yield f"data: {payload}\n\n"
+    return _sse_response(execute_events, task_id)
 
-            # 心跳，避免代理断开
-            if time.time() - heartbeat_at > 10:
-                yield ": keep-alive\n\n"
-                heartbeat_at = time.time()
 
-            time.sleep(0.3)
 
-    return Response(stream(), headers={
-        "Content-Type": "text/event-stream",
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Cache-Control"
-    })
+@app.route('/api/table-page', methods=['GET'])
+def table_page_endpoint():
+    """按函数对象名分页读取已生成的结果表，不重新计算
+
+    参数：function_name（必填）、tablename、offset、limit、columns、exclude_columns、omit_source
+    """
+    try:
+        fo_name = request.args.get('function_name')
+        tablename = request.args.get('tablename', '')
+        if not fo_name:
+            return jsonify({'error': 'Missing function_name parameter'}), 400
+        options = table_options(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        key = cache_key('table', fo_name, tablename)
+        df = table_results.get(key)
+        if df is None:
+            df = fun.show_table_with_source(fo_name, tablename)
+            _remember_table(fo_name, tablename, df)
+        page, meta = select_page(df, options)
+        return _encoded_table_response(page, {'function_name': fo_name, 'page': meta}, _table_format())
+    except Exception as e:
+        return jsonify({'error': f'读取结果表失败: {str(e)}'}), 500
+
+
+@app.route('/api/operator-cache', methods=['GET'])
+def operator_cache_stats():
+    """算子结果缓存的命中率与占用"""
+    return jsonify(operator_result_cache.stats())
+
+
+@app.route('/api/operator-cache', methods=['DELETE'])
+def operator_cache_invalidate():
+    """手动失效算子结果缓存：?index=<索引名> 只清除依赖该索引的结果，不带参数则全部清除"""
+    index_name = request.args.get('index')
+    if index_name:
+        _invalidate_index_caches(index_name)
+    else:
+        operator_result_cache.clear()
+    return jsonify(operator_result_cache.stats())
 
 
+@app.route('/api/operator-events/<task_id>', methods=['GET'])
+def operator_task_events(task_id):
+    """算子异步任务的SSE流：progress/delta 为进度，complete 携带 {function_name, table}，failed 携带错误"""
+    return _sse_response(operator_events, task_id)
+
+
+@app.route('/api/nl-tasks/stats', methods=['GET'])
+def nl_task_stats():
+    """任务注册表与任务池的运行状态（任务数、占用内存、排队情况等）"""
+    try:
+        task_registry.evict_expired()
+        return jsonify({'registry': task_registry.stats(), 'pool': task_pool.stats(),
+                        'cache': nl_result_cache.stats(),
+                        'coalescing': {'nl': nl_flights.stats(), 'operators': operator_flights.stats()}})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/nl-tasks/<task_id>', methods=['DELETE'])
+def nl_cancel_task(task_id):
+    """取消 NL 任务：排队中的直接移除，执行中的在下一个进度汇报处停止；SSE 流收到 cancelled 事件"""
+    try:
+        previous, was_queued = _cancel_task(task_id)
+        if previous is None:
+            return jsonify({'error': 'Task not found'}), 404
+        if previous == 'completed':
+            return jsonify({'error': 'Task already completed', 'status': 'completed'}), 409
+        return jsonify({'task_id': task_id, 'status': 'cancelled', 'was_queued': was_queued})
+    except Exception as e:
+        return jsonify({'error': f'取消任务失败: {str(e)}'}), 500
+
 
 @app.route('/api/nl',methods=['POST'])
 def nl():
@@ -607,7 +984,7 @@ def nl():
     print(type(query), query)
     print(type(desc), desc)
     df=fun.solve_agent(table,query,desc)
-    return jsonify(df.to_dict(orient="split"))
+    return _encoded_table_response(df, None, _table_format())
 
 
 @app.route('/api/sql', methods=['POST'])
@@ -616,7 +993,7 @@ def sql_query():
     sql,description,model = request.json.get('query'), request.json.get('description'), request.json.get('model')
     print(sql,description,model)
     df=fun.solve_sql(sql,description,model)
-    return jsonify(df.to_dict(orient="split"))
+    return _encoded_table_response(df, None, _table_format())
 
 @app.route('/api/build-index', methods=['POST'])
 def build_index():
@@ -638,6 +1015,7 @@ def build_index():
         print("now build from:", document_names, " ", tabel_name, " ", base_path)
         full_paths = [os.path.join(base_path, name) for name in document_names]
         fun.build_indexer_with_name_set(base_path, tabel_name,'TextDoc',set(document_names))
+        _invalidate_index_caches(tabel_name)  # 索引内容变了，依赖它的缓存结果失效
 
         
         # 返回成功结果
@@ -670,6 +1048,7 @@ def delete_index():
         
         # 调用删除索引的方法
         fun.delete_table(table_name)
+        _invalidate_index_caches(table_name)
         
         return jsonify({
             'message': f'Index {table_name} deleted successfully',
@@ -1297,196 +1676,470 @@ def latest_sql():
 
 
 #文件相关
+def _wants_content():
+    """content=0/false/no 时接口只返回元数据，不带正文"""
+    flag = request.args.get('content', request.form.get('content', '1'))
+    return str(flag).strip().lower() not in ('0', 'false', 'no')
+
+
+def _resolve_document(filename, folder=None):
+    """通过 document_catalog 的 (folder, name) 索引定位文件，不再遍历上传目录
+
+    返回 (file_path, None)；找不到或未指定 folder 而存在同名文件时返回 (None, 错误响应)。
+    """
+    matches = [p for p in document_catalog.find(filename, folder or None) if os.path.isfile(p)]
+    if not matches:
+        return None, (jsonify({'error': 'File not found'}), 404)
+    if len(matches) > 1:
+        root_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not folder and root_path in matches:
+            return root_path, None
+        return None, (jsonify({
+            'error': f'Multiple files named {filename}, please specify folder',
+            'folders': [document_catalog.folder_of(document_catalog.rel_path(p)) for p in matches]
+        }), 409)
+    return matches[0], None
+
+
+ALLOWED_UPLOAD_EXTENSIONS = {'txt', 'pdf', 'zip'}
+
+
+def _upload_allowed(filename):
+    """txt/pdf/zip 以及 tar 系列压缩包（.tar/.tar.gz/.tgz/.tar.bz2/.tar.xz/.tar.zst）"""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    return ext in ALLOWED_UPLOAD_EXTENSIONS or archive_format(filename) is not None
+
+
+def _resolve_upload_dir(folder_name):
+    """根据 folder 参数创建/定位上传目录，返回 (upload_dir, folder_name)"""
+    folder_name = (folder_name or '').strip()
+    if folder_name:
+        folder_path = os.path.join(app.config['UPLOAD_FOLDER'], folder_name)
+        os.makedirs(folder_path, exist_ok=True)
+        document_catalog.ensure_folder(folder_name.replace(os.sep, '/').split('/')[0])
+        return folder_path, folder_name
+    return app.config['UPLOAD_FOLDER'], 'root'
+
+
+def _ingest_upload(file, upload_dir, folder_name, include_content=True, archive_path=None):
+    """保存一个上传对象（普通文件、ZIP 或 tar 系列压缩包），普通上传与分片上传 complete 共用
+
+    archive_path: 上传内容已在磁盘上（分片上传的暂存文件）时，ZIP 直接在原处打开，不再复制一份
+    返回 (文件元数据列表, 压缩包统计说明或 None, 重复文件说明或 None)
+    """
+    kind = archive_format(file.filename)
+
+    if kind:
+        if extract_zip_archive is None:
+            raise RuntimeError('Archive support not available on server')
+        # ZIP 需要随机访问（先落盘），tar 系列直接从上传流单遍解压
+        extract = extract_zip_archive if kind == 'zip' else extract_tar_archive
+        options = {'archive_path': archive_path} if kind == 'zip' and archive_path else {}
+        try:
+            extracted, stats = extract(
+                file, upload_dir, folder_name,
+                allowed_inner_ext=['txt', 'pdf'],
+                max_total_size=app.config['ARCHIVE_MAX_EXTRACTED_SIZE'],
+                catalog=document_catalog,
+                text_cache=text_cache,
+                **options,
+            )
+            for item in extracted:
+                if item['type'] == 'application/pdf':
+                    stored_path = document_catalog.find_by_hash(item['contentHash'])
+                    item['textStatus'] = pdf_texts.submit(document_catalog.abs_path(stored_path), item['contentHash'])
+                elif include_content and item['content'] is None:
+                    # 解压时只在内存中保留 KEEP_TEXT_BYTES 以内的文本，其余按需从磁盘读取
+                    stored_path = document_catalog.find_by_hash(item['contentHash'])
+                    item['content'] = text_cache.read_text(document_catalog.abs_path(stored_path))
+            note = f"{file.filename}: {stats['extracted']} extracted, {stats['skipped_extension']} skipped(ext), {stats['skipped_duplicate']} skipped(duplicate), {stats['skipped_other']} skipped(other)"
+            if stats['skipped_size']:
+                # 超出 ARCHIVE_MAX_EXTRACTED_SIZE，压缩包只解压了一部分
+                note += f", {stats['skipped_size']} skipped(size cap, truncated at {app.config['ARCHIVE_MAX_EXTRACTED_SIZE']} bytes)"
+            return extracted, note, None
+        except ArchiveExtractionError as ae:
+            return [], f"{file.filename}: failed ({ae})", None
+        except Exception as e:
+            return [], f"{file.filename}: failed ({e})", None
+
+    # Normal single file save path
+    filename = secure_filename(file.filename)
+    file_path = os.path.join(upload_dir, filename)
+    if os.path.exists(file_path):
+        # Skip duplicates silently (could add note later)
+        return [], None, None
+    # Hash while streaming to a temp file; identical bytes stored anywhere are not saved/indexed again
+    fd, part_path = tempfile.mkstemp(prefix='.' + filename, suffix='.part', dir=upload_dir)
+    os.close(fd)
+    try:
+        content_hash, file_size = store_stream(file.stream, part_path)
+    except Exception:
+        os.remove(part_path)
+        raise
+    duplicate_of = document_catalog.find_by_hash(content_hash)
+    if duplicate_of:
+        os.remove(part_path)
+        return [], None, f"{filename} (same content as {duplicate_of})"
+    os.replace(part_path, file_path)
+    document_catalog.record_file(file_path, content_hash)
+
+    upload_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+    content = None
+    text_status = None
+    if filename.lower().endswith('.pdf'):
+        # 文本层在后台进程池中抽取，完成后 /api/documents 与 content 接口直接读缓存
+        text_status = pdf_texts.submit(file_path, content_hash)
+    elif include_content and filename.lower().endswith('.txt'):
+        content = text_cache.read_text(file_path)
+
+    stored = {
+        'id': document_id(content_hash),
+        'contentHash': content_hash,
+        'name': filename,
+        'filename': filename,
+        'folder': folder_name,
+        'content': content,
+        'size': file_size,
+        'type': 'application/pdf' if filename.lower().endswith('.pdf') else 'text/plain',
+        'uploadTime': upload_time
+    }
+    if text_status:
+        stored['textStatus'] = text_status
+    return [stored], None, None
+
+
+def _upload_response(uploaded_files, archive_stats_summary, duplicate_notes, include_content):
+    if not include_content:
+        for item in uploaded_files:
+            item.pop('content', None)
+
+    base_msg = f"Successfully processed {len(uploaded_files)} files"
+    if archive_stats_summary:
+        base_msg += " (" + "; ".join(archive_stats_summary) + ")"
+    if duplicate_notes:
+        base_msg += f"; skipped {len(duplicate_notes)} duplicate file(s): " + ", ".join(duplicate_notes)
+    return jsonify({'files': uploaded_files, 'message': base_msg})
+
+
 @app.route('/api/upload', methods=['POST'])
 def upload_files():
     """Upload endpoint with added ZIP archive extraction support.
 
-    - Accepts .txt, .pdf, and .zip (ZIP contents filtered to txt/pdf).
+    - Accepts .txt, .pdf, .zip and tar archives (.tar/.tar.gz/.tgz/.tar.bz2/.tar.xz/.tar.zst);
+      archive contents are filtered to txt/pdf.
     - Archive logic is delegated to archive_utils to keep this function slim.
     - Returns metadata for each stored (or extracted) file just like before.
+    - Files larger than MAX_CONTENT_LENGTH go through /api/uploads/* (chunked) instead.
     """
     try:
         uploaded_files = []
         archive_stats_summary = []  # Collect per-archive stats for message
+        duplicate_notes = []  # Single files whose bytes are already stored
         files = request.files.getlist('files')
-        folder_name = request.form.get('folder', '').strip()
+        include_content = _wants_content()
 
         # Create / resolve upload directory
-        if folder_name:
-            folder_path = os.path.join(app.config['UPLOAD_FOLDER'], folder_name)
-            os.makedirs(folder_path, exist_ok=True)
-            upload_dir = folder_path
-        else:
-            upload_dir = app.config['UPLOAD_FOLDER']
-            folder_name = 'root'
-
-        allowed_extensions = {'txt', 'pdf', 'zip'}
+        upload_dir, folder_name = _resolve_upload_dir(request.form.get('folder', ''))
 
         for file in files:
             if not file or file.filename == '':
                 continue
 
-            ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
-            if ext not in allowed_extensions:
+            if not _upload_allowed(file.filename):
                 return jsonify({'error': f'File {file.filename} format not supported'}), 400
 
-            if ext == 'zip':
-                if extract_zip_archive is None:
-                    return jsonify({'error': 'ZIP support not available on server'}), 500
-                try:
-                    extracted, stats = extract_zip_archive(
-                        file, upload_dir, folder_name,
-                        allowed_inner_ext=['txt', 'pdf']
-                    )
-                    uploaded_files.extend(extracted)
-                    archive_stats_summary.append(
-                        f"{file.filename}: {stats['extracted']} extracted, {stats['skipped_extension']} skipped(ext), {stats['skipped_other']} skipped(other)"
-                    )
-                except ArchiveExtractionError as ae:
-                    archive_stats_summary.append(f"{file.filename}: failed ({ae})")
-                except Exception as e:
-                    archive_stats_summary.append(f"{file.filename}: failed ({e})")
-                continue  # Skip normal single-file path
-
-            # Normal single file save path
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(upload_dir, filename)
-            if os.path.exists(file_path):
-                # Skip duplicates silently (could add note later)
-                continue
-            file.save(file_path)
+            stored, archive_note, duplicate_note = _ingest_upload(file, upload_dir, folder_name, include_content)
+            uploaded_files.extend(stored)
+            if archive_note:
+                archive_stats_summary.append(archive_note)
+            if duplicate_note:
+                duplicate_notes.append(duplicate_note)
 
-            file_size = os.path.getsize(file_path)
-            upload_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            content = None
-            if filename.lower().endswith('.txt'):
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                except UnicodeDecodeError:
-                    try:
-                        with open(file_path, 'r', encoding='gbk') as f:
-                            content = f.read()
-                    except Exception:
-                        content = None
-
-            uploaded_files.append({
-                'id': abs(hash(f"{folder_name}_{filename}")),
-                'name': filename,
-                'filename': filename,
-                'folder': folder_name,
-                'content': content,
-                'size': file_size,
-                'type': 'application/pdf' if filename.lower().endswith('.pdf') else 'text/plain',
-                'uploadTime': upload_time
-            })
+        return _upload_response(uploaded_files, archive_stats_summary, duplicate_notes, include_content)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# 分片上传：init -> PUT 分片 -> complete，可断点续传，单个请求不受 MAX_CONTENT_LENGTH 限制
+@app.route('/api/uploads/init', methods=['POST'])
+def chunked_upload_init():
+    """创建分片上传会话
+
+    请求 JSON:
+      filename: 原始文件名 (必填，扩展名 txt/pdf/zip 或 tar 系列压缩包)
+      size: 文件总字节数 (必填，不得超过 CHUNKED_UPLOAD_MAX_SIZE)
+      folder: 目标文件夹 (可选)
+      chunk_size: 分片大小 (可选，默认 8MB，不得超过 MAX_CONTENT_LENGTH)
+      sha256: 整个文件的 SHA-256 (可选，complete 时校验)
+    返回: { upload_id, chunk_size, total_chunks, received: [] }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = (data.get('filename') or '').strip()
+        if not filename or not _upload_allowed(filename):
+            return jsonify({'error': f'File {filename} format not supported'}), 400
+        if not isinstance(data.get('size'), int):
+            return jsonify({'error': 'missing or invalid size'}), 400
+        manifest = chunked_uploads.init(
+            filename, (data.get('folder') or '').strip(), data['size'],
+            chunk_size=data.get('chunk_size'), sha256=data.get('sha256'),
+        )
+        return jsonify(dict(manifest, received=[]))
+    except ChunkedUploadError as ce:
+        return jsonify({'error': str(ce)}), ce.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """查询分片上传进度（断线重连后据此只补传 missing 中的分片）"""
+    try:
+        return jsonify(chunked_uploads.status(upload_id))
+    except ChunkedUploadError as ce:
+        return jsonify({'error': str(ce)}), ce.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        base_msg = f"Successfully processed {len(uploaded_files)} files"
-        if archive_stats_summary:
-            base_msg += " (" + "; ".join(archive_stats_summary) + ")"
-        return jsonify({'files': uploaded_files, 'message': base_msg})
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def chunked_upload_chunk(upload_id, index):
+    """上传第 index 个分片，请求体为原始字节；可带 X-Chunk-SHA256 头做校验，重复上传同一分片是幂等的"""
+    try:
+        result = chunked_uploads.write_chunk(
+            upload_id, index, request.stream, checksum=request.headers.get('X-Chunk-SHA256')
+        )
+        return jsonify(result)
+    except ChunkedUploadError as ce:
+        return jsonify({'error': str(ce)}), ce.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def chunked_upload_complete(upload_id):
+    """所有分片到齐后，交给与 /api/upload 相同的单文件 / ZIP 解压流程处理，返回格式与 /api/upload 一致"""
+    try:
+        include_content = _wants_content()
+        # complete() 先占住该上传，并发的第二个 complete 直接返回 409，不会重复入库
+        staging_path, manifest = chunked_uploads.complete(upload_id)
+        try:
+            upload_dir, folder_name = _resolve_upload_dir(manifest['folder'])
+            with open(staging_path, 'rb') as stream:
+                staged = FileStorage(stream=stream, filename=manifest['filename'])
+                stored, archive_note, duplicate_note = _ingest_upload(
+                    staged, upload_dir, folder_name, include_content, archive_path=staging_path
+                )
+        except Exception:
+            chunked_uploads.release(upload_id)
+            raise
+        chunked_uploads.discard(upload_id)
+        return _upload_response(
+            stored, [archive_note] if archive_note else [], [duplicate_note] if duplicate_note else [], include_content
+        )
+    except ChunkedUploadError as ce:
+        return jsonify({'error': str(ce)}), ce.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def chunked_upload_abort(upload_id):
+    """放弃分片上传并清理暂存文件"""
+    try:
+        chunked_uploads.discard(upload_id)
+        return jsonify({'message': f'Upload {upload_id} aborted'})
+    except ChunkedUploadError as ce:
+        return jsonify({'error': str(ce)}), ce.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/documents', methods=['GET'])
 def get_documents():
+    """获取文档列表（读取 document_catalog，不再每次遍历上传目录）
+
+    Query 参数（均可选）:
+      folder: 只返回该文件夹下的文档
+      content: 传 0/false 时只返回元数据，正文改由 /api/documents/<filename>/content 按需读取
+    PDF 文档附带 textStatus（ready/pending/failed/unavailable/missing），正文为缓存的文本层
+      offset / limit: 分页；带上任一参数时返回 {documents, total, offset, limit}，
+                      否则仍返回完整数组（兼容旧前端）
+    """
     try:
+        folder = request.args.get('folder') or None
+        offset = request.args.get('offset', default=0, type=int)
+        limit = request.args.get('limit', type=int)
+        include_content = _wants_content()
+        rows, total = document_catalog.list_documents(folder, offset, limit)
+
         documents = []
-        
-        def scan_folder(folder_path, folder_name='root'):
-            """递归扫描文件夹"""
-            if not os.path.exists(folder_path):
-                return
-                
-            for item in os.listdir(folder_path):
-                item_path = os.path.join(folder_path, item)
-                
-                if os.path.isfile(item_path):
-                    # 处理文件
-                    file_size = os.path.getsize(item_path)
-                    upload_time = time.strftime('%Y-%m-%d %H:%M:%S', 
-                                               time.localtime(os.path.getctime(item_path)))
-                    
-                    # 读取文件内容（仅文本文件）
+        for row in rows:
+            doc = document_catalog.to_document(row)
+            is_pdf = row['type'] == 'application/pdf'
+            if is_pdf:
+                doc['textStatus'] = pdf_texts.state(row['content_hash'])
+            if not include_content:
+                documents.append(doc)
+                continue
+            # 读取文件内容（仅文本文件，且只读当前页）
+            content = None
+            if is_pdf:
+                content = pdf_texts.read_text(row['content_hash'])
+            elif row['name'].lower().endswith('.txt'):
+                # 解码结果按 (path, mtime, size) 缓存，未变化的文件不会重复读取/解码
+                try:
+                    content = text_cache.read_text(document_catalog.abs_path(row['rel_path']))
+                except OSError:
                     content = None
-                    if item.lower().endswith('.txt'):
-                        try:
-                            with open(item_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                        except UnicodeDecodeError:
-                            try:
-                                with open(item_path, 'r', encoding='gbk') as f:
-                                    content = f.read()
-                            except:
-                                content = None
-                    
-                    documents.append({
-                        'id': abs(hash(f"{folder_name}_{item}")),  # 使用文件夹+文件名hash作为ID
-                        'name': item,
-                        'filename': item,
-                        'folder': folder_name,  # 添加文件夹信息
-                        'content': content,
-                        'size': file_size,
-                        'type': 'application/pdf' if item.lower().endswith('.pdf') else 'text/plain',
-                        'uploadTime': upload_time
-                    })
-                elif os.path.isdir(item_path):
-                    # 递归处理子文件夹
-                    scan_folder(item_path, item)
-        
-        # 扫描上传文件夹
-        if os.path.exists(app.config['UPLOAD_FOLDER']):
-            scan_folder(app.config['UPLOAD_FOLDER'])
-        
+            doc['content'] = content
+            documents.append(doc)
+
+        if 'offset' in request.args or 'limit' in request.args:
+            return jsonify({
+                'documents': documents,
+                'total': total,
+                'offset': offset,
+                'limit': limit
+            })
         return jsonify(documents)
-    
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/documents/<filename>', methods=['DELETE'])
 def delete_document(filename):
     try:
-        # 首先在根目录查找
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        # 如果根目录没找到，递归查找所有子文件夹
-        if not os.path.exists(file_path):
-            found_path = None
-            for root, dirs, files in os.walk(app.config['UPLOAD_FOLDER']):
-                if filename in files:
-                    found_path = os.path.join(root, filename)
-                    break
-            
-            if found_path:
-                file_path = found_path
-            else:
-                return jsonify({'error': 'File not found'}), 404
-        
+        # 通过 (folder, name) 索引定位，folder 可选（同名文件时必填）
+        file_path, error = _resolve_document(filename, request.args.get('folder'))
+        if error:
+            return error
+
         os.remove(file_path)
+        document_catalog.remove_file(file_path)
+        text_cache.discard(file_path)
         return jsonify({'message': f'File {filename} deleted successfully'})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/documents/<filename>/content', methods=['GET'])
+def get_document_content(filename):
+    """按需读取单个文本文档的内容，支持字节/行范围和 ETag 缓存校验
+
+    Query 参数（均可选）:
+      folder: 文档所在文件夹，用于区分同名文件
+      byte_start / byte_end: 字节范围 [byte_start, byte_end)，跨越多字节字符的边界会被丢弃
+      line_start / line_count: 行范围（line_start 从 0 开始）
+    不带范围参数时返回全文。ETag 由 mtime + size 生成，If-None-Match 命中时返回 304。
+    PDF 返回后台抽取并缓存的文本层（范围参数作用于文本层）；尚未抽取完时返回 202 和进度。
+    """
+    try:
+        file_path, error = _resolve_document(filename, request.args.get('folder'))
+        if error:
+            return error
+
+        st = os.stat(file_path)
+        etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+        if request.if_none_match.contains_weak(etag):
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag, weak=True)
+            return not_modified
+
+        text_path, source = file_path, 'file'
+        if filename.lower().endswith('.pdf'):
+            row = document_catalog.get(file_path)
+            content_hash = row['content_hash'] if row else None
+            state = pdf_texts.submit(file_path, content_hash)
+            if state == 'pending':
+                return jsonify({'status': 'pending', 'progress': pdf_texts.progress()}), 202
+            if state == 'unavailable':
+                return jsonify({'error': 'PDF text extraction is not available on server'}), 415
+            if state != 'ready':
+                return jsonify({'error': f'PDF text extraction failed: {pdf_texts.error(content_hash)}'}), 422
+            text_path, source = pdf_texts.text_path(content_hash), 'pdf_text'
+            encoding = 'utf-8'
+        elif not filename.lower().endswith('.txt'):
+            return jsonify({'error': 'Content is only available for text and PDF documents'}), 415
+        else:
+            encoding = text_cache.detect_encoding(file_path)
+            if encoding is None:
+                return jsonify({'error': 'Unable to decode file content'}), 422
+        text_size = os.path.getsize(text_path)
+
+        byte_start = request.args.get('byte_start', type=int)
+        byte_end = request.args.get('byte_end', type=int)
+        line_start = request.args.get('line_start', type=int)
+        line_count = request.args.get('line_count', type=int)
+
+        result = {
+            'name': filename,
+            'folder': document_catalog.folder_of(document_catalog.rel_path(file_path)),
+            'encoding': encoding,
+            'size': text_size,
+            'source': source,
+        }
+        if byte_start is not None or byte_end is not None:
+            start = min(max(byte_start or 0, 0), text_size)
+            end = text_size if byte_end is None else min(max(byte_end, start), text_size)
+            with open(text_path, 'rb') as f:
+                f.seek(start)
+                raw = f.read(end - start)
+            result.update({
+                'content': raw.decode(encoding, errors='ignore'),
+                'byte_start': start,
+                'byte_end': end,
+                'has_more': end < text_size,
+            })
+        elif line_start is not None or line_count is not None:
+            start = max(line_start or 0, 0)
+            stop = None if line_count is None else start + max(line_count, 0)
+            with open(text_path, 'r', encoding=encoding) as f:
+                lines = list(itertools.islice(f, start, stop))
+                has_more = stop is not None and f.readline() != ''
+            result.update({
+                'content': ''.join(lines),
+                'line_start': start,
+                'line_count': len(lines),
+                'has_more': has_more,
+            })
+        elif source == 'file':
+            result.update({'content': text_cache.read_text(text_path), 'has_more': False})
+        else:
+            with open(text_path, 'r', encoding=encoding) as f:
+                result.update({'content': f.read(), 'has_more': False})
+
+        resp = jsonify(result)
+        resp.set_etag(etag, weak=True)
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/pdf-text/progress', methods=['GET'])
+def get_pdf_text_progress():
+    """PDF 文本层后台抽取进度；带 contentHash 参数时同时返回该文档的状态"""
+    try:
+        progress = pdf_texts.progress()
+        content_hash = request.args.get('contentHash')
+        if content_hash:
+            progress['document'] = {
+                'contentHash': content_hash,
+                'textStatus': pdf_texts.state(content_hash),
+                'error': pdf_texts.error(content_hash),
+            }
+        return jsonify(progress)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/documents/<filename>/download', methods=['GET'])
 def download_document(filename):
     try:
-        # 首先在根目录查找
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        # 如果根目录没找到，递归查找所有子文件夹
-        if not os.path.exists(file_path):
-            found_path = None
-            for root, dirs, files in os.walk(app.config['UPLOAD_FOLDER']):
-                if filename in files:
-                    found_path = os.path.join(root, filename)
-                    break
-            
-            if found_path:
-                file_path = found_path
-            else:
-                return jsonify({'error': 'File not found'}), 404
-        
+        # 通过 (folder, name) 索引定位，folder 可选（同名文件时必填）
+        file_path, error = _resolve_document(filename, request.args.get('folder'))
+        if error:
+            return error
+
         return send_file(file_path, as_attachment=True, download_name=filename)
     
     except Exception as e:
@@ -1494,25 +2147,18 @@ def download_document(filename):
 
 @app.route('/api/folders', methods=['GET'])
 def get_folders():
-    """获取文件夹结构"""
+    """获取文件夹结构（读取 document_catalog 中增量维护的文件夹统计，不再遍历目录）"""
     try:
         folders = []
-        
-        if os.path.exists(app.config['UPLOAD_FOLDER']):
-            for item in os.listdir(app.config['UPLOAD_FOLDER']):
-                item_path = os.path.join(app.config['UPLOAD_FOLDER'], item)
-                if os.path.isdir(item_path):
-                    # 统计文件夹中的文件数量
-                    file_count = 0
-                    for root, dirs, files in os.walk(item_path):
-                        file_count += len([f for f in files if f.lower().endswith(('.txt', '.pdf'))])
-                    
-                    folders.append({
-                        'name': item,
-                        'path': item,
-                        'fileCount': file_count
-                    })
-        
+        for stat in document_catalog.folder_stats():
+            folders.append({
+                'name': stat['folder'],
+                'path': stat['folder'],
+                'fileCount': stat['file_count'],
+                'totalBytes': stat['total_bytes'],
+                'lastModified': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat['last_modified']))
+            })
+
         return jsonify(folders)
     
     except Exception as e:
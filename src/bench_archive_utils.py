@@ -0,0 +1,115 @@
+"""Benchmark for archive_utils.extract_zip_archive.
+
+Compares the legacy in-memory path (``streaming=False``), the sequential
+streaming spool-to-disk path (``workers=1``) and the pooled streaming path
+(``workers=EXTRACT_WORKERS``) on two synthetic archive shapes:
+
+  * many-small : thousands of short .txt members (player bio style)
+  * few-huge   : a handful of large .txt/.pdf members
+
+For every run it reports wall time, throughput (MB/s of extracted data) and
+the peak Python heap allocation as seen by tracemalloc, which is where the
+legacy path's ``read()`` / ``BytesIO`` copies show up.
+
+Usage:
+    python bench_archive_utils.py [--small-count 5000] [--huge-mb 20] [--repeat 3]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+from werkzeug.datastructures import FileStorage
+
+from archive_utils import EXTRACT_WORKERS, extract_zip_archive
+
+# label -> extract_zip_archive keyword arguments
+MODES = {
+    'legacy': {'streaming': False},
+    'stream': {'streaming': True, 'workers': 1},
+    'pooled': {'streaming': True, 'workers': EXTRACT_WORKERS},
+}
+
+
+def _build_many_small(path: str, count: int) -> int:
+    body = ("Drew Gordon is an American professional basketball player. " * 40).encode('utf-8')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(count):
+            zf.writestr(f"players/player_{i:05d}.txt", body + str(i).encode())
+    return count * len(body)
+
+
+def _build_few_huge(path: str, size_mb: int) -> int:
+    total = 0
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        for name in ("corpus/part_a.pdf", "corpus/part_b.pdf", "corpus/part_c.pdf"):
+            # distinct bytes per member, otherwise content dedup extracts only one
+            chunk = os.urandom(1024 * 1024)
+            with zf.open(name, 'w', force_zip64=True) as dst:
+                for _ in range(size_mb):
+                    dst.write(chunk)
+            total += size_mb * len(chunk)
+    return total
+
+
+def _run_once(archive_path: str, mode_kwargs: dict):
+    out_dir = tempfile.mkdtemp(prefix='bench_extract_')
+    try:
+        with open(archive_path, 'rb') as fh:
+            storage = FileStorage(stream=fh, filename=os.path.basename(archive_path))
+            tracemalloc.start()
+            started = time.perf_counter()
+            files, stats = extract_zip_archive(
+                storage, out_dir, 'bench',
+                max_total_size=1 << 40, max_members=1 << 20,
+                **mode_kwargs,
+            )
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        extracted_bytes = sum(f['size'] for f in files)
+        return elapsed, peak, extracted_bytes, stats['extracted']
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--small-count', type=int, default=5000)
+    parser.add_argument('--huge-mb', type=int, default=20, help='size of each of the 3 huge members')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"pool workers: {EXTRACT_WORKERS}")
+    work_dir = tempfile.mkdtemp(prefix='bench_archives_')
+    try:
+        shapes = {
+            'many-small': os.path.join(work_dir, 'many_small.zip'),
+            'few-huge': os.path.join(work_dir, 'few_huge.zip'),
+        }
+        _build_many_small(shapes['many-small'], args.small_count)
+        _build_few_huge(shapes['few-huge'], args.huge_mb)
+
+        print(f"{'shape':<12} {'mode':<10} {'members':>8} {'MB out':>8} {'best s':>8} {'MB/s':>8} {'peak MB':>9}")
+        for shape, path in shapes.items():
+            for mode, mode_kwargs in MODES.items():
+                runs = [_run_once(path, mode_kwargs) for _ in range(args.repeat)]
+                best = min(r[0] for r in runs)
+                peak = max(r[1] for r in runs)
+                _, _, out_bytes, members = runs[0]
+                mb_out = out_bytes / (1024 * 1024)
+                print(
+                    f"{shape:<12} {mode:<10} {members:>8} "
+                    f"{mb_out:>8.1f} {best:>8.3f} {mb_out / best:>8.1f} {peak / (1024 * 1024):>9.2f}"
+                )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark for the result-table encodings in table_encoding.
+
+Encodes synthetic result tables the way the endpoints do and compares:
+
+  * json     : ``json.dumps(df.to_dict(orient="split"))`` (what ``jsonify`` does)
+  * fastjson : ``split_json(df)``, pandas' vectorised encoder
+  * ndjson   : ``iter_ndjson(df)``, header line plus one line per row
+  * arrow    : ``arrow_stream(df)`` (skipped when pyarrow is not installed)
+
+Tables mix the column types extraction results usually have: ints, floats
+with some NaN, short strings, longer text and ``_source`` provenance columns.
+For every format it reports the best wall time, rows/s and encoded size.
+
+Usage:
+    python bench_table_encoding.py [--rows 10000,100000] [--cols 12] [--repeat 3]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from table_encoding import arrow_stream, iter_ndjson, negotiate, split_json
+
+
+def _legacy(df) -> bytes:
+    return json.dumps(df.to_dict(orient='split'), ensure_ascii=False).encode('utf-8')
+
+
+def _ndjson(df) -> bytes:
+    return ''.join(iter_ndjson(df)).encode('utf-8')
+
+
+# label -> encoder returning the response body
+FORMATS = {
+    'json': _legacy,
+    'fastjson': lambda df: split_json(df).encode('utf-8'),
+    'ndjson': _ndjson,
+    'arrow': arrow_stream,
+}
+
+
+def _build_table(rows: int, cols: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    data = {}
+    for i in range(cols):
+        kind = i % 4
+        if kind == 0:
+            data[f'int_{i}'] = rng.integers(0, 1_000_000, rows)
+        elif kind == 1:
+            values = rng.random(rows) * 1000
+            values[rng.random(rows) < 0.05] = np.nan
+            data[f'float_{i}'] = values
+        elif kind == 2:
+            data[f'name_{i}'] = [f'player {n % 5000}' for n in range(rows)]
+        else:
+            data[f'_source_{i}'] = [f'players/player_{n:05d}.txt: Drew Gordon is an American basketball player.'
+                                    for n in range(rows)]
+    return pd.DataFrame(data)
+
+
+def _run_once(encode, df):
+    started = time.perf_counter()
+    body = encode(df)
+    return time.perf_counter() - started, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='10000,100000', help='comma separated table sizes')
+    parser.add_argument('--cols', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # negotiate() falls back from arrow when pyarrow is missing
+    formats = {k: v for k, v in FORMATS.items() if k != 'arrow' or negotiate('arrow') == 'arrow'}
+    if 'arrow' not in formats:
+        print('pyarrow not installed: skipping arrow')
+    print(f"{'rows':>8} {'format':<10} {'best s':>8} {'rows/s':>12} {'MB':>8} {'vs json':>8}")
+    for rows in (int(r) for r in args.rows.split(',') if r.strip()):
+        df = _build_table(rows, args.cols)
+        baseline = None
+        for label, encode in formats.items():
+            runs = [_run_once(encode, df) for _ in range(args.repeat)]
+            best = min(r[0] for r in runs)
+            size = runs[0][1]
+            baseline = baseline or best
+            print(
+                f"{rows:>8} {label:<10} {best:>8.3f} {rows / best:>12,.0f} "
+                f"{size / (1024 * 1024):>8.2f} {baseline / best:>7.1f}x"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Staging area for resumable chunked uploads.
+
+Large corpora do not fit in one request under MAX_CONTENT_LENGTH, and a
+dropped connection used to mean starting again from zero. The protocol here
+splits a file into fixed-size chunks:
+
+  1. ``init``      -> upload id, chunk size and chunk count
+  2. ``write_chunk`` for every index (any order, retries are idempotent);
+     each chunk may carry a SHA-256 which is verified before it counts
+  3. ``status``    -> indexes already received, so a client can resume
+  4. ``complete``  -> staging file path once every chunk is present
+
+Chunk bytes are written straight into a preallocated staging file at their
+offset, never buffered whole. Received chunks are recorded as one marker file
+per index instead of a shared manifest, so parallel chunk requests (even in
+different worker processes) never race on the bookkeeping. A chunk's marker
+is removed before its bytes are overwritten and written again only once they
+are verified, so a failed retry of an accepted chunk makes it missing again
+instead of leaving unverified bytes behind a valid marker.
+
+``init`` refuses sizes above ``max_total_size``, since the staging file is
+preallocated at that size.
+
+``complete`` claims the upload by creating ``<upload_id>.done`` with
+``O_EXCL`` before handing the staging file out, so of two concurrent
+``complete`` calls (in any worker process) only one ingests the file; the
+other, and any chunk written after the claim, gets 409. ``release`` drops the
+claim again when ingesting fails, so the client can retry.
+
+On-disk layout under ``staging_dir``::
+
+  <upload_id>.json     # manifest written once at init
+  <upload_id>.part     # staging file, size == total size
+  <upload_id>.chunks/  # one file per received chunk, holding its sha256
+  <upload_id>.done     # claim taken by complete()
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_TOTAL_SIZE = 2 * 1024 * 1024 * 1024
+STREAM_BUFFER_SIZE = 64 * 1024
+# Unfinished uploads older than this are purged on the next init().
+STAGING_TTL_SECONDS = 24 * 3600
+
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class ChunkedUploadError(Exception):
+    """Invalid protocol use; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedUploadStore:
+    """File-backed store of in-progress chunked uploads."""
+
+    def __init__(self, staging_dir: str, max_chunk_size: int, ttl_seconds: int = STAGING_TTL_SECONDS,
+                 max_total_size: int = DEFAULT_MAX_TOTAL_SIZE):
+        self.staging_dir = staging_dir
+        self.max_chunk_size = max_chunk_size
+        self.max_total_size = max_total_size
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(staging_dir, exist_ok=True)
+
+    # ---- paths --------------------------------------------------------
+    def _path(self, upload_id: str, suffix: str) -> str:
+        if not _UPLOAD_ID_RE.match(upload_id or ''):
+            raise ChunkedUploadError('invalid upload id', 404)
+        return os.path.join(self.staging_dir, upload_id + suffix)
+
+    def _manifest(self, upload_id: str) -> Dict:
+        try:
+            with open(self._path(upload_id, '.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ChunkedUploadError(f'upload {upload_id} not found or expired', 404)
+
+    def _claimed(self, upload_id: str) -> bool:
+        return os.path.exists(self._path(upload_id, '.done'))
+
+    def _received(self, upload_id: str) -> List[int]:
+        try:
+            return sorted(int(n) for n in os.listdir(self._path(upload_id, '.chunks')))
+        except FileNotFoundError:
+            return []
+
+    # ---- protocol -----------------------------------------------------
+    def init(self, filename: str, folder: str, total_size: int,
+             chunk_size: Optional[int] = None, sha256: Optional[str] = None) -> Dict:
+        """Create a staging file for ``total_size`` bytes and return the manifest."""
+        if not _is_int(total_size) or total_size < 0:
+            raise ChunkedUploadError('size must be an integer >= 0')
+        if total_size > self.max_total_size:
+            raise ChunkedUploadError(f'size must not exceed {self.max_total_size} bytes', 413)
+        chunk_size = chunk_size or min(DEFAULT_CHUNK_SIZE, self.max_chunk_size)
+        if not _is_int(chunk_size) or not 0 < chunk_size <= self.max_chunk_size:
+            raise ChunkedUploadError(f'chunk_size must be between 1 and {self.max_chunk_size}')
+        self.purge_expired()
+        upload_id = uuid.uuid4().hex
+        manifest = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'folder': folder,
+            'size': total_size,
+            'chunk_size': chunk_size,
+            'total_chunks': max(1, -(-total_size // chunk_size)),
+            'sha256': (sha256 or '').lower() or None,
+            'created_at': time.time(),
+        }
+        with open(self._path(upload_id, '.part'), 'wb') as f:
+            f.truncate(total_size)
+        os.makedirs(self._path(upload_id, '.chunks'))
+        with open(self._path(upload_id, '.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        return manifest
+
+    def status(self, upload_id: str) -> Dict:
+        manifest = self._manifest(upload_id)
+        received = self._received(upload_id)
+        have = set(received)
+        return dict(manifest, received=received,
+                    missing=[i for i in range(manifest['total_chunks']) if i not in have])
+
+    def write_chunk(self, upload_id: str, index: int, stream, checksum: Optional[str] = None) -> Dict:
+        """Stream one chunk into place; verify its length and optional sha256."""
+        manifest = self._manifest(upload_id)
+        if not 0 <= index < manifest['total_chunks']:
+            raise ChunkedUploadError(f"chunk index must be in [0, {manifest['total_chunks']})")
+        if self._claimed(upload_id):
+            raise ChunkedUploadError(f'upload {upload_id} is already completed', 409)
+        offset = index * manifest['chunk_size']
+        expected = min(manifest['chunk_size'], manifest['size'] - offset)
+
+        marker = os.path.join(self._path(upload_id, '.chunks'), str(index))
+        try:
+            os.remove(marker)
+        except FileNotFoundError:
+            pass
+        digest = hashlib.sha256()
+        written = 0
+        fd = os.open(self._path(upload_id, '.part'), os.O_WRONLY)
+        try:
+            while True:
+                buf = stream.read(STREAM_BUFFER_SIZE)
+                if not buf:
+                    break
+                if written + len(buf) > expected:
+                    raise ChunkedUploadError(f'chunk {index} is larger than {expected} bytes')
+                os.pwrite(fd, buf, offset + written)
+                digest.update(buf)
+                written += len(buf)
+        finally:
+            os.close(fd)
+        if written != expected:
+            raise ChunkedUploadError(f'chunk {index} has {written} bytes, expected {expected}')
+        actual = digest.hexdigest()
+        if checksum and checksum.lower() != actual:
+            raise ChunkedUploadError(f'chunk {index} checksum mismatch', 422)
+
+        with open(marker, 'w') as f:
+            f.write(actual)
+        return {'upload_id': upload_id, 'index': index, 'size': written, 'sha256': actual}
+
+    def complete(self, upload_id: str) -> Tuple[str, Dict]:
+        """Check that every chunk arrived, claim the upload; return (staging file path, manifest).
+
+        The caller owns the staging file from here on and must ``discard``
+        the upload when done with it, or ``release`` it to allow a retry.
+        """
+        status = self.status(upload_id)
+        if status['missing']:
+            raise ChunkedUploadError(f"missing chunks: {status['missing'][:20]}", 409)
+        try:
+            os.close(os.open(self._path(upload_id, '.done'), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            raise ChunkedUploadError(f'upload {upload_id} is already completed', 409)
+        staging_path = self._path(upload_id, '.part')
+        if status['sha256']:
+            digest = hashlib.sha256()
+            with open(staging_path, 'rb') as f:
+                for buf in iter(lambda: f.read(STREAM_BUFFER_SIZE), b''):
+                    digest.update(buf)
+            if digest.hexdigest() != status['sha256']:
+                self.release(upload_id)
+                raise ChunkedUploadError('file checksum mismatch', 422)
+        return staging_path, status
+
+    def release(self, upload_id: str) -> None:
+        """Drop the claim taken by ``complete`` so the upload can be completed again."""
+        try:
+            os.remove(self._path(upload_id, '.done'))
+        except FileNotFoundError:
+            pass
+
+    def discard(self, upload_id: str) -> None:
+        for suffix in ('.json', '.part', '.done'):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+        shutil.rmtree(self._path(upload_id, '.chunks'), ignore_errors=True)
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        purged = 0
+        for name in os.listdir(self.staging_dir):
+            upload_id, ext = os.path.splitext(name)
+            if ext != '.json' or not _UPLOAD_ID_RE.match(upload_id):
+                continue
+            try:
+                if os.path.getmtime(os.path.join(self.staging_dir, name)) < cutoff:
+                    self.discard(upload_id)
+                    purged += 1
+            except FileNotFoundError:
+                continue
+        return purged
+
+
+__all__ = [
+    'ChunkedUploadStore',
+    'ChunkedUploadError',
+    'DEFAULT_CHUNK_SIZE',
+]
@@ -41,12 +41,14 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
   const [folderName, setFolderName] = useState('');
   const [uploadingFiles, setUploadingFiles] = useState([]);
   const [foldersStructure, setFoldersStructure] = useState({});
+  // 文本正文按需加载（列表只取元数据），按文档 id 缓存
+  const [docContents, setDocContents] = useState({});
 
   // 组件加载时从服务器获取文档列表
   useEffect(() => {
     const loadDocuments = async () => {
       try {
-  const response = await fetch(getApiUrl('/api/documents'));
+  const response = await fetch(getApiUrl('/api/documents?content=0'));
         if (response.ok) {
           const serverDocuments = await response.json();
           // 直接设置文档列表，而不是逐个添加
@@ -128,7 +130,7 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
     // 如果是PDF文件，先下载并创建blob URL
     if (document.type?.includes('pdf') || document.name?.toLowerCase().endsWith('.pdf')) {
       try {
-        const response = await fetch(getApiUrl(`/api/documents/${document.filename}/download`));
+        const response = await fetch(getApiUrl(`/api/documents/${encodeURIComponent(document.filename)}/download?folder=${encodeURIComponent(document.folder || 'root')}`));
         if (response.ok) {
           const blob = await response.blob();
           const fileURL = URL.createObjectURL(blob);
@@ -150,40 +152,88 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
     setPreviewDocument(document);
     setHighlightText(highlight);
     setPreviewVisible(true);
-  };  const handleCustomUpload = async ({ file, fileList }) => {
-    if (!file) return;
+  };  // 超过该大小的文件走分片上传（/api/uploads/*），单个请求不会碰到服务器的 MAX_CONTENT_LENGTH
+  const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+  const CHUNK_RETRIES = 3;
+
+  const readJson = async (response) => {
+    const result = await response.json();
+    if (!response.ok) {
+      throw new Error(result.error || 'Upload failed');
+    }
+    return result;
+  };
 
-    setUploading(true);
-    const formData = new FormData();
-    
-    // 添加单个文件到FormData
-    formData.append('files', file);
-    
-    // 如果指定了文件夹名称，也添加到FormData
-    if (folderName.trim()) {
-      formData.append('folder', folderName.trim());
+  // 分片上传单个文件；网络中断或 5xx 时重试该分片，已收到的分片不会重传
+  const uploadFileInChunks = async (file, folder) => {
+    const init = await readJson(await fetch(getApiUrl('/api/uploads/init'), {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ filename: file.name, size: file.size, folder }),
+    }));
+    const { upload_id: uploadId, chunk_size: chunkSize, total_chunks: totalChunks } = init;
+
+    for (let index = 0; index < totalChunks; index++) {
+      const chunk = file.slice(index * chunkSize, (index + 1) * chunkSize);
+      for (let attempt = 1; ; attempt++) {
+        try {
+          const response = await fetch(getApiUrl(`/api/uploads/${uploadId}/chunks/${index}`), {
+            method: 'PUT',
+            body: chunk,
+          });
+          if (response.ok) break;
+          if (response.status < 500 || attempt >= CHUNK_RETRIES) await readJson(response);
+        } catch (error) {
+          if (attempt >= CHUNK_RETRIES) throw error;
+        }
+      }
     }
 
-    try {
-  const response = await fetch(getApiUrl('/api/upload'), {
+    return readJson(await fetch(getApiUrl(`/api/uploads/${uploadId}/complete?content=0`), { method: 'POST' }));
+  };
+
+  // 小文件合并为一次 multipart 请求，大文件逐个分片上传；返回与 /api/upload 相同的 { files, message }
+  const uploadDocuments = async (fileList, folder) => {
+    const small = fileList.filter(file => file.size <= CHUNKED_UPLOAD_THRESHOLD);
+    const large = fileList.filter(file => file.size > CHUNKED_UPLOAD_THRESHOLD);
+    const results = [];
+
+    if (small.length > 0) {
+      const formData = new FormData();
+      small.forEach(file => formData.append('files', file));
+      // 如果指定了文件夹名称，也添加到FormData
+      if (folder) {
+        formData.append('folder', folder);
+      }
+      results.push(await readJson(await fetch(getApiUrl('/api/upload?content=0'), {
         method: 'POST',
         body: formData,
-      });
+      })));
+    }
+    for (const file of large) {
+      results.push(await uploadFileInChunks(file, folder));
+    }
 
-      if (response.ok) {
-        const result = await response.json();
-        message.success(result.message);
-        
-        // 将上传的文件添加到文档列表
-        result.files.forEach(file => {
-          if (onDocumentAdd) {
-            onDocumentAdd(file);
-          }
-        });
-      } else {
-        const error = await response.json();
-        message.error(error.error || 'Upload failed');
-      }
+    return {
+      files: results.flatMap(result => result.files),
+      message: results.map(result => result.message).join('; '),
+    };
+  };
+
+  const handleCustomUpload = async ({ file, fileList }) => {
+    if (!file) return;
+
+    setUploading(true);
+    try {
+      const result = await uploadDocuments([file], folderName.trim());
+      message.success(result.message);
+
+      // 将上传的文件添加到文档列表
+      result.files.forEach(file => {
+        if (onDocumentAdd) {
+          onDocumentAdd(file);
+        }
+      });
     } catch (error) {
       message.error('Upload failed: ' + error.message);
     } finally {
@@ -199,43 +249,21 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
     }
 
     setUploading(true);
-    const formData = new FormData();
-    
-    // 添加所有文件到FormData
-    uploadingFiles.forEach(file => {
-      formData.append('files', file);
-    });
-    
-    // 如果指定了文件夹名称，也添加到FormData
-    if (folderName.trim()) {
-      formData.append('folder', folderName.trim());
-    }
-
     try {
-  const response = await fetch(getApiUrl('/api/upload'), {
-        method: 'POST',
-        body: formData,
+      const result = await uploadDocuments(uploadingFiles, folderName.trim());
+      message.success(result.message);
+
+      // 将上传的文件添加到文档列表
+      result.files.forEach(file => {
+        if (onDocumentAdd) {
+          onDocumentAdd(file);
+        }
       });
 
-      if (response.ok) {
-        const result = await response.json();
-        message.success(result.message);
-        
-        // 将上传的文件添加到文档列表
-        result.files.forEach(file => {
-          if (onDocumentAdd) {
-            onDocumentAdd(file);
-          }
-        });
-        
-        // Clear upload state
-        setUploadModalVisible(false);
-        setFolderName('');
-        setUploadingFiles([]);
-      } else {
-        const error = await response.json();
-        message.error(error.error || 'Upload failed');
-      }
+      // Clear upload state
+      setUploadModalVisible(false);
+      setFolderName('');
+      setUploadingFiles([]);
     } catch (error) {
       message.error('Upload failed: ' + error.message);
     } finally {
@@ -245,7 +273,7 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
 
   const handleDeleteDocument = async (doc) => {
     try {
-  const response = await fetch(getApiUrl(`/api/documents/${doc.filename}`), {
+  const response = await fetch(getApiUrl(`/api/documents/${encodeURIComponent(doc.filename)}?folder=${encodeURIComponent(doc.folder || 'root')}`), {
         method: 'DELETE',
       });
 
@@ -265,7 +293,7 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
 
   const handleDownload = async (doc) => {
     try {
-  const response = await fetch(getApiUrl(`/api/documents/${doc.filename}/download`));
+  const response = await fetch(getApiUrl(`/api/documents/${encodeURIComponent(doc.filename)}/download?folder=${encodeURIComponent(doc.folder || 'root')}`));
       if (response.ok) {
         const blob = await response.blob();
         const url = URL.createObjectURL(blob);
@@ -282,24 +310,23 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
     }
   };
 
+  // 与后端 archive_utils.ARCHIVE_SUFFIXES 保持一致
+  const UPLOAD_SUFFIXES = ['.pdf', '.txt', '.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2',
+    '.tar.xz', '.txz', '.tar.zst', '.tar.zstd', '.tzst'];
+  const UPLOAD_ACCEPT = UPLOAD_SUFFIXES.join(',');
+
   const uploadProps = {
     name: 'files',
     multiple: true,
-    accept: '.pdf,.txt,.zip',
+    accept: UPLOAD_ACCEPT,
     customRequest: handleCustomUpload,
     showUploadList: false,
     beforeUpload: (file) => {
       const lower = file.name.toLowerCase();
-      const isValidType = lower.endsWith('.pdf') || lower.endsWith('.txt') || lower.endsWith('.zip') ||
+      const isValidType = UPLOAD_SUFFIXES.some(suffix => lower.endsWith(suffix)) ||
         file.type.includes('pdf') || file.type.includes('text');
       if (!isValidType) {
-        message.error(`${file.name} format not supported, only PDF, TXT and ZIP formats are allowed!`);
-        return Upload.LIST_IGNORE;
-      }
-
-      const isLt10M = file.size / 1024 / 1024 < 10;
-      if (!isLt10M) {
-        message.error(`${file.name} file size exceeds 10MB!`);
+        message.error(`${file.name} format not supported, only PDF, TXT, ZIP and TAR archives are allowed!`);
         return Upload.LIST_IGNORE;
       }
 
@@ -311,20 +338,14 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
   const uploadModalProps = {
     name: 'files',
     multiple: true,
-    accept: '.pdf,.txt,.zip',
+    accept: UPLOAD_ACCEPT,
     showUploadList: true,
     beforeUpload: (file) => {
       const lower = file.name.toLowerCase();
-      const isValidType = lower.endsWith('.pdf') || lower.endsWith('.txt') || lower.endsWith('.zip') ||
+      const isValidType = UPLOAD_SUFFIXES.some(suffix => lower.endsWith(suffix)) ||
         file.type.includes('pdf') || file.type.includes('text');
       if (!isValidType) {
-        message.error(`${file.name} format not supported, only PDF, TXT and ZIP formats are allowed!`);
-        return false;
-      }
-
-      const isLt10M = file.size / 1024 / 1024 < 10;
-      if (!isLt10M) {
-        message.error(`${file.name} file size exceeds 10MB!`);
+        message.error(`${file.name} format not supported, only PDF, TXT, ZIP and TAR archives are allowed!`);
         return false;
       }
 
@@ -409,7 +430,41 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
   };
 
 
-  const handleExpand = (docId) => {
+  const isPdfDocument = (doc) => doc?.type?.includes('pdf') || doc?.name?.toLowerCase().endsWith('.pdf');
+
+  // 获取文档正文：优先用已缓存/列表自带的内容，否则请求 content 接口（浏览器会带 If-None-Match 走 304）
+  const loadDocumentContent = async (doc) => {
+    if (!doc || isPdfDocument(doc)) return null;
+    if (doc.content != null) return doc.content;
+    if (docContents[doc.id] != null) return docContents[doc.id];
+    try {
+      const params = new URLSearchParams({ folder: doc.folder || 'root' });
+      const response = await fetch(getApiUrl(`/api/documents/${encodeURIComponent(doc.filename)}/content?${params}`));
+      if (!response.ok) return null;
+      const result = await response.json();
+      setDocContents(prev => ({ ...prev, [doc.id]: result.content }));
+      return result.content;
+    } catch (error) {
+      console.error('Load document content failed:', error);
+      return null;
+    }
+  };
+
+  // 预览文本文件时补齐正文
+  useEffect(() => {
+    if (!previewDocument || previewDocument.content != null || isPdfDocument(previewDocument)) return;
+    let cancelled = false;
+    loadDocumentContent(previewDocument).then(content => {
+      if (!cancelled && content != null) {
+        setPreviewDocument(prev => (prev && prev.id === previewDocument.id ? { ...prev, content } : prev));
+      }
+    });
+    return () => { cancelled = true; };
+  }, [previewDocument]);
+
+  const handleExpand = async (docId) => {
+    const doc = documents.find(d => d.id === docId);
+    await loadDocumentContent(doc);
     setExpandedDocIds(prev => [...prev, docId]);
   };
   const handleCollapse = (docId) => {
@@ -476,6 +531,7 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
   // 渲染单个文档卡片
   const renderDocumentCard = (doc) => {
     const expanded = expandedDocIds.includes(doc.id);
+    const content = doc.content ?? docContents[doc.id];
     return (
       <Card 
         key={doc.id}
@@ -519,18 +575,18 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
           )}
         </div>
         <div className="document-preview-content">
-          {doc.content && (
+          {content && (
             <>
               {!expanded ? (
                 <Paragraph 
                   ellipsis={{ rows: 3, expandable: false }}
                   style={{ fontSize: '12px', margin: '8px 0 0 0' }}
                 >
-                  {doc.content}
+                  {content}
                 </Paragraph>
               ) : (
                 <Paragraph style={{ fontSize: '12px', margin: '8px 0 0 0' }}>
-                  {doc.content}
+                  {content}
                 </Paragraph>
               )}
               {!expanded ? (
@@ -544,9 +600,14 @@ const DocumentManager = ({ documents, onDocumentAdd, onDocumentDelete, onDocumen
               )}
             </>
           )}
-          {!doc.content && (
+          {!content && !isPdfDocument(doc) && (
+            <Button type="link" size="small" onClick={() => handleExpand(doc.id)} style={{ padding: 0 }}>
+              show content
+            </Button>
+          )}
+          {!content && isPdfDocument(doc) && (
             <Text type="secondary" style={{ fontSize: '12px' }}>
-              {doc.type && doc.type.includes('pdf') ? 'PDF file, click Preview to view' : 'No content preview available'}
+              PDF file, click Preview to view
             </Text>
           )}
         </div>
@@ -366,6 +366,45 @@ const ParameterInput = ({ parameter, value, onChange }) => {
   }
 };
 
+// 算子以异步任务运行：POST ?async=1 立即返回 task_id，进度和最终表格通过 SSE（/api/operator-events）推送，
+// 长时间的 LLM 调用不会占住后端 worker，也不会触发代理超时。resolve 的数据与同步接口的响应相同
+const runOperatorTask = async (getApiUrl, path, body) => {
+  const startResponse = await fetch(getApiUrl(`${path}?async=1`), {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(body)
+  });
+  const started = await startResponse.json();
+  if (!startResponse.ok) {
+    throw new Error(started.error || `HTTP error! status: ${startResponse.status}`);
+  }
+  return new Promise((resolve, reject) => {
+    const eventSource = new EventSource(getApiUrl(`/api/operator-events/${started.task_id}`));
+    eventSource.addEventListener('complete', (event) => {
+      eventSource.close();
+      resolve(JSON.parse(event.data).result);
+    });
+    eventSource.addEventListener('failed', (event) => {
+      eventSource.close();
+      reject(new Error(JSON.parse(event.data).error || 'Operator failed'));
+    });
+    eventSource.addEventListener('cancelled', () => {
+      eventSource.close();
+      reject(new Error('Operator task was cancelled'));
+    });
+    eventSource.addEventListener('error', (event) => {
+      // 连接被断开时 EventSource 会带着 Last-Event-ID 自动重连
+      if (!event.data && eventSource.readyState === EventSource.CONNECTING) {
+        return;
+      }
+      eventSource.close();
+      reject(new Error(event.data ? JSON.parse(event.data).message : 'Connection lost'));
+    });
+  });
+};
+
 // 可排序的算子卡片组件
 // 功能：
 // - 支持拖拽排序（dnd-kit）
@@ -844,7 +883,7 @@ const OperatorPanel = ({ documents, onRowClick, showBackButton = false, onBackTo
       op.id === id ? { ...op, status: 'running' } : op
     ));
     const operator = operators.find(op => op.id === id);
-    let response
+    let data
     try {
       // 处理columns参数，生成column_name列表和描述信息
       const processedParameters = { ...operator.parameters };
@@ -877,51 +916,33 @@ const OperatorPanel = ({ documents, onRowClick, showBackButton = false, onBackTo
       });
 
       if (operator.type === 'Extract') {
-  response = await fetch(getApiUrl('/api/extract'), {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({
-            type: operator.type,
-            prompt: operator.prompt,
-            model: operator.model,
-            parameters: processedParameters, // 包含所有三个参数：tablename, columns, prompt
-            function_name: projectInfo?.new_function_name || null,
-            selected_indexes: selectedIndexNames || [] // 使用索引名称列表
-          })
+  data = await runOperatorTask(getApiUrl, '/api/extract', {
+          type: operator.type,
+          prompt: operator.prompt,
+          model: operator.model,
+          parameters: processedParameters, // 包含所有三个参数：tablename, columns, prompt
+          function_name: projectInfo?.new_function_name || null,
+          selected_indexes: selectedIndexNames || [] // 使用索引名称列表
         });
       }
       else if (operator.type ==='Filter') {
-  response = await fetch(getApiUrl('/api/filter'), {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({ 
-            type: operator.type,
-            prompt: operator.prompt,
-            model: operator.model,
-            parameters: processedParameters,
-            function_name: projectInfo?.new_function_name || null,
-            selected_indexes: selectedIndexNames || [] // 使用索引名称列表
-          })
+  data = await runOperatorTask(getApiUrl, '/api/filter', {
+          type: operator.type,
+          prompt: operator.prompt,
+          model: operator.model,
+          parameters: processedParameters,
+          function_name: projectInfo?.new_function_name || null,
+          selected_indexes: selectedIndexNames || [] // 使用索引名称列表
         });
       }
       else if (operator.type ==='Retrieve') {
-  response = await fetch(getApiUrl('/api/retrieve'), {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({ 
-            type: operator.type,
-            prompt: operator.prompt,
-            model: operator.model,
-            parameters: processedParameters,
-            function_name: projectInfo?.new_function_name || null,
-            selected_indexes: selectedIndexNames || [] // 使用索引名称列表
-          })
+  data = await runOperatorTask(getApiUrl, '/api/retrieve', {
+          type: operator.type,
+          prompt: operator.prompt,
+          model: operator.model,
+          parameters: processedParameters,
+          function_name: projectInfo?.new_function_name || null,
+          selected_indexes: selectedIndexNames || [] // 使用索引名称列表
         });
       }
 
@@ -929,7 +950,6 @@ const OperatorPanel = ({ documents, onRowClick, showBackButton = false, onBackTo
 
 
 
-      const data = await response.json(); // 解析 JSON 数据
       
       // 如果返回了 function_name，更新项目信息并保存到 projects.json
 
@@ -1111,7 +1131,7 @@ const OperatorPanel = ({ documents, onRowClick, showBackButton = false, onBackTo
 
     // 依次运行所有算子
     pendingOperators.forEach(async (operator, index) => {
-      let response;
+      let data;
       
       // 处理columns参数，生成column_name列表和描述信息
       const processedParameters = { ...operator.parameters };
@@ -1136,36 +1156,23 @@ const OperatorPanel = ({ documents, onRowClick, showBackButton = false, onBackTo
       }
       
       if (operator.type === 'Extract') {
-  response = await fetch(getApiUrl('/api/extract'), {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({
-            type: operator.type,
-            prompt: operator.prompt,
-            model: operator.model,
-            parameters: processedParameters,
-            function_name: projectInfo?.function_name || null
-          })
+  data = await runOperatorTask(getApiUrl, '/api/extract', {
+          type: operator.type,
+          prompt: operator.prompt,
+          model: operator.model,
+          parameters: processedParameters,
+          function_name: projectInfo?.function_name || null
         });
       }
       else if (operator.type ==='Filter') {
-  response = await fetch(getApiUrl('/api/filter'), {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({ 
-            type: operator.type,
-            prompt: operator.prompt,
-            model: operator.model,
-            parameters: operator.parameters || {},
-            function_name: projectInfo?.function_name || null
-          })
+  data = await runOperatorTask(getApiUrl, '/api/filter', {
+          type: operator.type,
+          prompt: operator.prompt,
+          model: operator.model,
+          parameters: operator.parameters || {},
+          function_name: projectInfo?.function_name || null
         });
       }
-      const data = await response.json();
       
       // 如果返回了 function_name，更新项目信息并保存到 projects.json
       
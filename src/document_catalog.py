@@ -0,0 +1,350 @@
+"""Persistent catalog of uploaded document metadata (SQLite).
+
+/api/documents used to walk UPLOAD_FOLDER and stat every file on each call.
+The catalog keeps one row per stored .txt/.pdf file so listings become an
+indexed query. Writers (upload, archive extraction, delete) update it
+incrementally and ``reconcile()`` repairs drift against the filesystem, e.g.
+once at startup or after files were copied in by hand.
+
+Document ids are content addressed: the first 16 hex digits of the file's
+SHA-256, so they survive restarts and agree between worker processes. The
+full digest is stored as well and lets uploads skip byte-identical files
+that are already stored anywhere under the upload dir.
+
+Per top-level folder counters (file count, total bytes, last modified) live
+in ``folder_stats`` and are kept current by triggers on ``documents``, so
+/api/folders is a single small read and stays consistent across processes.
+
+Lookups by (folder, name) -- the identity behind document ids -- are indexed
+queries on the table, so delete/download resolve a filename without walking
+the upload dir and always see rows written by other worker processes.
+
+Only standard library modules are used. One connection is shared per process
+and guarded by a lock; SQLite's own file locking keeps several worker
+processes consistent.
+
+Row schema (table ``documents``):
+  rel_path   TEXT PRIMARY KEY  # path relative to the upload dir, '/' separated
+  folder     TEXT              # immediate parent directory name or 'root'
+  name       TEXT              # base filename
+  size       INTEGER           # bytes
+  mtime      REAL              # os.stat st_mtime
+  ctime      REAL              # os.stat st_ctime (shown as uploadTime)
+  type       TEXT              # mimetype guess
+  content_hash TEXT            # SHA-256 hex digest of the file bytes
+
+Table ``folder_stats``: folder (top-level dir name), file_count, total_bytes,
+last_modified (epoch seconds).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DOCUMENT_EXTENSIONS = ('.txt', '.pdf')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    rel_path TEXT PRIMARY KEY,
+    folder   TEXT NOT NULL,
+    name     TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime    REAL NOT NULL,
+    ctime    REAL NOT NULL,
+    type     TEXT NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_folder ON documents(folder, rel_path);
+CREATE INDEX IF NOT EXISTS idx_documents_name ON documents(name, folder);
+"""
+
+_HASH_INDEX = "CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(content_hash)"
+
+# Top-level folder of a rel_path ('' for files directly in the upload dir).
+_TOP_FOLDER = "substr({p}, 1, instr({p}, '/') - 1)"
+
+_FOLDER_STATS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS folder_stats (
+    folder        TEXT PRIMARY KEY,
+    file_count    INTEGER NOT NULL DEFAULT 0,
+    total_bytes   INTEGER NOT NULL DEFAULT 0,
+    last_modified REAL NOT NULL DEFAULT 0
+);
+CREATE TRIGGER IF NOT EXISTS trg_documents_insert AFTER INSERT ON documents
+WHEN instr(NEW.rel_path, '/') > 0
+BEGIN
+    INSERT INTO folder_stats (folder, file_count, total_bytes, last_modified)
+    VALUES ({_TOP_FOLDER.format(p='NEW.rel_path')}, 1, NEW.size, NEW.mtime)
+    ON CONFLICT(folder) DO UPDATE SET
+        file_count = file_count + 1,
+        total_bytes = total_bytes + excluded.total_bytes,
+        last_modified = max(last_modified, excluded.last_modified);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_documents_delete AFTER DELETE ON documents
+WHEN instr(OLD.rel_path, '/') > 0
+BEGIN
+    UPDATE folder_stats SET
+        file_count = file_count - 1,
+        total_bytes = total_bytes - OLD.size,
+        last_modified = max(last_modified, (julianday('now') - 2440587.5) * 86400.0)
+    WHERE folder = {_TOP_FOLDER.format(p='OLD.rel_path')};
+END;
+"""
+
+_UPSERT = (
+    'INSERT OR REPLACE INTO documents (rel_path, folder, name, size, mtime, ctime, type, content_hash) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+)
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def _mimetype(name: str) -> str:
+    return 'application/pdf' if name.lower().endswith('.pdf') else 'text/plain'
+
+
+def document_id(content_hash: str) -> str:
+    """Stable document id derived from the content digest."""
+    return content_hash[:16]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_stream(src, out_path: str, chunk_size: int = HASH_CHUNK_SIZE) -> Tuple[str, int]:
+    """Copy a binary stream to out_path, hashing it on the way.
+
+    Returns (sha256 hex digest, bytes written). Callers usually write to a
+    temporary name first so a duplicate can be dropped without touching an
+    existing file.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(out_path, 'wb') as dst:
+        while True:
+            buf = src.read(chunk_size)
+            if not buf:
+                break
+            digest.update(buf)
+            dst.write(buf)
+            size += len(buf)
+    return digest.hexdigest(), size
+
+
+class DocumentCatalog:
+    """SQLite-backed index of the files stored under ``upload_dir``."""
+
+    def __init__(self, db_path: str, upload_dir: str):
+        self.db_path = db_path
+        self.upload_dir = upload_dir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # INSERT OR REPLACE must fire the delete trigger for the replaced row
+            self._conn.execute('PRAGMA recursive_triggers=ON')
+            self._conn.executescript(_SCHEMA)
+            columns = {r['name'] for r in self._conn.execute('PRAGMA table_info(documents)')}
+            if 'content_hash' not in columns:
+                # catalogs created before content ids; reconcile() fills the digests
+                self._conn.execute('ALTER TABLE documents ADD COLUMN content_hash TEXT')
+            self._conn.execute(_HASH_INDEX)
+            self._conn.executescript(_FOLDER_STATS_SCHEMA)
+
+    # ---- path helpers -------------------------------------------------
+    def rel_path(self, path: str) -> str:
+        """Normalise an on-disk path to the catalog key."""
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(self.upload_dir))
+        return rel.replace(os.sep, '/')
+
+    def abs_path(self, rel_path: str) -> str:
+        return os.path.join(self.upload_dir, *rel_path.split('/'))
+
+    @staticmethod
+    def folder_of(rel_path: str) -> str:
+        parent = rel_path.rsplit('/', 1)[0] if '/' in rel_path else ''
+        return parent.rsplit('/', 1)[-1] if parent else 'root'
+
+    def _row_for(self, path: str, content_hash: Optional[str] = None,
+                 st: Optional[os.stat_result] = None) -> Optional[Tuple]:
+        try:
+            st = st or os.stat(path)
+            content_hash = content_hash or file_sha256(path)
+        except OSError:
+            return None
+        rel = self.rel_path(path)
+        name = rel.rsplit('/', 1)[-1]
+        return (rel, self.folder_of(rel), name, st.st_size, st.st_mtime, st.st_ctime, _mimetype(name),
+                content_hash)
+
+    # ---- writers ------------------------------------------------------
+    def record_files(self, paths: Iterable[str], content_hashes: Optional[Dict[str, str]] = None) -> int:
+        """Insert or refresh rows for files that now exist on disk.
+
+        content_hashes maps path -> digest when the caller already hashed the
+        bytes while writing them; missing digests are computed here.
+        """
+        content_hashes = content_hashes or {}
+        rows = [r for r in (self._row_for(p, content_hashes.get(p)) for p in paths) if r is not None]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(_UPSERT, rows)
+        return len(rows)
+
+    def record_file(self, path: str, content_hash: Optional[str] = None) -> bool:
+        return self.record_files([path], {path: content_hash} if content_hash else None) == 1
+
+    def remove_files(self, paths: Iterable[str]) -> int:
+        keys = [(self.rel_path(p),) for p in paths]
+        with self._lock, self._conn:
+            cur = self._conn.executemany('DELETE FROM documents WHERE rel_path = ?', keys)
+        return cur.rowcount
+
+    def remove_file(self, path: str) -> bool:
+        return self.remove_files([path]) == 1
+
+    # ---- readers ------------------------------------------------------
+    def find_by_hash(self, content_hash: str) -> Optional[str]:
+        """Return the catalog path of a stored file with these exact bytes, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT rel_path FROM documents WHERE content_hash = ? LIMIT 1', (content_hash,)
+            ).fetchone()
+        return row['rel_path'] if row else None
+
+    def get(self, path: str) -> Optional[Dict]:
+        """Return the catalog row of an on-disk path, if catalogued."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM documents WHERE rel_path = ?', (self.rel_path(path),)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def find(self, name: str, folder: Optional[str] = None) -> List[str]:
+        """Return absolute paths of documents called ``name``, optionally in ``folder``.
+
+        Always read from the table (``idx_documents_name``), so rows recorded by
+        other processes or catalog instances are seen.
+        """
+        where, params = ('name = ? AND folder = ?', (name, folder)) if folder else ('name = ?', (name,))
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT rel_path FROM documents WHERE {where} ORDER BY rel_path', params).fetchall()
+        return [self.abs_path(r['rel_path']) for r in rows]
+
+    def list_documents(self, folder: Optional[str] = None, offset: int = 0,
+                       limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Return (rows, total) ordered by path, optionally for one folder."""
+        where, params = ('WHERE folder = ?', [folder]) if folder else ('', [])
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM documents {where}', params).fetchone()[0]
+            rows = self._conn.execute(
+                f'SELECT * FROM documents {where} ORDER BY rel_path LIMIT ? OFFSET ?',
+                params + [-1 if limit is None else limit, max(offset, 0)],
+            ).fetchall()
+        return [dict(r) for r in rows], total
+
+    def ensure_folder(self, folder: str) -> None:
+        """Register a (possibly still empty) top-level folder."""
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO folder_stats (folder, last_modified) VALUES (?, ?)',
+                               (folder, time.time()))
+
+    def folder_stats(self) -> List[Dict]:
+        """Counters for every top-level folder, ordered by name."""
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM folder_stats ORDER BY folder').fetchall()
+        return [dict(r) for r in rows]
+
+    @staticmethod
+    def to_document(row: Dict) -> Dict:
+        """Map a catalog row to the /api/documents metadata contract."""
+        return {
+            'id': document_id(row['content_hash'] or hashlib.sha256(row['rel_path'].encode('utf-8')).hexdigest()),
+            'contentHash': row['content_hash'],
+            'name': row['name'],
+            'filename': row['name'],
+            'folder': row['folder'],
+            'size': row['size'],
+            'type': row['type'],
+            'uploadTime': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['ctime'])),
+        }
+
+    # ---- maintenance --------------------------------------------------
+    def reconcile(self) -> Dict[str, int]:
+        """Bring the catalog in line with the upload dir in one walk.
+
+        Returns counts {added, updated, removed}.
+        """
+        with self._lock:
+            known = {r['rel_path']: (r['size'], r['mtime'], r['content_hash'] is not None)
+                     for r in self._conn.execute('SELECT rel_path, size, mtime, content_hash FROM documents')}
+        upserts = []
+        seen = set()
+        for root, _dirs, files in os.walk(self.upload_dir):
+            for name in files:
+                if not name.lower().endswith(DOCUMENT_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                rel = self.rel_path(path)
+                seen.add(rel)
+                if known.get(rel) == (st.st_size, st.st_mtime, True):
+                    continue
+                # only new, changed or never-hashed files are read
+                row = self._row_for(path, st=st)
+                if row is not None:
+                    upserts.append(row)
+        stale = [(k,) for k in known if k not in seen]
+        with self._lock, self._conn:
+            self._conn.executemany(_UPSERT, upserts)
+            self._conn.executemany('DELETE FROM documents WHERE rel_path = ?', stale)
+            self._rebuild_folder_stats()
+        added = sum(1 for r in upserts if r[0] not in known)
+        return {'added': added, 'updated': len(upserts) - added, 'removed': len(stale)}
+
+    def _rebuild_folder_stats(self) -> None:
+        """Recompute folder_stats from documents plus the dirs present on disk (lock held)."""
+        dirs = [d for d in os.listdir(self.upload_dir) if os.path.isdir(os.path.join(self.upload_dir, d))]
+        self._conn.execute('DELETE FROM folder_stats')
+        self._conn.execute(
+            f"INSERT INTO folder_stats (folder, file_count, total_bytes, last_modified) "
+            f"SELECT {_TOP_FOLDER.format(p='rel_path')}, COUNT(*), SUM(size), MAX(mtime) FROM documents "
+            f"WHERE instr(rel_path, '/') > 0 GROUP BY 1"
+        )
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO folder_stats (folder, last_modified) VALUES (?, ?)',
+            [(d, os.path.getmtime(os.path.join(self.upload_dir, d))) for d in dirs],
+        )
+        if dirs:
+            placeholders = ','.join('?' * len(dirs))
+            self._conn.execute(f'DELETE FROM folder_stats WHERE folder NOT IN ({placeholders})', dirs)
+        else:
+            self._conn.execute('DELETE FROM folder_stats')
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+__all__ = [
+    'DocumentCatalog',
+    'DOCUMENT_EXTENSIONS',
+    'document_id',
+    'file_sha256',
+    'store_stream',
+]
@@ -21,6 +21,44 @@ const { Panel } = Collapse;
 const { Title, Text } = Typography;
 
 // 索引选择模态框组件
+// 进度流：progress 事件是完整快照（检查点），delta 事件只包含相对上一事件的变化（?delta=1）
+const applySnapshotDelta = (state, delta) => {
+  const next = { ...state, ...(delta.set || {}) };
+  Object.entries(delta.append || {}).forEach(([key, items]) => {
+    next[key] = [...(state[key] || []), ...items];
+  });
+  Object.entries(delta.extend || {}).forEach(([key, text]) => {
+    next[key] = (state[key] || '') + text;
+  });
+  (delta.unset || []).forEach(key => { delete next[key]; });
+  return next;
+};
+
+const subscribeProgress = (eventSource, onProgress, onCancelled) => {
+  let state = null;
+  // 任务在后端排队时（queue_position > 0）显示排队位置
+  const report = () => onProgress(state.queue_position > 0
+    ? { ...state, description: `Waiting in queue (position ${state.queue_position})...` }
+    : state);
+  eventSource.addEventListener('progress', (event) => {
+    state = JSON.parse(event.data);
+    report();
+  });
+  eventSource.addEventListener('delta', (event) => {
+    if (!state) return;
+    state = applySnapshotDelta(state, JSON.parse(event.data));
+    report();
+  });
+  // 任务已在后端取消（DELETE /api/nl-tasks/<id> 或无人订阅超时），流到此结束
+  eventSource.addEventListener('cancelled', (event) => {
+    eventSource.close();
+    if (onCancelled) {
+      const { task_info: info = {} } = JSON.parse(event.data);
+      onCancelled(info.description || 'Task was cancelled');
+    }
+  });
+};
+
 const IndexConfigModal = ({ visible, onCancel, onSave, availableIndexes, selectedIndexes, indexDescriptions, loading, onDelete }) => {
   const [localSelectedIndexes, setLocalSelectedIndexes] = useState([]);
   const [localDescriptions, setLocalDescriptions] = useState({});
@@ -366,6 +404,13 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       }
     });
     
+    // 通知后端取消仍在排队或执行中的任务
+    Object.values(activeTasks).forEach(taskId => {
+      if (taskId) {
+        fetch(getApiUrl(`/api/nl-tasks/${taskId}`), { method: 'DELETE' }).catch(() => {});
+      }
+    });
+
     // 清理状态
     setSseConnections({});
     setActiveTasks({});
@@ -433,7 +478,7 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       const { task_id } = await startResponse.json();
       
       // 第二步：监听进度事件
-      const eventSource = new EventSource(getApiUrl(`/api/nl-parse-events/${task_id}`));
+      const eventSource = new EventSource(getApiUrl(`/api/nl-parse-events/${task_id}?delta=1`));
       
       // 保存连接引用
       setSseConnections(prev => ({ ...prev, parse: eventSource }));
@@ -441,14 +486,21 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       
       setProcessingStatus('Parsing natural language query...');
 
-      eventSource.addEventListener('progress', (event) => {
-        const snap = JSON.parse(event.data);
+      subscribeProgress(eventSource, (snap) => {
         setProcessingStatus(snap.description || 'Parsing...');
         
         // 如果有日志更新，可以显示
         if (snap.logs && snap.logs.length > 0) {
           console.log('Parse logs:', snap.logs);
         }
+      }, (reason) => {
+        setSseConnections(prev => ({ ...prev, parse: null }));
+        setActiveTasks(prev => ({ ...prev, parse: null }));
+        setIsProcessing(false);
+        setProcessingStatus('');
+        setCurrentStep(null);
+        setEditableParseResult(null);
+        message.warning(reason);
       });
 
       eventSource.addEventListener('complete', (event) => {
@@ -470,6 +522,11 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       });
 
       eventSource.addEventListener('error', (event) => {
+        // 连接被断开时 EventSource 会带着 Last-Event-ID 自动重连，服务端从断点继续推送
+        if (!event.data && eventSource.readyState === EventSource.CONNECTING) {
+          console.warn('Parse SSE reconnecting...');
+          return;
+        }
         console.error('Parse SSE error:', event);
         eventSource.close();
         setSseConnections(prev => ({ ...prev, parse: null }));
@@ -512,7 +569,7 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
   const startResponse = await fetch(getApiUrl('/api/nl-plan-start'), {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ analysis_result: modifiedParseResult })
+        body: JSON.stringify({ analysis_result: modifiedParseResult, index: selectedIndexes })
       });
 
       if (!startResponse.ok) {
@@ -522,7 +579,7 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       const { task_id } = await startResponse.json();
       
       // 第二步：监听进度事件
-  const eventSource = new EventSource(getApiUrl(`/api/nl-plan-events/${task_id}`));
+  const eventSource = new EventSource(getApiUrl(`/api/nl-plan-events/${task_id}?delta=1`));
       
       // 保存连接引用
       setSseConnections(prev => ({ ...prev, plan: eventSource }));
@@ -530,13 +587,20 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       
       setProcessingStatus('Generating execution plans...');
 
-      eventSource.addEventListener('progress', (event) => {
-        const snap = JSON.parse(event.data);
+      subscribeProgress(eventSource, (snap) => {
         setProcessingStatus(snap.description || 'Generating plans...');
         
         if (snap.logs && snap.logs.length > 0) {
           console.log('Plan logs:', snap.logs);
         }
+      }, (reason) => {
+        setSseConnections(prev => ({ ...prev, plan: null }));
+        setActiveTasks(prev => ({ ...prev, plan: null }));
+        setIsProcessing(false);
+        setProcessingStatus('');
+        setCurrentStep(null);
+        setEditableParseResult(null);
+        message.warning(reason);
       });
 
       eventSource.addEventListener('complete', (event) => {
@@ -564,6 +628,11 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       });
 
       eventSource.addEventListener('error', (event) => {
+        // 连接被断开时 EventSource 会带着 Last-Event-ID 自动重连，服务端从断点继续推送
+        if (!event.data && eventSource.readyState === EventSource.CONNECTING) {
+          console.warn('Plan SSE reconnecting...');
+          return;
+        }
         console.error('Plan SSE error:', event);
         eventSource.close();
         setSseConnections(prev => ({ ...prev, plan: null }));
@@ -678,7 +747,7 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       const { task_id } = await startResponse.json();
       
       // 第二步：监听进度事件
-      const eventSource = new EventSource(getApiUrl(`/api/nl-execute-events/${task_id}`));
+      const eventSource = new EventSource(getApiUrl(`/api/nl-execute-events/${task_id}?delta=1&chunked=1`));
       
       // 保存连接引用
       setSseConnections(prev => ({ ...prev, execute: eventSource }));
@@ -686,18 +755,79 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       
       setProcessingStatus('Executing selected plan...');
 
-      eventSource.addEventListener('progress', (event) => {
-        const snap = JSON.parse(event.data);
+      subscribeProgress(eventSource, (snap) => {
         setProcessingStatus(snap.description || 'Executing...');
         
         if (snap.logs && snap.logs.length > 0) {
           console.log('Execute logs:', snap.logs);
         }
+      }, (reason) => {
+        setSseConnections(prev => ({ ...prev, execute: null }));
+        setActiveTasks(prev => ({ ...prev, execute: null }));
+        setIsProcessing(false);
+        setProcessingStatus('');
+        setCurrentStep(null);
+        setEditableParseResult(null);
+        message.warning(reason);
+      });
+
+      // 结果表按行分块推送：result-start 之后是若干 result-chunk，complete 只标记结束
+      // 分块先收进数组列表，展示时再拼接；第一块到达就显示部分结果，之后最多每 500ms 刷新一次
+      let chunkedResult = null;
+      let partialTimer = null;
+      const resultMessageId = Date.now() + 1;
+      const chunkedTable = () => ({
+        columns: chunkedResult.columns,
+        index: chunkedResult.indexChunks.flat(),
+        data: chunkedResult.dataChunks.flat(),
+      });
+      const upsertResultMessage = (resultMessage) => {
+        setConversations(prev => (prev.some(m => m.id === resultMessage.id)
+          ? prev.map(m => (m.id === resultMessage.id ? resultMessage : m))
+          : [...prev, resultMessage]));
+      };
+      const showPartialResult = () => {
+        partialTimer = null;
+        if (!chunkedResult) return;
+        upsertResultMessage({
+          id: resultMessageId,
+          type: 'assistant',
+          content: `Receiving results (${chunkedResult.rows}/${chunkedResult.total} rows)...`,
+          output: JSON.stringify(chunkedTable()),
+          timestamp: new Date().toLocaleTimeString(),
+          relatedDocs: []
+        });
+      };
+      eventSource.addEventListener('result-start', (event) => {
+        const head = JSON.parse(event.data);
+        // 断线重连时服务端会从头重发所有分块
+        chunkedResult = { columns: head.columns, indexChunks: [], dataChunks: [], rows: 0, total: head.total_rows };
+        setProcessingStatus(`Receiving results (0/${head.total_rows} rows)...`);
+      });
+      eventSource.addEventListener('result-chunk', (event) => {
+        if (!chunkedResult) return;
+        const chunk = JSON.parse(event.data);
+        chunkedResult.indexChunks.push(chunk.index);
+        chunkedResult.dataChunks.push(chunk.data);
+        chunkedResult.rows += chunk.data.length;
+        setProcessingStatus(`Receiving results (${chunkedResult.rows}/${chunkedResult.total} rows)...`);
+        if (chunkedResult.dataChunks.length === 1) {
+          showPartialResult();
+        } else if (!partialTimer) {
+          partialTimer = setTimeout(showPartialResult, 500);
+        }
       });
 
       eventSource.addEventListener('complete', (event) => {
         const snap = JSON.parse(event.data);
         console.log('Execute complete event:', snap);
+        if (partialTimer) {
+          clearTimeout(partialTimer);
+          partialTimer = null;
+        }
+        if (snap.chunked && chunkedResult) {
+          snap.result = chunkedTable();
+        }
         
         if (snap.result ) {
           // 处理执行结果数据
@@ -710,9 +840,9 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
             relatedDocs = snap.result.result_data.doc || [];
           }
           
-          // 添加执行结果到对话记录
+          // 添加执行结果到对话记录（分块接收时替换之前显示的部分结果）
           const resultMessage = {
-            id: Date.now() + 1,
+            id: resultMessageId,
             type: 'assistant',
             content: 'Here are the results from executing your query:',
             output: JSON.stringify(outputData),
@@ -720,7 +850,7 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
             relatedDocs: relatedDocs
           };
           
-          setConversations(prev => [...prev, resultMessage]);
+          upsertResultMessage(resultMessage);
           
           // 重置所有状态，准备下一个查询
           setCurrentStep(null);
@@ -742,7 +872,14 @@ const NaturalLanguagePanel = ({ documents, onRowClick, projectInfo }) => {
       });
 
       eventSource.addEventListener('error', (event) => {
+        // 连接被断开时 EventSource 会带着 Last-Event-ID 自动重连，服务端从断点继续推送
+        if (!event.data && eventSource.readyState === EventSource.CONNECTING) {
+          console.warn('Execute SSE reconnecting...');
+          return;
+        }
         console.error('Execute SSE error:', event);
+        clearTimeout(partialTimer);
+        chunkedResult = null;
         eventSource.close();
         setSseConnections(prev => ({ ...prev, execute: null }));
         setActiveTasks(prev => ({ ...prev, execute: null }));
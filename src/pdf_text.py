@@ -0,0 +1,256 @@
+"""Background extraction of PDF text layers, cached by content hash.
+
+Uploaded PDFs used to come back with ``content: None`` and every consumer that
+wanted their text had to parse them again. ``PdfTextStore`` runs the parse
+once per distinct file on a process pool (text extraction is CPU bound and
+holds the GIL) and writes the result to ``<cache_dir>/<sha256>.txt``. Because
+the cache is keyed by the catalog's content hash it is shared by duplicate
+copies, survives renames and restarts, and needs no invalidation: different
+bytes mean a different key.
+
+A PDF that cannot be parsed leaves a ``<sha256>.failed`` marker holding the
+error, so it is not retried on every restart.
+
+Extraction uses the optional ``pypdf`` package; without it the store reports
+``available = False`` and every document's state as ``'unavailable'``.
+
+The pool forks its workers, so ``start()`` must run during startup before the
+app creates threads or opens SQLite connections: a child forked later would
+inherit locks and connection state from the middle of someone else's work.
+For the same reason a pool broken by a crashed worker is not forked again
+from a request thread; extraction stays unavailable until the app restarts.
+
+States reported by ``state()``:
+  ready        text layer cached
+  pending      queued or being extracted
+  failed       extraction raised; see ``error()``
+  unavailable  pypdf is not installed, or the pool broke
+  missing      never submitted in this process and not cached
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # text layers are simply not produced
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+# Extraction processes; each one parses a whole PDF at a time.
+PDF_TEXT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+# Written between pages so page boundaries stay recoverable from the text.
+PAGE_SEPARATOR = '\n\f\n'
+
+
+def _extract_pdf_text(pdf_path: str, out_path: str) -> int:
+    """Worker process entry point: write the text of every page to out_path.
+
+    Writes to a temp file first so readers never see a half-written layer.
+    Returns the page count.
+    """
+    reader = PdfReader(pdf_path)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            for i, page in enumerate(reader.pages):
+                if i:
+                    out.write(PAGE_SEPARATOR)
+                out.write(page.extract_text() or '')
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(reader.pages)
+
+
+class PdfTextStore:
+    """Content-hash keyed cache of PDF text layers filled by a process pool."""
+
+    def __init__(self, cache_dir: str, workers: int = PDF_TEXT_WORKERS):
+        self.cache_dir = cache_dir
+        self.workers = max(1, workers)
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._broken = False
+        self._jobs: Dict[str, Future] = {}
+        # progress counters for this process
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+
+    @property
+    def available(self) -> bool:
+        return PdfReader is not None and not self._broken
+
+    # ---- cache files --------------------------------------------------
+    def text_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, content_hash + '.txt')
+
+    def _failed_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, content_hash + '.failed')
+
+    def read_text(self, content_hash: Optional[str]) -> Optional[str]:
+        """Return the cached text layer, or None when it is not ready."""
+        if not content_hash:
+            return None
+        try:
+            with open(self.text_path(content_hash), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def error(self, content_hash: str) -> Optional[str]:
+        try:
+            with open(self._failed_path(content_hash), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def state(self, content_hash: Optional[str]) -> str:
+        if content_hash and os.path.exists(self.text_path(content_hash)):
+            return 'ready'
+        if not self.available:
+            return 'unavailable'
+        if not content_hash:
+            return 'missing'
+        with self._lock:
+            if content_hash in self._jobs:
+                return 'pending'
+        if os.path.exists(self._failed_path(content_hash)):
+            return 'failed'
+        return 'missing'
+
+    # ---- extraction ---------------------------------------------------
+    def _executor(self) -> ProcessPoolExecutor:
+        """Create the pool on first use (lock held).
+
+        Fork, not spawn: spawned children re-run the importing script (the
+        Flask app, its startup and this pool) as ``__mp_main__``. A fork pool
+        starts all of its workers on the first submit, so call ``start()``
+        first thing during startup (see the module docstring).
+        """
+        if self._broken:
+            raise BrokenProcessPool('PDF text pool is broken')
+        if self._pool is None:
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(method)
+            )
+        return self._pool
+
+    def start(self) -> None:
+        """Start the worker processes now instead of on the first PDF."""
+        if not self.available:
+            return
+        with self._lock:
+            future = self._executor().submit(os.getpid)
+        future.result()
+
+    def submit(self, pdf_path: str, content_hash: Optional[str]) -> str:
+        """Queue text extraction for a stored PDF unless it is cached, queued or failed.
+
+        Returns the document's state afterwards.
+        """
+        state = self.state(content_hash)
+        if state != 'missing' or not content_hash:
+            return state
+        with self._lock:
+            if content_hash in self._jobs:
+                return 'pending'
+            try:
+                future = self._executor().submit(_extract_pdf_text, pdf_path, self.text_path(content_hash))
+            except BrokenProcessPool:
+                self._mark_broken()
+                return 'unavailable'
+            self._jobs[content_hash] = future
+            self._submitted += 1
+        future.add_done_callback(lambda f, h=content_hash: self._finished(h, f))
+        return 'pending'
+
+    def submit_many(self, items: Iterable[Tuple[str, Optional[str]]]) -> int:
+        """Queue (pdf_path, content_hash) pairs; returns how many were newly queued."""
+        queued = 0
+        for pdf_path, content_hash in items:
+            if self.state(content_hash) == 'missing' and self.submit(pdf_path, content_hash) == 'pending':
+                queued += 1
+        return queued
+
+    def _mark_broken(self) -> None:
+        """Drop the pool for good (lock held)."""
+        if not self._broken:
+            logger.error('PDF text pool broke; text extraction disabled until restart')
+        self._broken = True
+        self._pool = None
+
+    def _finished(self, content_hash: str, future: Future) -> None:
+        exc = None if future.cancelled() else future.exception()
+        if isinstance(exc, BrokenProcessPool):
+            # a worker died (not necessarily on this PDF); forking a new pool now
+            # would copy a threaded process, so stop extracting until restart
+            with self._lock:
+                self._mark_broken()
+                self._jobs.pop(content_hash, None)
+                self._completed += 1
+                self._failed += 1
+            return
+        if exc is not None:
+            with open(self._failed_path(content_hash), 'w', encoding='utf-8') as f:
+                f.write(f"{type(exc).__name__}: {exc}")
+        with self._lock:
+            self._jobs.pop(content_hash, None)
+            self._completed += 1
+            if exc is not None:
+                self._failed += 1
+
+    def progress(self) -> Dict:
+        """Counters since startup plus the number of cached text layers."""
+        with self._lock:
+            pending = len(self._jobs)
+            submitted, completed, failed = self._submitted, self._completed, self._failed
+        cached = sum(1 for name in os.listdir(self.cache_dir) if name.endswith('.txt'))
+        return {
+            'available': self.available,
+            'submitted': submitted,
+            'completed': completed,
+            'failed': failed,
+            'pending': pending,
+            'cached': cached,
+            'percent': round(100.0 * completed / submitted, 1) if submitted else 100.0,
+        }
+
+    # ---- maintenance --------------------------------------------------
+    def prune(self, keep_hashes: Set[str]) -> int:
+        """Delete cached layers and failure markers of content no longer stored."""
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            content_hash, ext = os.path.splitext(name)
+            if ext in ('.txt', '.failed') and content_hash not in keep_hashes:
+                with self._lock:
+                    if content_hash in self._jobs:
+                        continue
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        return removed
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+__all__ = [
+    'PdfTextStore',
+    'PDF_TEXT_WORKERS',
+    'PAGE_SEPARATOR',
+]
@@ -0,0 +1,168 @@
+"""LRU + TTL cache for results of expensive, deterministic-enough pipeline stages.
+
+``fun1.parse_nl`` and ``fun1.analysis_to_plan_list`` are LLM pipelines that
+take seconds to minutes, and users re-run identical queries against the same
+indexes all the time (refreshing the page, shared links, trying another plan
+for the same question). ``ResultCache`` remembers their results.
+
+Keys are built by ``cache_key(stage, *parts)`` from JSON-serialisable parts;
+dict keys and sets are put in canonical order, so logically equal inputs get
+the same key. ``normalize_query`` folds the differences in free text that do
+not change a query's meaning (Unicode compatibility forms, whitespace).
+
+Entries expire ``ttl_seconds`` after they were stored and the least recently
+used ones are dropped beyond ``max_entries`` -- or, when a ``size_of``
+function is given, beyond ``max_bytes`` of estimated value size; a single
+value larger than that is not stored at all. An entry can carry tags (e.g.
+the index names it depends on) so ``discard_tag`` can drop everything that
+depended on an index that was rebuilt or deleted. Values are deep-copied on
+the way in and out, so callers may mutate what they get back; with
+``copy_values=False`` (large DataFrames) they are shared and must be treated
+as read-only.
+
+Only standard library modules are used.
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+_MISSING = object()
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """NFKC-normalise a query and collapse runs of whitespace."""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', query or '')).strip()
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted((_canonical(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True, default=str))
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def cache_key(stage: str, *parts: Any) -> str:
+    """Stable key for stage and its inputs."""
+    payload = json.dumps([stage, _canonical(list(parts))], sort_keys=True, ensure_ascii=False, default=str)
+    return f"{stage}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class ResultCache:
+    """Thread-safe LRU mapping with per-entry expiry and tags."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_bytes: Optional[int] = None, size_of: Optional[Callable[[Any], int]] = None,
+                 copy_values: bool = True):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.copy_values = copy_values
+        self._lock = threading.Lock()
+        # key -> (expires_at, tags, value, size)
+        self._entries: "OrderedDict[str, Tuple[float, frozenset, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._drop(key)
+                self.evicted += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[2]
+        return copy.deepcopy(value) if self.copy_values else value
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """(True, value) on a hit, (False, None) on a miss; for values that may be None."""
+        value = self.get(key, _MISSING)
+        return (False, None) if value is _MISSING else (True, value)
+
+    def _drop(self, key: str) -> bool:
+        """Remove key (lock held)."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[3]
+        return True
+
+    def put(self, key: str, value: Any, tags: Iterable[str] = ()) -> bool:
+        """Store value under key; False if it is too large to cache."""
+        size = self.size_of(value) if self.size_of is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        if self.copy_values:
+            value = copy.deepcopy(value)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, frozenset(tags), value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evicted += 1
+        return True
+
+    def discard(self, key: str) -> bool:
+        with self._lock:
+            return self._drop(key)
+
+    def discard_tag(self, tag: str) -> int:
+        """Drop every entry tagged with tag; returns how many were dropped."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if tag in entry[1]]
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evicted': self.evicted,
+            }
+
+
+__all__ = [
+    'ResultCache',
+    'cache_key',
+    'normalize_query',
+    'DEFAULT_MAX_ENTRIES',
+    'DEFAULT_TTL_SECONDS',
+]
@@ -0,0 +1,162 @@
+"""Coalescing of identical concurrent requests ("single flight").
+
+When several clients send the same expensive request at the same time --
+five analysts starting the same NL query during a demo, a dashboard fired
+from several tabs -- the backend used to run that many identical LLM
+pipelines. ``SingleFlight`` lets the first request do the work and attaches
+the others to it:
+
+* ``do(key, fn)`` is for synchronous endpoints. The first caller for a key
+  runs ``fn()``; callers arriving while it runs wait for it and get the same
+  return value (or the same exception). Nothing is remembered afterwards --
+  this is not a cache.
+* ``attach(key, start, alive)`` is for background tasks. The first caller runs
+  ``start()``, which launches the work and returns a handle (a task id) that
+  later callers receive as long as ``alive(handle)`` holds. The task calls
+  ``release(key, handle)`` when it finishes; a task that never runs (cancelled
+  while queued) is dropped with ``release_handle(handle)``. The key is
+  reserved under the lock but ``start()`` and ``alive()`` run outside it, so
+  their I/O (creating the task record) only holds up callers of the same key.
+
+Keys are built by the caller, e.g. with ``result_cache.cache_key``. Only
+standard library modules are used.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class _Starting:
+    """Placeholder for a key whose start() is running."""
+    __slots__ = ('done', 'released')
+
+    def __init__(self):
+        self.done = threading.Event()
+        # handles released before start() returned them
+        self.released = set()
+
+
+class SingleFlight:
+    """Per-key deduplication of in-flight work."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._handles: Dict[str, Any] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn once for all concurrent callers with key; returns (value, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.started += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.value, False
+
+    def attach(self, key: str, start: Callable[[], Any],
+               alive: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+        """Return (handle, shared): the live handle for key, or a new one from start().
+
+        The key is reserved before start() runs, so concurrent callers
+        cannot both start; they wait for its handle instead. Keep start()
+        short (queue the work, do not run it). If it raises, nothing is
+        registered and the waiting callers try again.
+        """
+        while True:
+            with self._lock:
+                current = self._handles.get(key)
+                if current is None:
+                    starting = self._handles[key] = _Starting()
+                    break
+            if isinstance(current, _Starting):
+                current.done.wait()
+                continue
+            if alive is None or alive(current):
+                with self._lock:
+                    self.coalesced += 1
+                return current, True
+            with self._lock:
+                if self._handles.get(key) == current:
+                    del self._handles[key]
+        try:
+            handle = start()
+        except BaseException:
+            with self._lock:
+                del self._handles[key]
+            starting.done.set()
+            raise
+        with self._lock:
+            if handle in starting.released:
+                del self._handles[key]
+            else:
+                self._handles[key] = handle
+            self.started += 1
+        starting.done.set()
+        return handle, False
+
+    def release(self, key: str, handle: Any = None) -> None:
+        """Forget key's handle (only if it is still handle, when one is given)."""
+        with self._lock:
+            current = self._handles.get(key)
+            if isinstance(current, _Starting):
+                if handle is not None:
+                    current.released.add(handle)
+            elif key in self._handles and (handle is None or current == handle):
+                del self._handles[key]
+
+    def release_handle(self, handle: Any) -> int:
+        """Forget every key whose handle is handle; returns how many were dropped."""
+        with self._lock:
+            keys = []
+            for key, value in self._handles.items():
+                if isinstance(value, _Starting):
+                    value.released.add(handle)
+                elif value == handle:
+                    keys.append(key)
+            for key in keys:
+                del self._handles[key]
+            return len(keys)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'in_flight': len(self._calls) + len(self._handles),
+                'started': self.started,
+                'coalesced': self.coalesced,
+            }
+
+
+__all__ = [
+    'SingleFlight',
+]
@@ -0,0 +1,136 @@
+"""Content-negotiated encodings for result tables.
+
+``jsonify(df.to_dict(orient="split"))`` first turns every cell into a Python
+object and then walks those objects with the stdlib ``json`` encoder; for
+large results in /api/sql, /api/nl, the operator endpoints and the execute
+completion event that is where the request's CPU time goes. This module
+offers cheaper encodings of the same table:
+
+  json      the legacy ``to_dict`` + ``json`` path (default, unchanged output)
+  fastjson  the same ``split`` shape encoded by pandas' vectorised C encoder
+            (``DataFrame.to_json``); NaN becomes null and timestamps ISO 8601
+  ndjson    one JSON header line, then one JSON object per row, streamed in
+            chunks so the UI can render rows while the rest is still coming
+  arrow     an Arrow IPC stream, for bulk/programmatic clients (needs the
+            optional ``pyarrow`` package; without it ``fastjson`` is used)
+
+``negotiate(format_param, accept)`` picks one from a ``?format=`` value or the
+Accept header. ``iter_split_chunks`` encodes the rows of the split shape a
+chunk at a time, for the chunked execute result stream. See
+bench_table_encoding.py for rows/s and bytes per format.
+"""
+from __future__ import annotations
+
+import json
+from typing import Dict, Iterator, Optional
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional; arrow requests fall back to fastjson
+    pa = None
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+FORMATS = ('json', 'fastjson', 'ndjson', 'arrow')
+# Accept header media types, most specific first.
+_ACCEPT_FORMATS = (
+    (ARROW_MIMETYPE, 'arrow'),
+    (NDJSON_MIMETYPE, 'ndjson'),
+    ('application/jsonl', 'ndjson'),
+)
+NDJSON_CHUNK_ROWS = 2000
+# Digits kept for floats by the vectorised encoder (pandas defaults to 10).
+DOUBLE_PRECISION = 15
+
+
+def negotiate(format_param: Optional[str] = None, accept: Optional[str] = None) -> str:
+    """Encoding for a request; an explicit ``format`` wins over Accept. Unknown values mean json."""
+    if format_param:
+        fmt = format_param.strip().lower()
+        if fmt in FORMATS:
+            return 'fastjson' if fmt == 'arrow' and pa is None else fmt
+        return 'json'
+    for mimetype, fmt in _ACCEPT_FORMATS:
+        if accept and mimetype in accept:
+            return 'fastjson' if fmt == 'arrow' and pa is None else fmt
+    return 'json'
+
+
+def mimetype(fmt: str) -> str:
+    return {'ndjson': NDJSON_MIMETYPE, 'arrow': ARROW_MIMETYPE}.get(fmt, JSON_MIMETYPE)
+
+
+def split_json(df) -> str:
+    """The ``orient="split"`` JSON of df, encoded by pandas without Python objects per cell."""
+    return df.to_json(orient='split', date_format='iso', double_precision=DOUBLE_PRECISION,
+                      default_handler=str)
+
+
+def json_with_table(fields: Dict, table_json: str, key: str = 'table') -> str:
+    """JSON object of fields plus key -> an already encoded JSON value."""
+    head = json.dumps(fields, ensure_ascii=False, default=str)
+    sep = ', ' if len(head) > 2 else ''
+    return f'{head[:-1]}{sep}{json.dumps(key)}: {table_json}}}'
+
+
+def iter_ndjson(df, header: Optional[Dict] = None, chunk_rows: int = NDJSON_CHUNK_ROWS) -> Iterator[str]:
+    """A header line (``columns``, ``total_rows`` and header) followed by one object per row."""
+    meta = dict(header or {})
+    meta.update(columns=[str(c) for c in df.columns], total_rows=len(df))
+    yield json.dumps(meta, ensure_ascii=False, default=str) + '\n'
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        lines = chunk.to_json(orient='records', lines=True, date_format='iso',
+                              double_precision=DOUBLE_PRECISION, default_handler=str)
+        if lines:
+            yield lines if lines.endswith('\n') else lines + '\n'
+
+
+def iter_split_chunks(df, chunk_rows: int = NDJSON_CHUNK_ROWS) -> Iterator[str]:
+    """``{"offset", "index", "data"}`` JSON objects covering df's rows, chunk_rows at a time.
+
+    Concatenating the index and data lists of all chunks gives the ``index``
+    and ``data`` of ``split_json(df)``.
+    """
+    chunk_rows = max(1, chunk_rows)
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        index = json.dumps(chunk.index.tolist(), ensure_ascii=False, default=str)
+        data = chunk.to_json(orient='values', date_format='iso', double_precision=DOUBLE_PRECISION,
+                             default_handler=str)
+        yield f'{{"offset": {start}, "index": {index}, "data": {data}}}'
+
+
+def arrow_stream(df) -> bytes:
+    """df (with its index) as an Arrow IPC stream.
+
+    Object columns Arrow cannot type (mixed values) are sent as strings.
+    """
+    if pa is None:
+        raise RuntimeError('pyarrow is not installed')
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        mixed = {c: str for c in df.columns if df[c].dtype == object}
+        table = pa.Table.from_pandas(df.astype(mixed), preserve_index=True)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+__all__ = [
+    'negotiate',
+    'mimetype',
+    'split_json',
+    'json_with_table',
+    'iter_ndjson',
+    'iter_split_chunks',
+    'arrow_stream',
+    'FORMATS',
+    'JSON_MIMETYPE',
+    'NDJSON_MIMETYPE',
+    'ARROW_MIMETYPE',
+]
@@ -0,0 +1,133 @@
+"""Paging and column projection for result tables sent to the frontend.
+
+The operator endpoints returned the whole ``show_table_with_source``
+DataFrame as ``to_dict(orient="split")`` -- every row and every column,
+including the wide ``_source*`` provenance columns -- so a 50k-row extraction
+became a JSON body of 100+ MB that the browser then had to parse.
+
+``table_options()`` reads the paging options of a request:
+
+  offset           first row to return (default 0)
+  limit            number of rows to return (default: all)
+  columns          only these columns, in this order
+  exclude_columns  drop these columns
+  omit_source      drop every column whose name starts with ``_source``
+
+Lists may be given as JSON arrays (request body) or comma separated strings
+(query string). ``table_page(df, options)`` applies them *before* converting
+to the split format, so the cost follows the size of the page rather than of
+the table, and returns a ``page`` block describing what was sent. Without
+options the full table goes out exactly as before.
+
+pandas is only used through the DataFrame passed in.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+TABLE_OPTION_KEYS = ('offset', 'limit', 'columns', 'exclude_columns', 'omit_source')
+SOURCE_COLUMN_PREFIX = '_source'
+
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+def _as_list(value: Any) -> Optional[List[str]]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(',') if part.strip()]
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    raise ValueError(f'expected a list of column names, got {value!r}')
+
+
+def _as_count(name: str, value: Any) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be an integer, got {value!r}')
+    if count < 0:
+        raise ValueError(f'{name} must not be negative')
+    return count
+
+
+def table_options(*sources: Optional[Mapping]) -> Dict:
+    """Paging options from the given mappings (query args, JSON body); later sources win.
+
+    Raises ValueError for malformed values.
+    """
+    raw: Dict[str, Any] = {}
+    for source in sources:
+        if not source:
+            continue
+        for key in TABLE_OPTION_KEYS:
+            if key in source:
+                raw[key] = source.get(key)
+    omit = raw.get('omit_source')
+    return {
+        'offset': _as_count('offset', raw.get('offset')) or 0,
+        'limit': _as_count('limit', raw.get('limit')),
+        'columns': _as_list(raw.get('columns')),
+        'exclude_columns': _as_list(raw.get('exclude_columns')),
+        'omit_source': omit is True or (isinstance(omit, str) and omit.lower() in _TRUE),
+    }
+
+
+def has_options(options: Mapping) -> bool:
+    return bool(options['offset'] or options['limit'] is not None or options['columns']
+                or options['exclude_columns'] or options['omit_source'])
+
+
+def project_columns(columns: Sequence, include: Optional[Sequence[str]] = None,
+                    exclude: Optional[Sequence[str]] = None, omit_source: bool = False) -> List:
+    """The columns to send, in order; unknown names in include are ignored."""
+    by_name = {str(c): c for c in columns}
+    if include:
+        selected = [by_name[name] for name in include if name in by_name]
+    else:
+        selected = list(columns)
+    dropped = set(exclude or ())
+    return [c for c in selected
+            if str(c) not in dropped and not (omit_source and str(c).startswith(SOURCE_COLUMN_PREFIX))]
+
+
+def select_page(df, options: Optional[Mapping] = None) -> Tuple[Any, Dict]:
+    """Return (DataFrame of the selected rows and columns, page description)."""
+    total_rows = len(df)
+    if not options or not has_options(options):
+        return df, {
+            'offset': 0, 'limit': None, 'total_rows': total_rows, 'total_columns': len(df.columns),
+            'has_more': False,
+        }
+    offset = min(options['offset'], total_rows)
+    end = total_rows if options['limit'] is None else min(total_rows, offset + options['limit'])
+    columns = project_columns(df.columns, options['columns'], options['exclude_columns'], options['omit_source'])
+    page = df.iloc[offset:end]
+    if len(columns) != len(df.columns):
+        page = page[columns]
+    return page, {
+        'offset': offset,
+        'limit': options['limit'],
+        'total_rows': total_rows,
+        'total_columns': len(df.columns),
+        'has_more': end < total_rows,
+    }
+
+
+def table_page(df, options: Optional[Mapping] = None) -> Tuple[Dict, Dict]:
+    """Return (split dict of the selected rows and columns, page description)."""
+    page, meta = select_page(df, options)
+    return page.to_dict(orient='split'), meta
+
+
+__all__ = [
+    'table_options',
+    'table_page',
+    'select_page',
+    'project_columns',
+    'has_options',
+    'TABLE_OPTION_KEYS',
+    'SOURCE_COLUMN_PREFIX',
+]
@@ -0,0 +1,119 @@
+"""In-process change notification for NL tasks.
+
+The SSE endpoints used to call ``snapshot(task_id)`` and ``json.dumps`` the
+result every 300 ms per open stream just to find out whether anything had
+changed. With this bus the task writers (``init_task`` / ``update_task`` /
+``complete_task``) publish a per-task version bump, and stream generators
+block on that task's condition until the version moves: an idle stream costs
+nothing and a change reaches its subscribers as soon as the writer returns.
+
+Only standard library modules are used. Each task has its own Condition (all
+sharing one lock), so an update wakes only the streams of that task.
+
+The persistence functions live in the quest package, which also calls them
+internally (e.g. progress messages from ``parse_nl``). ``install()`` swaps
+publishing wrappers into the persistence module and into any loaded quest
+module that imported the functions by name, so those updates are announced
+too. Subscribers should still re-check on their heartbeat timeout as a safety
+net for writers that bypass the wrappers.
+"""
+from __future__ import annotations
+
+import functools
+import sys
+import threading
+from types import ModuleType
+from typing import Callable, Dict, Iterable, Optional
+
+# Writers that mark a task as changed.
+PUBLISHING_FUNCTIONS = ('init_task', 'update_task', 'complete_task')
+
+
+class TaskEventBus:
+    """Per-task version counters with blocking waits."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._conditions: Dict[str, threading.Condition] = {}
+
+    def _condition(self, task_id: str) -> threading.Condition:
+        """Return the task's condition (lock held)."""
+        cond = self._conditions.get(task_id)
+        if cond is None:
+            cond = self._conditions[task_id] = threading.Condition(self._lock)
+        return cond
+
+    def publish(self, task_id: str) -> int:
+        """Mark task_id as changed and wake its subscribers; returns the new version."""
+        with self._lock:
+            version = self._versions.get(task_id, 0) + 1
+            self._versions[task_id] = version
+            self._condition(task_id).notify_all()
+        return version
+
+    def version(self, task_id: str) -> int:
+        with self._lock:
+            return self._versions.get(task_id, 0)
+
+    def wait(self, task_id: str, seen: int, timeout: Optional[float] = None) -> int:
+        """Block until task_id's version differs from seen or timeout expires.
+
+        Returns the current version (equal to seen on timeout). Read the
+        version *before* taking a snapshot and pass it here afterwards, so a
+        change that lands in between is never missed.
+        """
+        with self._lock:
+            cond = self._condition(task_id)
+            cond.wait_for(lambda: self._versions.get(task_id, 0) != seen, timeout)
+            return self._versions.get(task_id, 0)
+
+    def forget(self, task_id: str) -> None:
+        """Drop a task's counter and wake anything still waiting on it."""
+        with self._lock:
+            self._versions.pop(task_id, None)
+            cond = self._conditions.pop(task_id, None)
+            if cond is not None:
+                cond.notify_all()
+
+    # ---- wiring -------------------------------------------------------
+    def publishing(self, func: Callable) -> Callable:
+        """Wrap a writer ``func(task_id, ...)`` so every call publishes task_id."""
+        if getattr(func, '__task_event_bus__', None) is self:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(task_id, *args, **kwargs):
+            try:
+                return func(task_id, *args, **kwargs)
+            finally:
+                self.publish(task_id)
+
+        wrapper.__task_event_bus__ = self
+        return wrapper
+
+    def install(self, module: ModuleType, names: Iterable[str] = PUBLISHING_FUNCTIONS,
+                package_prefix: Optional[str] = None) -> Dict[str, Callable]:
+        """Replace writers on module (and on loaded modules that imported them) with publishing wrappers.
+
+        ``package_prefix`` defaults to the top-level package of module.
+        Returns {name: wrapper} for the caller's own bindings.
+        """
+        prefix = package_prefix or module.__name__.split('.')[0] + '.'
+        wrappers = {}
+        for name in names:
+            original = getattr(module, name)
+            wrapper = self.publishing(original)
+            wrappers[name] = wrapper
+            for mod_name, mod in list(sys.modules.items()):
+                if mod is None or not (mod is module or mod_name.startswith(prefix)):
+                    continue
+                if getattr(mod, name, None) is original:
+                    setattr(mod, name, wrapper)
+        return wrappers
+
+
+__all__ = [
+    'TaskEventBus',
+    'PUBLISHING_FUNCTIONS',
+]
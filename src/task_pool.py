@@ -0,0 +1,171 @@
+"""Bounded worker pool with admission control for NL background tasks.
+
+``/api/nl-parse-start``, ``/api/nl-plan-start`` and ``/api/nl-execute-start``
+used to start one daemon thread per request, so a burst of queries ran that
+many LLM pipelines at once. ``TaskPool`` runs at most ``max_workers`` jobs
+concurrently, keeps at most ``max_queue`` more waiting in FIFO order and
+rejects anything beyond that with ``TaskQueueFull``, which carries a
+Retry-After estimate derived from recent job durations.
+
+Queued jobs know their position; ``position(task_id)`` is 1 for the next job
+to start and 0 once a job is running. ``on_change(task_id)`` is called for
+every job whose position changed, so the caller can notify task streams.
+A job that raises -- even a ``BaseException`` such as a task cancellation --
+is logged and its worker moves on to the next job.
+
+Only standard library modules are used.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_DEPTH = 32
+# Used for Retry-After until a job has finished.
+INITIAL_JOB_SECONDS = 30.0
+# Weight of the newest job in the moving average of job durations.
+DURATION_SMOOTHING = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueueFull(Exception):
+    """The queue is at its depth limit; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: int, depth: int):
+        super().__init__(f'task queue is full ({depth} waiting), retry in {retry_after}s')
+        self.retry_after = retry_after
+        self.depth = depth
+
+
+class TaskPool:
+    """Fixed set of worker threads draining a bounded FIFO of jobs."""
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, max_queue: int = DEFAULT_QUEUE_DEPTH,
+                 on_change: Optional[Callable[[str], None]] = None, name: str = 'nl-task'):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.on_change = on_change
+        self.name = name
+        self._cond = threading.Condition()
+        self._queue: Deque[Tuple[str, Callable[[], None]]] = deque()
+        self._running: Dict[str, float] = {}
+        self._threads = []
+        self._avg_seconds = INITIAL_JOB_SECONDS
+        self.completed = 0
+        self.rejected = 0
+
+    def _start_workers(self) -> None:
+        """Start the worker threads on first use (lock held)."""
+        while len(self._threads) < self.max_workers:
+            t = threading.Thread(target=self._work, name=f'{self.name}-{len(self._threads)}', daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up (lock held)."""
+        waves = (len(self._queue) + 1) / self.max_workers
+        return max(1, math.ceil(self._avg_seconds * waves))
+
+    def submit(self, task_id: str, fn: Callable[[], None],
+               prepare: Optional[Callable[[], None]] = None) -> int:
+        """Queue fn to run for task_id; returns its queue position (1 = next).
+
+        ``prepare`` (e.g. creating the task record) runs only once the job is
+        admitted and before any worker can pick it up. Raises TaskQueueFull
+        when ``max_queue`` jobs are already waiting.
+        """
+        with self._cond:
+            if len(self._queue) >= self.max_queue and len(self._running) >= self.max_workers:
+                self.rejected += 1
+                raise TaskQueueFull(self.retry_after(), len(self._queue))
+            if prepare is not None:
+                prepare()
+            self._start_workers()
+            self._queue.append((task_id, fn))
+            position = len(self._queue)
+            self._cond.notify()
+        return position
+
+    def cancel(self, task_id: str) -> bool:
+        """Drop a job that has not started yet; True if it was still queued."""
+        with self._cond:
+            for i, (queued_id, _) in enumerate(self._queue):
+                if queued_id == task_id:
+                    del self._queue[i]
+                    moved = [q for q, _ in list(self._queue)[i:]]
+                    break
+            else:
+                return False
+        self._notify(moved)
+        return True
+
+    def position(self, task_id: str) -> Optional[int]:
+        """1-based queue position, 0 while running, None if unknown to the pool."""
+        with self._cond:
+            if task_id in self._running:
+                return 0
+            for i, (queued_id, _) in enumerate(self._queue, 1):
+                if queued_id == task_id:
+                    return i
+        return None
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'running': len(self._running),
+                'queued': len(self._queue),
+                'max_queue': self.max_queue,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avg_seconds': round(self._avg_seconds, 2),
+            }
+
+    def _notify(self, task_ids) -> None:
+        if self.on_change is None:
+            return
+        for task_id in task_ids:
+            try:
+                self.on_change(task_id)
+            except Exception:
+                logger.exception('task pool on_change failed for %s', task_id)
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                task_id, fn = self._queue.popleft()
+                self._running[task_id] = time.monotonic()
+                moved = [queued_id for queued_id, _ in self._queue]
+            # the started job and every job behind it changed position
+            self._notify([task_id] + moved)
+            try:
+                fn()
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except Exception:
+                logger.exception('task %s failed', task_id)
+            except BaseException as e:
+                # e.g. task_registry.TaskCancelled from a job that does not catch it;
+                # the worker thread must survive it
+                logger.info('task %s stopped: %s', task_id, e)
+            finally:
+                with self._cond:
+                    elapsed = time.monotonic() - self._running.pop(task_id)
+                    self._avg_seconds += DURATION_SMOOTHING * (elapsed - self._avg_seconds)
+                    self.completed += 1
+
+
+__all__ = [
+    'TaskPool',
+    'TaskQueueFull',
+    'DEFAULT_WORKERS',
+    'DEFAULT_QUEUE_DEPTH',
+]
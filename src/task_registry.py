@@ -0,0 +1,540 @@
+"""In-process registry of NL task state with memory accounting and eviction.
+
+Task state used to live in quest's persistence module under ids built from
+``time.time()`` in milliseconds: two requests in the same millisecond shared
+(and overwrote) one record, and finished tasks -- including whole result
+DataFrames -- were kept for the life of the process.
+
+``TaskRegistry`` holds the records instead. ``new_task_id()`` hands out ids
+that cannot collide, ``init_task`` refuses to overwrite a live record, and
+every record carries an estimate of the memory its logs and result take.
+Completed tasks are evicted
+
+* ``ttl_seconds`` after they last changed,
+* least recently changed first, while more than ``max_tasks`` records or
+  more than ``max_bytes`` of accounted memory are held.
+
+Reads (``snapshot``, ``status``) do not count: an SSE client polling a hung
+task must not keep it alive.
+
+Running tasks are never evicted for size; a task that stopped reporting for
+``stale_seconds`` without completing (e.g. its pipeline died) is dropped as
+well. ``on_evict`` callbacks let stream engines and the event bus release
+their per-task state too.
+
+``cancel()`` marks a task cancelled. Cancellation is cooperative: the next
+``update_task`` for that task -- which quest calls between the steps of
+``solve_plan`` -- raises ``TaskCancelled`` in the worker, ``raise_if_cancelled``
+lets task code check between its own steps, and a late ``complete_task`` is
+discarded. ``TaskCancelled`` derives from ``BaseException`` so the broad
+``except Exception`` handlers in quest and the pipelines let it through.
+
+``attach_store()`` makes the registry write through to a durable
+``task_store.TaskStore`` shared by the server's worker processes. Snapshots
+are still served from memory; a task this process does not hold is loaded
+from the store on first access, a background thread applies changes other
+processes write to tasks held here (and reports them through
+``on_change`` callbacks, so their SSE streams wake up), and tasks whose
+process died are marked interrupted when the next process starts.
+
+``install()`` puts the registry's ``init_task`` / ``update_task`` /
+``complete_task`` / ``snapshot`` in place of quest's persistence functions,
+so progress quest writes internally lands here. The snapshot schema matches
+what the SSE endpoints sent before: task_id, description, started_at,
+updated_at, logs, result (plus status).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional
+
+from task_store import process_alive, process_id
+
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_TASKS = 500
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_STALE_SECONDS = 6 * 3600
+# How often the store is checked for writes by other processes.
+STORE_POLL_SECONDS = 0.2
+# How often records older than the TTL are pruned from the store.
+STORE_PRUNE_SECONDS = 600
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FUNCTIONS = ('init_task', 'update_task', 'complete_task', 'snapshot')
+
+
+class TaskCancelled(BaseException):
+    """Raised inside a task's worker once the task has been cancelled."""
+
+    def __init__(self, task_id: str):
+        super().__init__(f'task {task_id} was cancelled')
+        self.task_id = task_id
+
+
+def estimate_size(value: Any) -> int:
+    """Rough number of bytes held by a task result or log entry."""
+    if value is None:
+        return 0
+    memory_usage = getattr(value, 'memory_usage', None)
+    if callable(memory_usage):  # pandas DataFrame / Series
+        try:
+            usage = memory_usage(index=True, deep=True)
+            return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+        except Exception:
+            pass
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+def _timestamp() -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+
+
+class _Task:
+    __slots__ = ('task_id', 'description', 'started_at', 'updated_at', 'logs', 'logs_saved', 'result',
+                 'completed', 'cancelled', 'cancel_reason', 'nbytes', 'touched', 'owner', 'result_in_store')
+
+    def __init__(self, task_id: str, description: str):
+        self.task_id = task_id
+        self.description = description
+        self.started_at = self.updated_at = _timestamp()
+        self.logs: List[Dict] = []
+        # how many of logs have been handed to the store
+        self.logs_saved = 0
+        self.result: Any = None
+        self.completed = False  # finished: result stored or cancelled
+        self.cancelled = False
+        self.cancel_reason: Optional[str] = None
+        self.nbytes = estimate_size(description)
+        self.touched = time.monotonic()
+        self.owner = ''
+        # the result was written by another process and is not loaded yet
+        self.result_in_store = False
+
+    def record(self) -> Dict:
+        """Store record of this task with the log entries not saved yet (lock held)."""
+        logs = self.logs[self.logs_saved:]
+        self.logs_saved = len(self.logs)
+        return {
+            'task_id': self.task_id,
+            'description': self.description,
+            'started_at': self.started_at,
+            'updated_at': self.updated_at,
+            'logs': logs,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'cancel_reason': self.cancel_reason,
+            'has_result': self.result is not None,
+            'owner': self.owner,
+        }
+
+
+class TaskRegistry:
+    """Task records keyed by id, kept in least-recently-used order."""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_tasks: int = DEFAULT_MAX_TASKS,
+                 max_bytes: int = DEFAULT_MAX_BYTES, stale_seconds: float = DEFAULT_STALE_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.max_tasks = max_tasks
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._tasks: "OrderedDict[str, _Task]" = OrderedDict()
+        self._bytes = 0
+        self._on_evict: List[Callable[[str], None]] = []
+        self._on_change: List[Callable[[str], None]] = []
+        self.evicted = 0
+        self._store = None
+        self._store_poll = STORE_POLL_SECONDS
+        self._watcher_pid: Optional[int] = None
+        self.remote_changes = 0
+        # bound once so install() can hand out stable function objects
+        self.functions: Dict[str, Callable] = {name: getattr(self, name) for name in REGISTRY_FUNCTIONS}
+
+    # ---- ids ----------------------------------------------------------
+    def new_task_id(self) -> str:
+        """Millisecond prefix (keeps ids roughly time ordered) plus a random suffix."""
+        while True:
+            task_id = f"{int(time.time() * 1000)}-{secrets.token_hex(4)}"
+            with self._lock:
+                if task_id not in self._tasks:
+                    return task_id
+
+    # ---- persistence API ----------------------------------------------
+    def init_task(self, task_id: str, description: str) -> None:
+        with self._lock:
+            if task_id in self._tasks:
+                raise ValueError(f'task {task_id} already exists')
+            task = _Task(task_id, description)
+            task.owner = process_id()
+            self._tasks[task_id] = task
+            self._bytes += task.nbytes
+            record = task.record()
+            victims = self._evict()
+        self._persist(record)
+        self._notify_evicted(victims)
+
+    def update_task(self, task_id: str, description: str) -> None:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return
+            if task.cancelled:
+                raise TaskCancelled(task_id)
+            entry = {'time': _timestamp(), 'message': description}
+            size = estimate_size(description) + 32
+            task.description = description
+            task.updated_at = entry['time']
+            task.logs.append(entry)
+            self._charge(task, size)
+            self._touch(task)
+            record = task.record()
+        self._persist(record)
+
+    def complete_task(self, task_id: str, result: Any) -> None:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task.cancelled:
+                return
+            old = estimate_size(task.result)
+            task.result = result
+            task.completed = True
+            task.result_in_store = False
+            task.updated_at = _timestamp()
+            self._charge(task, estimate_size(result) - old)
+            self._touch(task)
+            record = task.record()
+            victims = self._evict()
+        self._persist(record, result)
+        self._notify_evicted(victims)
+
+    def snapshot(self, task_id: str) -> Optional[Dict]:
+        task = self._get(task_id)
+        if task is None:
+            return None
+        if task.result_in_store:
+            self._load_result(task)
+        with self._lock:
+            return {
+                'task_id': task.task_id,
+                'description': task.description,
+                'started_at': task.started_at,
+                'updated_at': task.updated_at,
+                'logs': list(task.logs),
+                'result': task.result,
+                'status': 'cancelled' if task.cancelled else 'completed' if task.completed else 'running',
+            }
+
+    def status(self, task_id: str) -> Optional[str]:
+        """'running', 'completed', 'cancelled', or None if unknown."""
+        task = self._get(task_id)
+        if task is None:
+            return None
+        with self._lock:
+            return 'cancelled' if task.cancelled else 'completed' if task.completed else 'running'
+
+    # ---- cancellation -------------------------------------------------
+    def cancel(self, task_id: str, reason: str = 'Cancelled') -> Optional[str]:
+        """Cancel a running task; returns its status before the call, None if unknown."""
+        task = self._get(task_id)
+        if task is None:
+            return None
+        with self._lock:
+            if task.completed:
+                return 'cancelled' if task.cancelled else 'completed'
+            task.cancelled = task.completed = True
+            task.cancel_reason = task.description = reason
+            task.updated_at = _timestamp()
+            task.logs.append({'time': task.updated_at, 'message': reason})
+            self._touch(task)
+            record = task.record()
+        self._persist(record)
+        return 'running'
+
+    # ---- watchers -----------------------------------------------------
+    def mark_watched(self, task_id: str) -> None:
+        """Note in the store that a client of this process watches task_id."""
+        if self._store is None:
+            return
+        try:
+            self._store.mark_watched(task_id)
+        except Exception:
+            logger.exception('could not mark task %s watched', task_id)
+
+    def watched_elsewhere(self, task_id: str, within: float) -> bool:
+        """Whether another process had a client on task_id in the last within seconds."""
+        if self._store is None:
+            return False
+        try:
+            seen = self._store.last_watched(task_id)
+        except Exception:
+            logger.exception('could not read watchers of task %s', task_id)
+            return False
+        return seen is not None and time.time() - seen <= within
+
+    def is_cancelled(self, task_id: str) -> bool:
+        # only asked by the process running the task, which holds it
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return task is not None and task.cancelled
+
+    def raise_if_cancelled(self, task_id: str) -> None:
+        if self.is_cancelled(task_id):
+            raise TaskCancelled(task_id)
+
+    # ---- accounting / eviction ----------------------------------------
+    def _charge(self, task: _Task, delta: int) -> None:
+        task.nbytes += delta
+        self._bytes += delta
+
+    def _touch(self, task: _Task) -> None:
+        task.touched = time.monotonic()
+        self._tasks.move_to_end(task.task_id)
+
+    def on_evict(self, callback: Callable[[str], None]) -> None:
+        self._on_evict.append(callback)
+
+    def on_change(self, callback: Callable[[str], None]) -> None:
+        """Call callback(task_id) when another process changed a task held here."""
+        self._on_change.append(callback)
+
+    def _notify_evicted(self, task_ids: List[str]) -> None:
+        """Run on_evict callbacks, outside the registry lock."""
+        for task_id in task_ids:
+            for callback in self._on_evict:
+                callback(task_id)
+
+    def _pop(self, task_id: str) -> bool:
+        task = self._tasks.pop(task_id, None)
+        if task is None:
+            return False
+        self._bytes -= task.nbytes
+        self.evicted += 1
+        return True
+
+    def _evict(self) -> List[str]:
+        """Drop expired tasks, then LRU completed ones while over a cap (lock held).
+
+        Returns the evicted ids; the caller runs _notify_evicted() after
+        releasing the lock.
+        """
+        now = time.monotonic()
+        victims = []
+        for task in self._tasks.values():
+            idle = now - task.touched
+            if (task.completed and idle > self.ttl_seconds) or idle > self.stale_seconds:
+                victims.append(task.task_id)
+        count, nbytes = len(self._tasks) - len(victims), self._bytes - sum(
+            self._tasks[t].nbytes for t in victims)
+        for task in self._tasks.values():  # least recently used first
+            if count <= self.max_tasks and nbytes <= self.max_bytes:
+                break
+            if task.completed and task.task_id not in victims:
+                victims.append(task.task_id)
+                count -= 1
+                nbytes -= task.nbytes
+        for task_id in victims:
+            self._pop(task_id)
+        return victims
+
+    def evict_expired(self) -> List[str]:
+        with self._lock:
+            victims = self._evict()
+        self._notify_evicted(victims)
+        return victims
+
+    def stats(self) -> Dict:
+        with self._lock:
+            running = sum(1 for t in self._tasks.values() if not t.completed)
+            return {
+                'tasks': len(self._tasks),
+                'running': running,
+                'completed': len(self._tasks) - running,
+                'bytes': self._bytes,
+                'max_tasks': self.max_tasks,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'evicted': self.evicted,
+                'store': type(self._store).__name__ if self._store is not None else None,
+                'remote_changes': self.remote_changes,
+            }
+
+    # ---- durable store ------------------------------------------------
+    def attach_store(self, store, poll_interval: float = STORE_POLL_SECONDS) -> List[str]:
+        """Write through to store from now on; returns the ids of tasks marked interrupted.
+
+        Running tasks whose owning process on this host has died (e.g. the
+        server was restarted) are cancelled in the store, so their streams
+        end instead of waiting forever.
+        """
+        self._store = store
+        self._store_poll = poll_interval
+        me = process_id()
+        interrupted = []
+        for record in store.running():
+            if record['owner'] != me and process_alive(record['owner']) is not False:
+                continue
+            record['cancelled'] = record['completed'] = True
+            record['cancel_reason'] = record['description'] = 'Interrupted: the server process running this task stopped'
+            record['updated_at'] = _timestamp()
+            record['logs'] = [{'time': record['updated_at'], 'message': record['description']}]
+            store.save(record)
+            interrupted.append(record['task_id'])
+        store.prune(self.ttl_seconds, self.stale_seconds)
+        self._ensure_watcher()
+        return interrupted
+
+    def _persist(self, record: Dict, result: Any = None) -> None:
+        """Write record (and result) through to the store, outside the registry lock."""
+        if self._store is None:
+            return
+        try:
+            self._store.save(record, result)
+        except Exception:
+            logger.exception('could not store task %s', record['task_id'])
+
+    def _get(self, task_id: str) -> Optional[_Task]:
+        """The task held here, loading it from the store if another process created it."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+        if task is not None or self._store is None:
+            return task
+        self._ensure_watcher()
+        try:
+            record = self._store.load(task_id)
+        except Exception:
+            logger.exception('could not load task %s', task_id)
+            return None
+        if record is None:
+            return None
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                task = _Task(task_id, record['description'])
+                task.started_at = record['started_at']
+                task.owner = record['owner']
+                self._apply_record(task, record)
+                self._tasks[task_id] = task
+                self._bytes += task.nbytes
+            victims = self._evict()
+        self._notify_evicted([v for v in victims if v != task_id])
+        return task
+
+    def _apply_record(self, task: _Task, record: Dict) -> None:
+        """Copy a record written elsewhere into task (lock held).
+
+        The owning process is authoritative for its task's progress; from
+        other processes it only takes a cancellation, whose log entry the
+        cancelling process has already stored.
+        """
+        if task.owner == process_id():
+            if record['cancelled'] and not task.cancelled:
+                reason = record['cancel_reason'] or record['description']
+                task.cancelled = task.completed = True
+                task.cancel_reason = task.description = reason
+                task.updated_at = record['updated_at']
+                task.logs.append({'time': record['updated_at'], 'message': reason})
+        else:
+            task.description = record['description']
+            task.updated_at = record['updated_at']
+            task.logs = list(record['logs'])
+            task.completed = task.completed or record['completed']
+            task.cancelled = task.cancelled or record['cancelled']
+            task.cancel_reason = task.cancel_reason or record['cancel_reason']
+        task.logs_saved = len(task.logs)
+        if record['has_result'] and task.result is None:
+            task.result_in_store = True
+        nbytes = estimate_size(task.description) + estimate_size(task.logs) + estimate_size(task.result)
+        self._charge(task, nbytes - task.nbytes)
+
+    def _load_result(self, task: _Task) -> None:
+        try:
+            result = self._store.load_result(task.task_id)
+        except Exception:
+            logger.exception('could not load the result of task %s', task.task_id)
+            return
+        with self._lock:
+            if task.result_in_store:
+                task.result_in_store = False
+                task.result = result
+                self._charge(task, estimate_size(result))
+
+    def _ensure_watcher(self) -> None:
+        """Start the change watcher in this process (again after a fork)."""
+        if self._store is None or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='task-store-watcher', daemon=True).start()
+
+    def _watch(self) -> None:
+        store = self._store
+        cursor = store.cursor()
+        seen_version = store.data_version()
+        pruned_at = time.monotonic()
+        while True:
+            time.sleep(self._store_poll)
+            try:
+                version = store.data_version()
+                if version != seen_version:
+                    seen_version = version
+                    records, cursor = store.changes(cursor)
+                    self._apply_remote(records)
+                if time.monotonic() - pruned_at > STORE_PRUNE_SECONDS:
+                    pruned_at = time.monotonic()
+                    store.prune(self.ttl_seconds, self.stale_seconds)
+            except Exception:
+                logger.exception('task store watcher failed')
+
+    def _apply_remote(self, records: List[Dict]) -> None:
+        changed = []
+        with self._lock:
+            for record in records:
+                task = self._tasks.get(record['task_id'])
+                if task is None:  # not held here; loaded on first access
+                    continue
+                self._apply_record(task, record)
+                self._touch(task)
+                changed.append(task.task_id)
+            self.remote_changes += len(changed)
+        for task_id in changed:
+            for callback in self._on_change:
+                callback(task_id)
+
+    # ---- wiring -------------------------------------------------------
+    def install(self, module: ModuleType, package_prefix: Optional[str] = None) -> Dict[str, Callable]:
+        """Replace the persistence functions on module and on loaded modules of its package that imported them."""
+        prefix = package_prefix or module.__name__.split('.')[0] + '.'
+        for name, function in self.functions.items():
+            original = getattr(module, name, None)
+            for mod_name, mod in list(sys.modules.items()):
+                if mod is None or not (mod is module or mod_name.startswith(prefix)):
+                    continue
+                if mod is module or (original is not None and getattr(mod, name, None) is original):
+                    setattr(mod, name, function)
+        return dict(self.functions)
+
+
+__all__ = [
+    'TaskRegistry',
+    'TaskCancelled',
+    'estimate_size',
+    'DEFAULT_TTL_SECONDS',
+    'DEFAULT_MAX_TASKS',
+    'DEFAULT_MAX_BYTES',
+]
@@ -0,0 +1,343 @@
+"""Durable, cross-process storage for NL task records.
+
+``TaskRegistry`` keeps task state in process memory, which has two problems
+behind a real server:
+
+* with several worker processes (gunicorn ``-w N``) the SSE request for a
+  task often lands on a different worker than the one running it and got
+  "task not found";
+* a restart dropped every task, so a client reconnecting after a deploy got
+  "task not found" as well, even for tasks that had finished.
+
+A ``TaskStore`` is the durable copy behind the registry. The registry keeps
+serving snapshots from memory (reads stay sub-millisecond) and writes every
+change through to the store; a worker that does not know a task loads it
+from the store on first access, and ``changes()`` lets each worker follow
+what the others write, which is how remote progress reaches its SSE streams.
+
+``SqliteTaskStore`` is the local implementation: one SQLite file (WAL mode)
+shared by every worker on the host. Every write gets the next value of a
+global ``seq`` column, so ``changes(cursor)`` is an indexed range query, and
+``data_version()`` (SQLite's ``PRAGMA data_version``, which moves only when
+*another* connection commits) makes polling for changes nearly free.
+Results are pickled (they are usually pandas DataFrames) and are only read
+when a snapshot actually needs them.
+
+Records are plain dicts with the keys of ``RECORD_FIELDS``; results travel
+separately (``save(record, result)`` / ``load_result``). Log entries are rows
+of ``task_logs`` keyed by an AUTOINCREMENT ``seq``: ``save`` appends the
+entries in ``record['logs']`` -- the ones the writer has not saved before --
+and ``load`` returns all of them in insertion order, so a task's n progress
+updates cost O(n) in total and an entry appended by one process is never
+overwritten or dropped because another process holds an older copy of the
+log. ``completed`` and ``cancelled`` never go back to false once stored, so
+a cancel written by one worker cannot be undone by a progress write racing it
+from another, and ``cancel_reason`` keeps the first reason stored.
+
+``mark_watched`` / ``last_watched`` record when each process last had an SSE
+client on a task (table ``watchers``), so a process whose clients all left
+can tell whether the client simply reconnected to another worker before it
+cancels the task as abandoned.
+
+Only standard library modules are used.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECORD_FIELDS = ('task_id', 'description', 'started_at', 'updated_at', 'logs',
+                 'completed', 'cancelled', 'cancel_reason', 'has_result', 'owner', 'seq')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id     TEXT PRIMARY KEY,
+    description TEXT NOT NULL,
+    started_at  TEXT NOT NULL,
+    updated_at  TEXT NOT NULL,
+    logs        TEXT NOT NULL,  -- always '[]'; entries live in task_logs
+    completed   INTEGER NOT NULL DEFAULT 0,
+    cancelled   INTEGER NOT NULL DEFAULT 0,
+    cancel_reason TEXT,
+    has_result  INTEGER NOT NULL DEFAULT 0,
+    result      BLOB,
+    owner       TEXT NOT NULL,
+    writer      TEXT NOT NULL,
+    seq         INTEGER NOT NULL,
+    written     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_seq ON tasks(seq);
+CREATE TABLE IF NOT EXISTS task_logs (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    entry   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_task_logs_task ON task_logs(task_id, seq);
+CREATE TABLE IF NOT EXISTS watchers (
+    task_id TEXT NOT NULL,
+    watcher TEXT NOT NULL,
+    seen    REAL NOT NULL,
+    PRIMARY KEY (task_id, watcher)
+);
+"""
+
+_UPSERT = """
+INSERT INTO tasks (task_id, description, started_at, updated_at, logs, completed, cancelled,
+                   cancel_reason, has_result, result, owner, writer, seq, written)
+VALUES (:task_id, :description, :started_at, :updated_at, '[]', :completed, :cancelled,
+        :cancel_reason, :has_result, :result, :owner, :writer,
+        (SELECT COALESCE(MAX(seq), 0) + 1 FROM tasks), :written)
+ON CONFLICT(task_id) DO UPDATE SET
+    description = excluded.description,
+    updated_at  = excluded.updated_at,
+    completed   = MAX(tasks.completed, excluded.completed),
+    cancelled   = MAX(tasks.cancelled, excluded.cancelled),
+    cancel_reason = COALESCE(tasks.cancel_reason, excluded.cancel_reason),
+    has_result  = MAX(tasks.has_result, excluded.has_result),
+    result      = CASE WHEN excluded.has_result THEN excluded.result ELSE tasks.result END,
+    writer      = excluded.writer,
+    seq         = excluded.seq,
+    written     = excluded.written
+"""
+
+_COLUMNS = ', '.join(f for f in RECORD_FIELDS if f != 'logs')
+
+_APPEND_LOG = 'INSERT INTO task_logs (task_id, entry) VALUES (?, ?)'
+
+
+def process_id() -> str:
+    """Identity of this process in ``owner`` / ``writer`` columns."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def process_alive(owner: str) -> Optional[bool]:
+    """Whether the process named by owner still runs; None if it is on another host."""
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class TaskStore(ABC):
+    """Interface of a durable task store; see ``SqliteTaskStore``."""
+
+    @abstractmethod
+    def save(self, record: Dict, result: Any = None) -> None:
+        """Insert or update record and append ``record['logs']`` to its log.
+
+        ``record['logs']`` holds only the entries this writer has not saved
+        yet; the result is stored when ``record['has_result']``.
+        """
+
+    @abstractmethod
+    def load(self, task_id: str) -> Optional[Dict]:
+        """The record for task_id (with its whole log) without its result, or None."""
+
+    @abstractmethod
+    def load_result(self, task_id: str) -> Any:
+        """The stored result of task_id, or None."""
+
+    @abstractmethod
+    def data_version(self) -> Any:
+        """A value that changes whenever another process may have written."""
+
+    @abstractmethod
+    def cursor(self) -> int:
+        """Position after the newest change, for ``changes()``."""
+
+    @abstractmethod
+    def changes(self, cursor: int) -> Tuple[List[Dict], int]:
+        """Records written by other processes after cursor, and the new cursor."""
+
+    @abstractmethod
+    def running(self) -> List[Dict]:
+        """Records of tasks that are neither completed nor cancelled."""
+
+    @abstractmethod
+    def mark_watched(self, task_id: str) -> None:
+        """Record that this process has a client watching task_id now."""
+
+    @abstractmethod
+    def last_watched(self, task_id: str, exclude_self: bool = True) -> Optional[float]:
+        """Epoch seconds of the latest mark_watched for task_id (by other processes), or None."""
+
+    @abstractmethod
+    def prune(self, completed_age: float, any_age: float) -> int:
+        """Delete completed records older than completed_age seconds and any older than any_age."""
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteTaskStore(TaskStore):
+    """Task records in one SQLite file shared by the worker processes of a host."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn: Optional[sqlite3.Connection] = None
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                self._migrate(conn)
+                conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """Bring a store written by an older version to the current schema (lock held)."""
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'tasks' not in tables:
+            return
+        if 'cancel_reason' not in {r[1] for r in conn.execute('PRAGMA table_info(tasks)')}:
+            conn.execute('ALTER TABLE tasks ADD COLUMN cancel_reason TEXT')
+        if 'task_logs' in tables and 'seq' not in {r[1] for r in conn.execute('PRAGMA table_info(task_logs)')}:
+            # entries keyed by (task_id, pos) as computed by the writer
+            conn.execute('ALTER TABLE task_logs RENAME TO task_logs_by_pos')
+            conn.executescript(_SCHEMA)
+            conn.execute('INSERT INTO task_logs (task_id, entry) '
+                         'SELECT task_id, entry FROM task_logs_by_pos ORDER BY task_id, pos')
+            conn.execute('DROP TABLE task_logs_by_pos')
+        elif 'task_logs' not in tables:
+            # each log kept as one JSON column of tasks
+            conn.executescript(_SCHEMA)
+            for row in conn.execute("SELECT task_id, logs FROM tasks WHERE logs != '[]'").fetchall():
+                conn.executemany(_APPEND_LOG, [
+                    (row['task_id'], json.dumps(entry, ensure_ascii=False, default=str))
+                    for entry in json.loads(row['logs'])])
+            conn.execute("UPDATE tasks SET logs = '[]'")
+
+    def _connection(self) -> sqlite3.Connection:
+        """This process's connection (lock held); a forked child opens its own."""
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _record(conn: sqlite3.Connection, row: sqlite3.Row) -> Dict:
+        """Record of a tasks row with its log entries (lock held)."""
+        record = {name: row[name] for name in RECORD_FIELDS if name != 'logs'}
+        record['logs'] = [json.loads(r[0]) for r in conn.execute(
+            'SELECT entry FROM task_logs WHERE task_id = ? ORDER BY seq', (row['task_id'],))]
+        for flag in ('completed', 'cancelled', 'has_result'):
+            record[flag] = bool(record[flag])
+        return record
+
+    def save(self, record: Dict, result: Any = None) -> None:
+        params = dict(record, result=None, writer=process_id(), written=time.time())
+        params.setdefault('cancel_reason', None)
+        logs = params.pop('logs')
+        if record.get('has_result'):
+            try:
+                params['result'] = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logger.warning('task %s: result is not picklable, not stored: %s', record['task_id'], e)
+                params['has_result'] = False
+        for flag in ('completed', 'cancelled', 'has_result'):
+            params[flag] = int(bool(params[flag]))
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(_UPSERT, params)
+                conn.executemany(_APPEND_LOG, [
+                    (record['task_id'], json.dumps(entry, ensure_ascii=False, default=str)) for entry in logs])
+
+    def load(self, task_id: str) -> Optional[Dict]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(f'SELECT {_COLUMNS} FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+            return self._record(conn, row) if row is not None else None
+
+    def load_result(self, task_id: str) -> Any:
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT result FROM tasks WHERE task_id = ? AND has_result', (task_id,)).fetchone()
+        return pickle.loads(row['result']) if row is not None and row['result'] is not None else None
+
+    def data_version(self) -> int:
+        with self._lock:
+            return self._connection().execute('PRAGMA data_version').fetchone()[0]
+
+    def cursor(self) -> int:
+        with self._lock:
+            return self._connection().execute('SELECT COALESCE(MAX(seq), 0) FROM tasks').fetchone()[0]
+
+    def changes(self, cursor: int) -> Tuple[List[Dict], int]:
+        me = process_id()
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                f'SELECT {_COLUMNS}, writer FROM tasks WHERE seq > ? ORDER BY seq', (cursor,)).fetchall()
+            records = [self._record(conn, r) for r in rows if r['writer'] != me]
+        if rows:
+            cursor = rows[-1]['seq']
+        return records, cursor
+
+    def running(self) -> List[Dict]:
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(f'SELECT {_COLUMNS} FROM tasks WHERE NOT completed AND NOT cancelled').fetchall()
+            return [self._record(conn, r) for r in rows]
+
+    def mark_watched(self, task_id: str) -> None:
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO watchers (task_id, watcher, seen) VALUES (?, ?, ?)',
+                             (task_id, process_id(), time.time()))
+
+    def last_watched(self, task_id: str, exclude_self: bool = True) -> Optional[float]:
+        where, params = 'task_id = ?', [task_id]
+        if exclude_self:
+            where, params = where + ' AND watcher != ?', params + [process_id()]
+        with self._lock:
+            row = self._connection().execute(f'SELECT MAX(seen) FROM watchers WHERE {where}', params).fetchone()
+        return row[0]
+
+    def prune(self, completed_age: float, any_age: float) -> int:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cur = conn.execute('DELETE FROM tasks WHERE (completed AND written < ?) OR written < ?',
+                                   (now - completed_age, now - any_age))
+                conn.execute('DELETE FROM task_logs WHERE task_id NOT IN (SELECT task_id FROM tasks)')
+                conn.execute('DELETE FROM watchers WHERE seen < ? OR task_id NOT IN (SELECT task_id FROM tasks)',
+                             (now - completed_age,))
+        return cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None
+
+
+__all__ = [
+    'TaskStore',
+    'SqliteTaskStore',
+    'process_id',
+    'process_alive',
+    'RECORD_FIELDS',
+]
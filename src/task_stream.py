@@ -0,0 +1,398 @@
+"""Server-Sent Events engine for NL task progress streams.
+
+The ``/api/nl-*-events/<task_id>`` endpoints used to be copies of the same
+generator, differing only in how they recognised the finished result, and a
+client whose connection was dropped by a proxy started over from the full
+snapshot. ``TaskStreamEngine`` is the one implementation they share:
+
+* every task has one event log; events are numbered 1, 2, 3, ... per task and
+  carry that number as the SSE ``id:`` field;
+* the log is synced from ``snapshot(task_id)`` at most once per change, no
+  matter how many clients watch the task, and keeps the last
+  ``replay_size`` events;
+* a reconnect sends ``Last-Event-ID`` (EventSource does this by itself) and
+  receives exactly the events after it. If those already fell out of the
+  buffer, it resumes from a full snapshot instead, so nothing is lost;
+* when a ``TaskEventBus`` is given, streams block until the task publishes a
+  change; without one (app.py) they poll every ``poll_interval`` seconds;
+* streams opened with ``deltas=True`` receive ``delta`` events holding only
+  what changed since the previous event (see ``snapshot_delta``) between full
+  ``progress`` checkpoints, so a task whose logs grow to n lines costs O(n)
+  bytes on the wire instead of O(n^2). Other streams get the newest state as
+  one full ``progress`` snapshot whenever they wake up.
+
+The log itself stores what delta streams are sent: changes are detected with
+``snapshot_delta`` and buffered as encoded deltas, and only checkpoints hold
+an encoded full snapshot, so memory and encoding work stay linear in the
+task's length as well. A checkpoint is taken once the deltas since the last
+one add up to that checkpoint's size (so checkpoint sizes at least double and
+their total stays linear) or span half the replay buffer (so a resume always
+finds a checkpoint to start from). The full snapshot for other streams is
+encoded on demand, at most once per change.
+
+``finalize(snap)`` decides completion: it returns ``(event_name, payload)``
+for the terminal event, or None while the task is still running; the payload
+may also be a string of already encoded JSON (e.g. a table encoded by pandas'
+vectorised encoder), which is sent as is. A snapshot
+with ``status == 'cancelled'`` always ends the stream with a ``cancelled``
+event.
+
+A large terminal payload can be a ``ChunkedPayload`` instead. Nothing is
+encoded when it is logged; streams opened with ``chunked=True`` receive its
+``frames()`` one by one -- e.g. a header and row chunks encoded from the
+result DataFrame as they are sent -- followed by the terminal event holding
+the short ``closing`` data, so memory per stream is bounded by a chunk and
+the client can show the first rows while the rest is still coming. Only the
+terminal event carries an ``id:``; a client that reconnects in the middle
+gets every frame again. Other streams receive ``full(fmt)`` as one event,
+where fmt is the encoding the stream asked for (None: the default).
+
+The engine counts subscribers per task. When the last one of an unfinished
+task disconnects and nobody reconnects within ``abandon_grace`` seconds,
+``on_abandoned(task_id)`` is called (app1 cancels the task). Counts are per
+process; with several worker processes a client may reconnect to another
+one. ``watching(task_id)`` is then called when a stream opens and on every
+heartbeat, and ``watched_elsewhere(task_id, within)`` is asked before giving
+up: a stream in another process that reported within two heartbeats means
+the client is still there, and that process takes over the abandonment
+check once its own last subscriber leaves.
+
+Event logs are released by ``forget(task_id)``; app1 wires it to the task
+registry's eviction. Without a registry (app.py), ``idle_ttl`` drops a log
+once nobody has watched the task for that many seconds. A client that later
+resumes with a ``Last-Event-ID`` past the new log's numbering is served from
+the newest full snapshot again.
+
+Only standard library modules are used.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+REPLAY_SIZE = 256
+HEARTBEAT_SECONDS = 10
+POLL_INTERVAL = 0.3
+# Reconnect delay suggested to EventSource clients (``retry:`` field).
+RETRY_MS = 2000
+
+
+
+class ChunkedPayload:
+    """Terminal payload encoded while it is sent, see the module docstring.
+
+    ``frames()`` yields ``(event name, JSON data)`` pairs sent before the
+    terminal event, ``closing`` is that event's data in chunked streams and
+    ``full(fmt)`` the whole payload for streams that did not ask for chunks.
+    """
+
+    def __init__(self, frames: Callable[[], Iterator[Tuple[str, str]]], closing: str,
+                 full: Callable[[Optional[str]], str]):
+        self.frames = frames
+        self.closing = closing
+        self.full = full
+
+
+# (event id, event name, JSON data or None for deltas, JSON delta or None for checkpoints / terminal events)
+_Event = Tuple[int, str, Union[str, ChunkedPayload], Optional[str]]
+Finalizer = Callable[[Dict], Optional[Tuple[str, Union[Dict, str, ChunkedPayload]]]]
+
+
+def task_info(snap: Dict) -> Dict:
+    """The task_info block sent with terminal events."""
+    return {
+        "task_id": snap["task_id"],
+        "started_at": snap["started_at"],
+        "updated_at": snap["updated_at"],
+        "description": snap["description"]
+    }
+
+
+def snapshot_delta(old: Dict, new: Dict) -> Dict:
+    """Describe how to turn snapshot old into new.
+
+    ``append``: list fields that only grew, with the new items;
+    ``extend``: string fields that only grew, with the new suffix;
+    ``set``: other changed or added fields, with their new value;
+    ``unset``: removed fields. Empty parts are omitted.
+    """
+    delta: Dict = {}
+    for key, value in new.items():
+        if key not in old:
+            delta.setdefault('set', {})[key] = value
+            continue
+        before = old[key]
+        if before == value:
+            continue
+        if isinstance(value, list) and isinstance(before, list) and value[:len(before)] == before:
+            delta.setdefault('append', {})[key] = value[len(before):]
+        elif isinstance(value, str) and isinstance(before, str) and before and value.startswith(before):
+            delta.setdefault('extend', {})[key] = value[len(before):]
+        else:
+            delta.setdefault('set', {})[key] = value
+    removed = [key for key in old if key not in new]
+    if removed:
+        delta['unset'] = removed
+    return delta
+
+
+def format_event(event_id: Optional[int], event: str, data: str) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+
+class _TaskLog:
+    """Numbered, bounded event history of one task."""
+
+    def __init__(self, replay_size: int):
+        self.lock = threading.Lock()
+        self.events: Deque[_Event] = deque(maxlen=replay_size)
+        self.last_id = 0
+        self.last_snap: Optional[Dict] = None
+        # encoded last_snap, None until a stream needs it
+        self.last_payload: Optional[str] = None
+        # size of the last checkpoint; delta bytes and events since it
+        self.checkpoint_bytes = 0
+        self.delta_bytes = 0
+        self.delta_count = 0
+        self.synced_version: Optional[int] = None
+        self.synced_at = 0.0
+        self.done = False
+
+    def append(self, event: str, data: str, delta: Optional[str] = None) -> None:
+        self.last_id += 1
+        self.events.append((self.last_id, event, data, delta))
+
+    def append_progress(self, snap: Dict) -> None:
+        """Log snap as a delta or a checkpoint if it differs from the last one."""
+        if self.last_snap is not None:
+            change = snapshot_delta(self.last_snap, snap)
+            if not change:
+                return
+            delta = json.dumps(change, ensure_ascii=False, default=str)
+            if (self.delta_bytes + len(delta) < self.checkpoint_bytes
+                    and self.delta_count + 1 < self.events.maxlen // 2):
+                self.delta_bytes += len(delta)
+                self.delta_count += 1
+                self.last_snap, self.last_payload = snap, None
+                self.append('progress', None, delta)
+                return
+        payload = json.dumps(snap, ensure_ascii=False, default=str)
+        self.checkpoint_bytes = len(payload)
+        self.delta_bytes = self.delta_count = 0
+        self.last_snap, self.last_payload = snap, payload
+        self.append('progress', payload)
+
+    def since(self, cursor: int, deltas: bool = False) -> List[_Event]:
+        """Events after cursor (lock held).
+
+        In delta mode a gap resumes from the newest checkpoint, so every
+        delta that follows applies to a state the client has. Otherwise only
+        the newest progress event is returned, carrying the full snapshot.
+        """
+        events = [e for e in self.events if e[0] > cursor]
+        if not deltas:
+            progress = [e for e in events if e[1] == 'progress']
+            if progress:
+                newest = progress[-1][0]
+                if self.last_payload is None:
+                    self.last_payload = json.dumps(self.last_snap, ensure_ascii=False, default=str)
+                events = [(e[0], e[1], self.last_payload, None) if e[0] == newest else e
+                          for e in events if e[1] != 'progress' or e[0] == newest]
+        elif events and events[0][0] > cursor + 1:
+            checkpoints = [e[0] for e in events if e[1] == 'progress' and e[3] is None]
+            if checkpoints:
+                events = [e for e in events if e[0] >= checkpoints[-1]]
+        return events
+
+
+class TaskStreamEngine:
+    """Builds SSE streams over task snapshots; one instance per endpoint."""
+
+    def __init__(self, snapshot: Callable[[str], Optional[Dict]], finalize: Finalizer, bus=None,
+                 replay_size: int = REPLAY_SIZE, heartbeat: float = HEARTBEAT_SECONDS,
+                 poll_interval: float = POLL_INTERVAL, retry_ms: int = RETRY_MS,
+                 on_abandoned: Optional[Callable[[str], None]] = None, abandon_grace: float = 30.0,
+                 watching: Optional[Callable[[str], None]] = None,
+                 watched_elsewhere: Optional[Callable[[str, float], bool]] = None,
+                 idle_ttl: Optional[float] = None):
+        self.snapshot = snapshot
+        self.finalize = finalize
+        self.bus = bus
+        self.replay_size = replay_size
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+        self.retry_ms = retry_ms
+        self.on_abandoned = on_abandoned
+        self.abandon_grace = abandon_grace
+        self.watching = watching
+        self.watched_elsewhere = watched_elsewhere
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._logs: Dict[str, _TaskLog] = {}
+        self._subscribers: Dict[str, int] = {}
+
+    def _log(self, task_id: str) -> _TaskLog:
+        with self._lock:
+            log = self._logs.get(task_id)
+            if log is None:
+                log = self._logs[task_id] = _TaskLog(self.replay_size)
+            return log
+
+    def forget(self, task_id: str) -> None:
+        with self._lock:
+            self._logs.pop(task_id, None)
+
+    # ---- subscribers --------------------------------------------------
+    def subscribers(self, task_id: str) -> int:
+        with self._lock:
+            return self._subscribers.get(task_id, 0)
+
+    def _subscribe(self, task_id: str) -> None:
+        with self._lock:
+            self._subscribers[task_id] = self._subscribers.get(task_id, 0) + 1
+
+    def _unsubscribe(self, task_id: str, finished: bool) -> None:
+        with self._lock:
+            remaining = self._subscribers.get(task_id, 1) - 1
+            if remaining > 0:
+                self._subscribers[task_id] = remaining
+                return
+            self._subscribers.pop(task_id, None)
+        if self.idle_ttl is not None:
+            timer = threading.Timer(self.idle_ttl, self._forget_idle, (task_id,))
+            timer.daemon = True
+            timer.start()
+        if finished or self.on_abandoned is None:
+            return
+        timer = threading.Timer(self.abandon_grace, self._check_abandoned, (task_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _forget_idle(self, task_id: str) -> None:
+        with self._lock:
+            if task_id not in self._subscribers:
+                self._logs.pop(task_id, None)
+
+    def _check_abandoned(self, task_id: str) -> None:
+        if self.subscribers(task_id) != 0:
+            return
+        if self.watched_elsewhere is not None and self.watched_elsewhere(task_id, 2 * self.heartbeat):
+            return
+        self.on_abandoned(task_id)
+
+    def _sync(self, task_id: str, log: _TaskLog, version: Optional[int]) -> bool:
+        """Append events for the task's current state; False if the task is unknown."""
+        with log.lock:
+            if log.done:
+                return True
+            since_sync = time.monotonic() - log.synced_at
+            if version is not None:
+                # unchanged since the last sync; still re-read once per heartbeat
+                # in case a writer bypassed the bus
+                if log.synced_version == version and since_sync < self.heartbeat:
+                    return True
+            elif since_sync < self.poll_interval:
+                return True
+            snap = self.snapshot(task_id)
+            log.synced_version, log.synced_at = version, time.monotonic()
+            if not snap:
+                return False
+            if snap.get('status') == 'cancelled':
+                final = 'cancelled', {"type": "cancelled", "task_info": task_info(snap)}
+            else:
+                final = self.finalize(snap)
+            if final is not None:
+                event, payload = final
+                if isinstance(payload, (str, ChunkedPayload)):
+                    data = payload
+                else:
+                    data = json.dumps(payload, ensure_ascii=False, default=str)
+                log.append(event, data)
+                log.done = True
+                return True
+            log.append_progress(snap)
+            return True
+
+    def _wait(self, task_id: str, version: Optional[int], timeout: float) -> None:
+        if self.bus is not None:
+            self.bus.wait(task_id, version, timeout)
+        else:
+            time.sleep(min(self.poll_interval, timeout))
+
+    def stream(self, task_id: str, last_event_id: Optional[str] = None, deltas: bool = False,
+               chunked: bool = False, fmt: Optional[str] = None) -> Iterator[str]:
+        """Generator of SSE text for task_id, resuming after last_event_id.
+
+        With deltas, progress changes after the first snapshot are sent as
+        ``delta`` events where the log has them; with chunked, a
+        ``ChunkedPayload`` result is sent as its frames, otherwise as
+        ``full(fmt)``.
+        """
+        try:
+            cursor = max(int(last_event_id), 0) if last_event_id else 0
+        except ValueError:
+            cursor = 0
+        log = self._log(task_id)
+        self._subscribe(task_id)
+        try:
+            yield from self._events(task_id, log, cursor, deltas, chunked, fmt)
+        finally:
+            # also runs when the client disconnects (the server closes the generator)
+            self._unsubscribe(task_id, log.done)
+
+    def _events(self, task_id: str, log: _TaskLog, cursor: int, deltas: bool, chunked: bool,
+                fmt: Optional[str]) -> Iterator[str]:
+        heartbeat_at = time.monotonic()
+        if self.watching is not None:
+            self.watching(task_id)
+        yield f"retry: {self.retry_ms}\n\n"
+        while True:
+            version = self.bus.version(task_id) if self.bus is not None else None
+            if not self._sync(task_id, log, version):
+                if log.last_id == 0:
+                    self.forget(task_id)
+                yield format_event(None, 'error', '{"message":"task not found"}')
+                return
+            if cursor > log.last_id:
+                # the log was forgotten and rebuilt since the client's last event
+                cursor = 0
+            with log.lock:
+                events = log.since(cursor, deltas)
+                done = log.done
+            for event_id, event, data, delta in events:
+                if deltas and delta is not None and cursor > 0:
+                    yield format_event(event_id, 'delta', delta)
+                elif isinstance(data, ChunkedPayload):
+                    if chunked:
+                        for name, frame in data.frames():
+                            yield format_event(None, name, frame)
+                        yield format_event(event_id, event, data.closing)
+                    else:
+                        yield format_event(event_id, event, data.full(fmt))
+                else:
+                    yield format_event(event_id, event, data)
+                cursor = event_id
+            if done:
+                return
+
+            # heartbeat so idle proxies keep the connection open
+            if time.monotonic() - heartbeat_at >= self.heartbeat:
+                yield ": keep-alive\n\n"
+                heartbeat_at = time.monotonic()
+                if self.watching is not None:
+                    self.watching(task_id)
+            self._wait(task_id, version, max(0.0, self.heartbeat - (time.monotonic() - heartbeat_at)))
+
+
+__all__ = [
+    'TaskStreamEngine',
+    'ChunkedPayload',
+    'task_info',
+    'format_event',
+    'snapshot_delta',
+    'REPLAY_SIZE',
+]
@@ -0,0 +1,105 @@
+import hashlib
+import io
+
+import pytest
+
+from chunked_upload import ChunkedUploadError, ChunkedUploadStore
+
+DATA = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkedUploadStore(str(tmp_path), max_chunk_size=4096, max_total_size=1024 * 1024)
+
+
+def _chunk(index, size=4096):
+    return DATA[index * size:(index + 1) * size]
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_resume_sends_only_the_missing_chunks(store):
+    manifest = store.init('a.txt', 'docs', len(DATA), chunk_size=4096, sha256=_sha(DATA))
+    upload_id = manifest['upload_id']
+    assert manifest['total_chunks'] == 3
+
+    store.write_chunk(upload_id, 2, io.BytesIO(_chunk(2)))
+    store.write_chunk(upload_id, 0, io.BytesIO(_chunk(0)), checksum=_sha(_chunk(0)))
+    # the client reconnects and asks what is still missing
+    status = store.status(upload_id)
+    assert status['received'] == [0, 2] and status['missing'] == [1]
+    with pytest.raises(ChunkedUploadError) as early:
+        store.complete(upload_id)
+    assert early.value.status == 409
+
+    store.write_chunk(upload_id, 1, io.BytesIO(_chunk(1)))
+    store.write_chunk(upload_id, 1, io.BytesIO(_chunk(1)))  # retries are idempotent
+    path, completed = store.complete(upload_id)
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    assert completed['folder'] == 'docs'
+
+
+def test_chunk_checksum_mismatch_leaves_the_chunk_missing(store):
+    upload_id = store.init('a.txt', '', len(DATA), chunk_size=4096)['upload_id']
+    store.write_chunk(upload_id, 0, io.BytesIO(_chunk(0)))
+
+    with pytest.raises(ChunkedUploadError) as mismatch:
+        store.write_chunk(upload_id, 0, io.BytesIO(b'x' * 4096), checksum=_sha(_chunk(0)))
+    assert mismatch.value.status == 422
+    # the earlier accepted copy was overwritten, so it must be sent again
+    assert 0 in store.status(upload_id)['missing']
+
+
+def test_file_checksum_mismatch_fails_complete_and_allows_a_retry(store):
+    upload_id = store.init('a.txt', '', len(DATA), chunk_size=4096, sha256=_sha(b'other'))['upload_id']
+    for index in range(3):
+        store.write_chunk(upload_id, index, io.BytesIO(_chunk(index)))
+
+    with pytest.raises(ChunkedUploadError) as mismatch:
+        store.complete(upload_id)
+    assert mismatch.value.status == 422
+    # the claim was dropped again
+    with pytest.raises(ChunkedUploadError) as again:
+        store.complete(upload_id)
+    assert again.value.status == 422
+
+
+def test_complete_is_claimed_once(store):
+    upload_id = store.init('a.txt', '', 10, chunk_size=4096)['upload_id']
+    store.write_chunk(upload_id, 0, io.BytesIO(b'0123456789'))
+    store.complete(upload_id)
+
+    for call in (lambda: store.complete(upload_id),
+                 lambda: store.write_chunk(upload_id, 0, io.BytesIO(b'0123456789'))):
+        with pytest.raises(ChunkedUploadError) as taken:
+            call()
+        assert taken.value.status == 409
+
+    store.release(upload_id)
+    store.complete(upload_id)
+    store.discard(upload_id)
+    with pytest.raises(ChunkedUploadError) as gone:
+        store.status(upload_id)
+    assert gone.value.status == 404
+
+
+@pytest.mark.parametrize('size, chunk_size, status', [
+    (-1, None, 400), ('10', None, 400), (True, None, 400), (10, 8192, 400), (2 * 1024 * 1024, None, 413),
+])
+def test_init_validates_sizes(store, size, chunk_size, status):
+    with pytest.raises(ChunkedUploadError) as invalid:
+        store.init('a.txt', '', size, chunk_size=chunk_size)
+    assert invalid.value.status == status
+
+
+def test_wrong_chunk_length_is_rejected(store):
+    upload_id = store.init('a.txt', '', len(DATA), chunk_size=4096)['upload_id']
+    with pytest.raises(ChunkedUploadError):
+        store.write_chunk(upload_id, 2, io.BytesIO(_chunk(0)))  # last chunk is only 2048 bytes
+    with pytest.raises(ChunkedUploadError):
+        store.write_chunk(upload_id, 3, io.BytesIO(b''))
+    assert store.status(upload_id)['received'] == []
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_do_runs_once_for_concurrent_callers():
+    flights = SingleFlight()
+    calls = []
+    gate = threading.Event()
+
+    def work():
+        calls.append(1)
+        gate.wait(1)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('k', work))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    gate.set()
+    for t in threads:
+        t.join()
+
+    assert calls == [1]
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert {value for value, _ in results} == {'value'}
+
+
+def test_do_shares_the_exception():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        flights.do('k', fail)
+    # nothing is remembered afterwards
+    assert flights.do('k', lambda: 1) == (1, False)
+
+
+def test_attach_coalesces_while_the_handle_is_alive():
+    flights = SingleFlight()
+    live = {'t1'}
+    assert flights.attach('k', lambda: 't1', alive=live.__contains__) == ('t1', False)
+    assert flights.attach('k', lambda: 't2', alive=live.__contains__) == ('t1', True)
+
+    live.clear()
+    assert flights.attach('k', lambda: 't2', alive=live.__contains__) == ('t2', False)
+
+
+def test_attach_starts_once_while_start_is_running():
+    flights = SingleFlight()
+    started = []
+
+    def start():
+        started.append(1)
+        time.sleep(0.1)
+        return 'task'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.attach('k', start))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    # another key is not held up by the running start()
+    assert flights.attach('other', lambda: 'o') == ('o', False)
+    for t in threads:
+        t.join()
+
+    assert started == [1]
+    assert sorted(results) == [('task', False)] + [('task', True)] * 4
+
+
+def test_release_and_release_handle():
+    flights = SingleFlight()
+    flights.attach('a', lambda: 't1')
+    flights.attach('b', lambda: 't1')
+    flights.attach('c', lambda: 't2')
+
+    flights.release('c', 'other')
+    assert flights.attach('c', lambda: 'new') == ('t2', True)
+    flights.release('c', 't2')
+    assert flights.attach('c', lambda: 't3') == ('t3', False)
+
+    assert flights.release_handle('t1') == 2
+    assert flights.attach('a', lambda: 't4') == ('t4', False)
+
+
+def test_release_before_start_returns_is_not_lost():
+    flights = SingleFlight()
+
+    def start():
+        # the task finished (or was cancelled) before attach registered it
+        flights.release('k', 't1')
+        return 't1'
+
+    assert flights.attach('k', start) == ('t1', False)
+    assert flights.attach('k', lambda: 't2') == ('t2', False)
@@ -0,0 +1,84 @@
+import pytest
+
+from task_registry import TaskCancelled, TaskRegistry
+
+
+def _finished(registry, task_id, result='done'):
+    registry.init_task(task_id, 'start')
+    registry.complete_task(task_id, result)
+
+
+def test_completed_tasks_expire_after_ttl():
+    registry = TaskRegistry(ttl_seconds=60)
+    evicted = []
+    registry.on_evict(evicted.append)
+    _finished(registry, 'a')
+    registry.init_task('running', 'start')
+    for task in registry._tasks.values():
+        task.touched -= 120
+
+    assert registry.evict_expired() == ['a']
+    assert evicted == ['a']
+    assert registry.snapshot('a') is None
+    assert registry.status('running') == 'running'
+
+
+def test_reads_do_not_keep_a_task_alive():
+    registry = TaskRegistry(ttl_seconds=60)
+    _finished(registry, 'a')
+    registry._tasks['a'].touched -= 120
+
+    assert registry.snapshot('a')['status'] == 'completed'
+    assert registry.evict_expired() == ['a']
+
+
+def test_least_recently_changed_completed_tasks_go_first():
+    registry = TaskRegistry(max_tasks=2)
+    _finished(registry, 'a')
+    _finished(registry, 'b')
+    registry.init_task('c', 'start')
+
+    assert registry.snapshot('a') is None
+    assert registry.snapshot('b')['result'] == 'done'
+    assert registry.stats()['tasks'] == 2
+
+
+def test_byte_cap_evicts_completed_but_not_running_tasks():
+    registry = TaskRegistry(max_bytes=1000)
+    registry.init_task('running', 'start')
+    registry.update_task('running', 'x' * 2000)
+    _finished(registry, 'big', 'y' * 2000)
+
+    assert registry.snapshot('big') is None
+    assert registry.status('running') == 'running'
+
+
+def test_init_task_refuses_a_live_id():
+    registry = TaskRegistry()
+    registry.init_task('a', 'start')
+    with pytest.raises(ValueError):
+        registry.init_task('a', 'again')
+
+
+def test_cancel_stops_the_worker_and_discards_a_late_result():
+    registry = TaskRegistry()
+    registry.init_task('a', 'start')
+
+    assert registry.cancel('a', 'user stop') == 'running'
+    with pytest.raises(TaskCancelled):
+        registry.update_task('a', 'next step')
+    with pytest.raises(TaskCancelled):
+        registry.raise_if_cancelled('a')
+    registry.complete_task('a', 'late result')
+
+    snap = registry.snapshot('a')
+    assert snap['status'] == 'cancelled'
+    assert snap['result'] is None
+    assert snap['description'] == 'user stop'
+    assert snap['logs'][-1]['message'] == 'user stop'
+    assert registry.cancel('a') == 'cancelled'
+    assert registry.cancel('unknown') is None
+
+
+def test_task_cancelled_passes_broad_exception_handlers():
+    assert not issubclass(TaskCancelled, Exception)
@@ -0,0 +1,109 @@
+import multiprocessing
+import time
+
+import pytest
+
+from task_registry import TaskRegistry
+from task_store import SqliteTaskStore
+
+fork = multiprocessing.get_context('fork')
+
+
+def _record(task_id, logs, **fields):
+    record = {
+        'task_id': task_id, 'description': 'd', 'started_at': 's', 'updated_at': 'u', 'logs': logs,
+        'completed': False, 'cancelled': False, 'has_result': False, 'owner': 'someone',
+    }
+    record.update(fields)
+    return record
+
+
+def _append_from_child(db_path, task_id, entries):
+    store = SqliteTaskStore(db_path)
+    for entry in entries:
+        store.save(_record(task_id, [entry]))
+
+
+def _cancel_from_child(db_path, task_id, ready, go):
+    registry = TaskRegistry()
+    registry.attach_store(SqliteTaskStore(db_path))
+    registry.snapshot(task_id)  # loads the log as it is now
+    ready.set()
+    go.wait(5)
+    registry.cancel(task_id, 'stopped elsewhere')
+
+
+def _run(target, *args):
+    child = fork.Process(target=target, args=args)
+    child.start()
+    return child
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'tasks.sqlite3')
+
+
+def test_appends_from_two_processes_are_all_kept(db_path):
+    store = SqliteTaskStore(db_path)
+    store.save(_record('t', ['parent 0']))
+    child = _run(_append_from_child, db_path, 't', [f'child {i}' for i in range(20)])
+    for i in range(1, 21):
+        store.save(_record('t', [f'parent {i}']))
+    child.join(10)
+
+    logs = store.load('t')['logs']
+    assert sorted(logs) == sorted([f'parent {i}' for i in range(21)] + [f'child {i}' for i in range(20)])
+    # each writer's entries keep their order
+    assert [e for e in logs if e.startswith('child')] == [f'child {i}' for i in range(20)]
+    assert [e for e in logs if e.startswith('parent')] == [f'parent {i}' for i in range(21)]
+
+
+def test_cancel_from_a_process_with_an_older_log_is_not_lost(db_path):
+    owner = TaskRegistry()
+    owner.attach_store(SqliteTaskStore(db_path), poll_interval=0.02)
+    owner.init_task('t', 'start')
+    owner.update_task('t', 'step 1')
+    ready, go = fork.Event(), fork.Event()
+    child = _run(_cancel_from_child, db_path, 't', ready, go)
+    assert ready.wait(10)
+    # the owner moves on after the other process read the log
+    owner.update_task('t', 'step 2')
+    owner.update_task('t', 'step 3')
+    go.set()
+    child.join(10)
+
+    stored = SqliteTaskStore(db_path).load('t')
+    assert [e['message'] for e in stored['logs']] == ['step 1', 'step 2', 'step 3', 'stopped elsewhere']
+    assert stored['cancelled'] and stored['cancel_reason'] == 'stopped elsewhere'
+
+    deadline = time.monotonic() + 5
+    while owner.status('t') != 'cancelled' and time.monotonic() < deadline:
+        time.sleep(0.02)
+    snap = owner.snapshot('t')
+    assert snap['status'] == 'cancelled'
+    assert snap['description'] == 'stopped elsewhere'
+    assert [e['message'] for e in snap['logs']] == ['step 1', 'step 2', 'step 3', 'stopped elsewhere']
+
+
+def test_cancelled_and_completed_never_go_back(db_path):
+    store = SqliteTaskStore(db_path)
+    store.save(_record('t', [], cancelled=True, completed=True, cancel_reason='first'))
+    store.save(_record('t', [], cancel_reason='second'))
+
+    record = store.load('t')
+    assert record['cancelled'] and record['completed']
+    assert record['cancel_reason'] == 'first'
+
+
+def test_changes_skip_this_process_and_results_load_separately(db_path):
+    store = SqliteTaskStore(db_path)
+    cursor = store.cursor()
+    store.save(_record('mine', ['x'], has_result=True), result={'rows': 3})
+    child = _run(_append_from_child, db_path, 'theirs', ['y'])
+    child.join(10)
+
+    records, cursor = store.changes(cursor)
+    assert [r['task_id'] for r in records] == ['theirs']
+    assert store.load_result('mine') == {'rows': 3}
+    assert store.changes(cursor) == ([], cursor)
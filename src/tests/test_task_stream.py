@@ -0,0 +1,138 @@
+import json
+import time
+
+from task_stream import TaskStreamEngine, _TaskLog
+
+
+class FakeTask:
+    """Snapshot source the engine polls, like quest's persistence in app.py."""
+
+    def __init__(self):
+        self.snap = {'task_id': 't', 'started_at': 's', 'updated_at': 'u', 'description': 'start',
+                     'logs': [], 'result': None, 'status': 'running'}
+
+    def __call__(self, task_id):
+        return dict(self.snap, logs=list(self.snap['logs'])) if task_id == 't' else None
+
+    def log(self, message):
+        self.snap['logs'].append(message)
+        self.snap['description'] = message
+
+
+def _finalize(snap):
+    return ('result', {'type': 'result', 'data': snap['result']}) if snap['result'] else None
+
+
+def _engine(task, **options):
+    return TaskStreamEngine(task, _finalize, poll_interval=0, heartbeat=0.05, **options)
+
+
+def _parse(frames):
+    events = []
+    for frame in frames:
+        fields = dict(line.split(': ', 1) for line in frame.strip().split('\n') if ': ' in line)
+        if 'event' in fields:
+            events.append((int(fields['id']) if 'id' in fields else None, fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def _next_event(stream):
+    while True:
+        frame = next(stream)
+        if frame.startswith(('id:', 'event:')):
+            return _parse([frame])[0]
+
+
+def test_resume_after_last_event_id_gets_only_newer_events():
+    task = FakeTask()
+    engine = _engine(task)
+    stream = engine.stream('t')
+    first = _next_event(stream)
+    task.log('one')
+    second = _next_event(stream)
+    stream.close()
+    assert (first[0], second[0]) == (1, 2)
+
+    task.log('two')
+    # without deltas only the newest progress snapshot is sent
+    resumed = engine.stream('t', last_event_id='1')
+    event_id, _, data = _next_event(resumed)
+    resumed.close()
+    assert event_id == 3 and data['logs'] == ['one', 'two']
+
+    task.snap['result'] = 'rows'
+    assert _parse(engine.stream('t', last_event_id='3')) == [(4, 'result', {'type': 'result', 'data': 'rows'})]
+
+
+def test_unknown_task_ends_with_an_error_event():
+    engine = _engine(FakeTask())
+    assert _parse(engine.stream('missing')) == [(None, 'error', {'message': 'task not found'})]
+
+
+def test_delta_stream_rebuilds_every_snapshot():
+    task = FakeTask()
+    engine = _engine(task)
+    stream = engine.stream('t', deltas=True)
+    _, name, state = _next_event(stream)
+    assert name == 'progress'
+    for i in range(50):
+        task.log(f'line {i}')
+        event_id, name, data = _next_event(stream)
+        if name == 'delta':
+            for key, items in data.get('append', {}).items():
+                state[key] = state[key] + items
+            for key, suffix in data.get('extend', {}).items():
+                state[key] = state[key] + suffix
+            state.update(data.get('set', {}))
+        else:
+            state = data
+        assert state == task('t')
+    stream.close()
+
+
+def test_log_keeps_deltas_and_sparse_checkpoints():
+    log = _TaskLog(256)
+    snap = {'task_id': 't', 'logs': []}
+    for i in range(1000):
+        snap = dict(snap, logs=snap['logs'] + [f'line {i}'])
+        log.append_progress(snap)
+        log.append_progress(dict(snap))  # unchanged: nothing logged
+
+    assert log.last_id == 1000
+    checkpoints = [e for e in log.events if e[3] is None]
+    deltas = [e for e in log.events if e[3] is not None]
+    assert all(e[2] is None for e in deltas)
+    # a checkpoint at least every half buffer, so a resume always finds one
+    assert 2 <= len(checkpoints) <= 3
+    # the buffer holds about two full snapshots, not one per event
+    assert sum(len(e[2] or '') + len(e[3] or '') for e in log.events) < 4 * len(json.dumps(snap))
+
+
+def test_resume_past_the_buffer_starts_from_a_checkpoint():
+    log = _TaskLog(8)
+    snap = {'task_id': 't', 'logs': []}
+    for i in range(30):
+        snap = dict(snap, logs=snap['logs'] + [f'line {i}'])
+        log.append_progress(snap)
+
+    events = log.since(2, deltas=True)
+    checkpoint = json.loads(events[0][2])
+    assert events[0][3] is None
+    assert checkpoint['logs'] == snap['logs'][:len(checkpoint['logs'])]
+    plain = log.since(2)
+    assert len(plain) == 1 and json.loads(plain[0][2]) == snap
+
+
+def test_idle_logs_are_forgotten():
+    task = FakeTask()
+    engine = _engine(task, idle_ttl=0.05)
+    stream = engine.stream('t')
+    _next_event(stream)
+    stream.close()
+    time.sleep(0.2)
+    assert engine._logs == {}
+
+    # a client resuming with an id from the forgotten log gets the full state again
+    task.snap['result'] = 'rows'
+    events = _parse(engine.stream('t', last_event_id='7'))
+    assert [name for _, name, _ in events] == ['result']
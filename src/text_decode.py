@@ -0,0 +1,183 @@
+"""Shared charset detection and decode cache for stored text documents.
+
+Upload, /api/documents and archive extraction each used to run their own
+"open as UTF-8, on UnicodeDecodeError open again as GBK" cascade: a GBK file
+was read from disk twice on every listing, and a file neither codec accepts
+was re-read and re-failed on every request.
+
+Here a file is read once and its bytes are fed to one incremental decoder per
+candidate charset at the same time; decoders drop out as soon as they hit an
+invalid sequence and the first surviving charset in CANDIDATE_ENCODINGS wins,
+so UTF-8 keeps priority over GBK exactly as before. Results -- including
+"undecodable" -- are cached per path and validated against (mtime_ns, size),
+so unchanged files are never decoded again and edited files are picked up on
+the next lookup.
+
+Decoded text is normalised to ``\\n`` newlines, matching what text-mode
+``open()`` returned at the old call sites. Only standard library modules are
+used.
+"""
+from __future__ import annotations
+
+import codecs
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+CANDIDATE_ENCODINGS = ('utf-8', 'gbk')
+READ_CHUNK_SIZE = 64 * 1024
+
+# Cache bounds: entries in total, characters of cached text in total, and the
+# largest file whose text is kept (bigger files only get their charset cached).
+CACHE_MAX_ENTRIES = 4096
+CACHE_MAX_CHARS = 64 * 1024 * 1024
+CACHE_MAX_FILE_SIZE = 8 * 1024 * 1024
+
+
+def _normalise_newlines(text: str) -> str:
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def decode_bytes(raw: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """Decode in-memory bytes with the first candidate charset that accepts them.
+
+    Returns (text, encoding), or (None, None) when no candidate fits.
+    """
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            text = raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        return _normalise_newlines(text), encoding
+    return None, None
+
+
+def decode_file(path: str, keep_text: bool = True) -> Tuple[Optional[str], Optional[str]]:
+    """Detect a file's charset in one read, optionally returning its text.
+
+    Returns (text or None, encoding or None). With keep_text=False memory
+    stays at one read chunk regardless of the file size.
+    """
+    decoders = {enc: codecs.getincrementaldecoder(enc)() for enc in CANDIDATE_ENCODINGS}
+    parts: Dict[str, list] = {enc: [] for enc in CANDIDATE_ENCODINGS}
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            for encoding in list(decoders):
+                try:
+                    piece = decoders[encoding].decode(chunk)
+                except UnicodeDecodeError:
+                    del decoders[encoding]
+                    continue
+                if keep_text:
+                    parts[encoding].append(piece)
+            if not decoders:
+                return None, None
+    for encoding in CANDIDATE_ENCODINGS:
+        if encoding not in decoders:
+            continue
+        try:
+            tail = decoders[encoding].decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        if not keep_text:
+            return None, encoding
+        return _normalise_newlines(''.join(parts[encoding]) + tail), encoding
+    return None, None
+
+
+class TextDecodeCache:
+    """LRU cache of decoded text and detected charset, keyed by path.
+
+    An entry is only served while the file's (mtime_ns, size) still match.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_chars: int = CACHE_MAX_CHARS,
+                 max_file_size: int = CACHE_MAX_FILE_SIZE):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.max_file_size = max_file_size
+        self._lock = threading.Lock()
+        # path -> (mtime_ns, size, encoding or None, text or None)
+        self._entries: "OrderedDict[str, Tuple[int, int, Optional[str], Optional[str]]]" = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, path: str, st: os.stat_result, need_text: bool):
+        """Return the cached entry if still valid (and holding text when needed)."""
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[:2] != (st.st_mtime_ns, st.st_size):
+                self.misses += 1
+                return None
+            # undecodable files have no text to wait for
+            if need_text and entry[3] is None and entry[2] is not None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _put(self, path: str, st: os.stat_result, encoding: Optional[str], text: Optional[str]) -> None:
+        if text is not None and st.st_size > self.max_file_size:
+            text = None
+        key = os.path.abspath(path)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None and old[3] is not None:
+                self._chars -= len(old[3])
+            self._entries[key] = (st.st_mtime_ns, st.st_size, encoding, text)
+            if text is not None:
+                self._chars += len(text)
+            while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+                _, evicted = self._entries.popitem(last=False)
+                if evicted[3] is not None:
+                    self._chars -= len(evicted[3])
+
+    def read_text(self, path: str) -> Optional[str]:
+        """Decoded, newline-normalised text of path; None if no candidate charset fits."""
+        st = os.stat(path)
+        entry = self._get(path, st, need_text=True)
+        if entry is not None:
+            return entry[3]
+        text, encoding = decode_file(path)
+        self._put(path, st, encoding, text)
+        return text
+
+    def detect_encoding(self, path: str) -> Optional[str]:
+        """Charset of path, or None if no candidate fits. Does not keep the text."""
+        st = os.stat(path)
+        entry = self._get(path, st, need_text=False)
+        if entry is not None:
+            return entry[2]
+        _, encoding = decode_file(path, keep_text=False)
+        self._put(path, st, encoding, None)
+        return encoding
+
+    def prime(self, path: str, text: Optional[str], encoding: Optional[str]) -> None:
+        """Record text the caller already decoded from the bytes it just wrote to path."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self._put(path, st, encoding, text)
+
+    def discard(self, path: str) -> None:
+        with self._lock:
+            old = self._entries.pop(os.path.abspath(path), None)
+            if old is not None and old[3] is not None:
+                self._chars -= len(old[3])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'chars': self._chars, 'hits': self.hits, 'misses': self.misses}
+
+
+__all__ = [
+    'TextDecodeCache',
+    'decode_bytes',
+    'decode_file',
+    'CANDIDATE_ENCODINGS',
+]